@@ -1,5 +1,6 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime
 import logging
@@ -7,33 +8,61 @@ import numpy as np
 import traceback
 
 from analyze_author import analyze_author
-from analyze_post_trends import analyze_post_trends
+from dataset import load_dataset
 from util import clean_title, normalize
 
 plt.rcParams['font.sans-serif'] = ['SimHei']  # 设置中文字体
 plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
-def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告') -> None:
-    """分析近期文章并生成报表"""
-    logging.info("开始分析近期文章")
 
+@dataclass(frozen=True)
+class ScoringParams:
+    """综合评分中需要调校的参数，默认值为当前使用的取值"""
+    # 时间权重
+    max_time_weight: float = 1.35    # 从1.40降低到1.35
+    min_time_weight: float = 0.65    # 从0.60提高到0.65
+    decay_days: float = 45           # 从40增加到45
+    decay_rate: float = 0.035        # 从0.04降低到0.035
+    # 浏览量惩罚
+    full_views: float = 20000        # 从18000提高到20000
+    mid_views: float = 7000          # 从6000提高到7000
+    mid_penalty: float = 0.85
+    min_penalty: float = 0.75
+    # 综合评分权重
+    views_weight: float = 0.20       # 从0.22降低到0.20
+    daily_views_weight: float = 0.28  # 从0.30降低到0.28
+    quality_weight: float = 0.12     # 从0.32降低到0.30
+    density_weight: float = 0.06     # 保持0.12
+    words_weight: float = 0.04       # 保持0.04
+    conversion_weight: float = 0.3   # 新增互动转化率权重
+
+
+def analyze_post_quality(data="data.csv", output_dir='分析报告') -> None:
+    """分析近期文章并生成报表，data 可以是 CSV 路径或已加载的数据集"""
+    logging.info("开始分析近期文章")
 
-    
     # 将 output_dir 转换为 Path 对象
     output_dir = Path(output_dir)
     
     # 确保输出目录存在
     output_dir.mkdir(exist_ok=True)
     
-    # 读取CSV文件
-    df = pd.read_csv(csv_path)
-    
-    # 确保数值列为数值类型
-    df['浏览数'] = pd.to_numeric(df['浏览数'], errors='coerce')
-    df['点赞数'] = pd.to_numeric(df['点赞数'], errors='coerce')
-    df['收藏数'] = pd.to_numeric(df['收藏数'], errors='coerce')
-    df['字数'] = pd.to_numeric(df['字数'], errors='coerce')
+    df = data if isinstance(data, pd.DataFrame) else load_dataset(data)
+
+    scored = score_posts(df)
+    ranking = write_post_ranking(scored, output_dir)
     
+    # 调用作者分析函数
+    analyze_author(scored, output_dir)
+
+    logging.info(f"分析完成，结果已保存到 {output_dir} 目录")
+    evaluate_ranking_quality(ranking)
+
+
+def score_posts(df: pd.DataFrame, params: ScoringParams = ScoringParams(), now: datetime = None) -> pd.DataFrame:
+    """计算文章的各项指标与综合评分，返回过滤后的新数据集，now 为计算时长的当前时间，默认取本机时间"""
+    df = df.copy()
+
     # 将NaN值替换为0
     df[['浏览数', '点赞数', '收藏数']] = df[['浏览数', '点赞数', '收藏数']].fillna(0)
     
@@ -44,7 +73,7 @@ def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告')
     df = df[
         (df['作者'] != 'Admin_荆棘鸟') &  # 过滤管理员文章
         (df['字数'] > 0)  # 过滤字数为0的文章
-    ]
+    ].copy()
     
     # 数据预处理
     df['浏览数'] = df['浏览数'].astype(int)
@@ -118,9 +147,7 @@ def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告')
     df['评论数'] = pd.to_numeric(df['评论数'], errors='coerce').fillna(0)
     
     # 2. 增加时间因素的考虑
-    df['发表时间'] = pd.to_datetime(df['发表时间'])
-    df['更新时间'] = pd.to_datetime(df['更新时间'])
-    current_time = datetime.now()
+    current_time = now or datetime.now()
     
     # 计算发布和更新以来的天数
     df['发布时长'] = (current_time - df['发表时间']).dt.total_seconds() / (24 * 3600)
@@ -143,25 +170,20 @@ def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告')
     df['日均浏览_标准化'] = normalize(df['日均浏览'])
     
     # 进一步优化时间权重参数
-    MAX_TIME_WEIGHT = 1.35    # 从1.40降低到1.35
-    MIN_TIME_WEIGHT = 0.65    # 从0.60提高到0.65
-    DECAY_DAYS = 45          # 从40增加到45
-    DECAY_RATE = 0.035      # 从0.04降低到0.035
-    
     df['时间权重'] = df['发布时长'].apply(
-        lambda x: MAX_TIME_WEIGHT if x <= DECAY_DAYS else 
-        max(MIN_TIME_WEIGHT, MAX_TIME_WEIGHT * np.exp(-DECAY_RATE * (x - DECAY_DAYS)))
+        lambda x: params.max_time_weight if x <= params.decay_days else
+        max(params.min_time_weight, params.max_time_weight * np.exp(-params.decay_rate * (x - params.decay_days)))
     )
     
     # 修改浏览量惩罚机制，增加区分度
     def calculate_view_penalty(views):
-        if views >= 20000:          # 从18000提高到20000
+        if views >= params.full_views:
             return 1.0
-        elif views >= 7000:         # 从6000提高到7000
-            ratio = (views - 7000) / (13000)
-            return 0.85 + (0.15 * ratio)
+        elif views >= params.mid_views:
+            ratio = (views - params.mid_views) / (params.full_views - params.mid_views)
+            return params.mid_penalty + ((1 - params.mid_penalty) * ratio)
         else:
-            return max(0.75, 0.85 * (views / 7000))
+            return max(params.min_penalty, params.mid_penalty * (views / params.mid_views))
     
     # 修改评分计算部分
     df['浏览量惩罚'] = df['浏览数'].apply(calculate_view_penalty)
@@ -198,14 +220,19 @@ def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告')
     
     # 修改综合评分计算
     df['综合评分'] = (
-        df['浏览数_标准化'] * 0.20 +           # 从0.22降低到0.20
-        df['日均浏览_标准化'] * 0.28 +         # 从0.30降低到0.28
-        df['互动质量_标准化'] * 0.12 +         # 从0.32降低到0.30
-        df['互动密度_标准化'] * 0.06 +         # 保持0.12
-        df['字数权重'] * 0.04 +                # 保持0.04
-        df['互动转化率_标准化'] * 0.3         # 新增互动转化率权重
+        df['浏览数_标准化'] * params.views_weight +
+        df['日均浏览_标准化'] * params.daily_views_weight +
+        df['互动质量_标准化'] * params.quality_weight +
+        df['互动密度_标准化'] * params.density_weight +
+        df['字数权重'] * params.words_weight +
+        df['互动转化率_标准化'] * params.conversion_weight
     ) * df['时间权重'] * df['浏览量惩罚'] * df['长度奖励']
     
+    return df
+
+
+def write_post_ranking(df: pd.DataFrame, output_dir: Path) -> pd.DataFrame:
+    """生成文章推荐排名并保存，返回排名表"""
     # 生成推荐排名
     recommended_posts = df.sort_values('综合评分', ascending=False)
     
@@ -227,17 +254,17 @@ def analyze_post_quality(csv_path: str = "data.csv", output_dir='分析报告')
     recommended_posts_output.insert(0, '排名', range(1, len(recommended_posts_output) + 1))
     
     # 保存推荐排名
-    output_file = output_dir / '文章推荐排名.csv'
+    output_file = Path(output_dir) / '文章推荐排名.csv'
     recommended_posts_output.to_csv(output_file, index=False, encoding='utf-8-sig')
-    
-    # 调用作者分析函数
-    analyze_author(df, output_dir)
+    return recommended_posts_output.reset_index(drop=True)
 
-    logging.info(f"分析完成，结果已保存到 {output_dir} 目录")
-    evaluate_ranking_quality()
-def evaluate_ranking_quality():
-    """评估排名质量"""
-    df = pd.read_csv('./分析报告/文章推荐排名.csv')
+
+def evaluate_ranking_quality(ranking: pd.DataFrame = None):
+    """评估排名质量，未传入排名表时读取已保存的文章推荐排名"""
+    if ranking is None:
+        df = pd.read_csv('./分析报告/文章推荐排名.csv')
+    else:
+        df = ranking.copy()
     current_time = pd.Timestamp.now()
     df['发表时间'] = pd.to_datetime(df['发表时间'])
     
@@ -280,17 +307,33 @@ def evaluate_ranking_quality():
     print(f"前10名平均点赞率: {df.iloc[:10]['点赞率'].mean():.3f}")
     print(f"前10名平均互动转化率: {df.iloc[:10]['互动转化率'].mean():.3f}")
 
+def analyze_engagement_velocity(df: pd.DataFrame, output_dir, history_dir: str = 'history',
+                                window_days: int = 30) -> pd.DataFrame:
+    """根据互动数据历史计算近期各指标的日均增量并生成报表"""
+    from history import open_store, velocity_features
+
+    features = velocity_features(open_store(history_dir), window_days)
+
+    # 用链接中的 tid 关联标题、作者与板块
+    articles = df[['标题', '作者', '板块']].copy()
+    articles['tid'] = pd.to_numeric(df['链接'].str.extract(r'tid=(\d+)', expand=False), errors='coerce')
+    report = articles.dropna(subset=['tid']).astype({'tid': 'int64'}).merge(
+        features, left_on='tid', right_index=True, how='inner'
+    ).sort_values('浏览增速', ascending=False)
+
+    report.to_csv(Path(output_dir) / '互动增速.csv', index=False, encoding='utf-8-sig')
+    logging.info(f"互动增速分析完成，共 {len(report)} 篇文章")
+    return report
+
+
 if __name__ == "__main__":
-    # 设置日志配置
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
+    from logsetup import setup_logging
+    setup_logging()
     # 设置数据文件路径
     data_file = "data.csv"
     try:
-        analyze_post_trends(data_file)
-        analyze_post_quality(data_file)
+        from pipeline import run_analysis
+        run_analysis(data_file)
         logging.info("所有分析任务已完成")
     except Exception as e:
         logging.error(f"分析过程中出现错误: {str(e)}")
@@ -0,0 +1,291 @@
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from analysis import ScoringParams, score_posts
+from analyze_author import author_scores
+from analyze_post_trends import count_monthly
+from util import clean_title
+
+# 排名报表、作者分析与查询服务用到的评分结果列，polars 后端只计算这些列
+FEATURE_COLUMNS = ['日均浏览', '有效统计天数', '点赞收藏比', '收藏率', '点赞率', '互动转化率', '综合评分']
+AUTHOR_COLUMNS = ['平均文章评分', '评分标准差', '文章数量', '总字数', '总浏览数', '总点赞数', '总收藏数',
+                  '内容产出力', '互动影响力', '质量稳定性', '作者评分']
+
+
+class AnalysisBackend:
+    """
+    分析中的评分、作者汇总与趋势统计的计算方式
+
+    输入与输出都是 pandas 数据集，作图与报表不受后端影响
+    """
+    name = ''
+
+    def score_posts(self, df: pd.DataFrame, params: ScoringParams = ScoringParams(),
+                    now: Optional[datetime] = None) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def author_scores(self, scored: pd.DataFrame) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def count_monthly(self, df: pd.DataFrame) -> Tuple[pd.Series, pd.DataFrame]:
+        raise NotImplementedError
+
+
+class PandasBackend(AnalysisBackend):
+    """原有的 pandas 实现"""
+    name = 'pandas'
+
+    def score_posts(self, df: pd.DataFrame, params: ScoringParams = ScoringParams(),
+                    now: Optional[datetime] = None) -> pd.DataFrame:
+        return score_posts(df, params, now)
+
+    def author_scores(self, scored: pd.DataFrame) -> pd.DataFrame:
+        return author_scores(scored)
+
+    def count_monthly(self, df: pd.DataFrame) -> Tuple[pd.Series, pd.DataFrame]:
+        return count_monthly(df)
+
+
+class PolarsBackend(AnalysisBackend):
+    """
+    polars 惰性查询实现，计算过程与 pandas 实现一致
+
+    评分只生成 FEATURE_COLUMNS 中的结果列，未使用的中间列不会生成；
+    分组与逐列计算由 polars 多线程执行，线程数可通过环境变量 POLARS_MAX_THREADS 限制
+    """
+    name = 'polars'
+
+    def __init__(self):
+        # polars 为可选依赖，未安装时在创建后端时报错
+        import polars  # noqa: F401
+
+    def score_posts(self, df: pd.DataFrame, params: ScoringParams = ScoringParams(),
+                    now: Optional[datetime] = None) -> pd.DataFrame:
+        import polars as pl
+
+        now = now or datetime.now()
+        views, likes, favorites, words = pl.col('浏览数'), pl.col('点赞数'), pl.col('收藏数'), pl.col('字数')
+        frame = _to_polars(df).lazy().with_row_index('__row').with_columns(
+            pl.col(['浏览数', '点赞数', '收藏数']).fill_null(0)
+        ).filter(
+            pl.col('作者').ne_missing('Admin_荆棘鸟') & (words > 0)
+        ).with_columns(
+            pl.col(['浏览数', '点赞数', '收藏数']).cast(pl.Int64),
+            pl.col('标题').map_elements(clean_title, return_dtype=pl.String),
+            (pl.col('评论数').fill_null(0)).alias('__评论数'),
+            ((pl.lit(now) - pl.col('发表时间')).dt.total_microseconds() / 1_000_000 / 86400).alias('__发布时长'),
+        )
+
+        published_days = pl.col('__发布时长')
+        effective_days = published_days.clip(3, 720)
+        daily_views = (views / (effective_days + 7)).round(1)
+        time_weight = pl.when(published_days <= params.decay_days).then(pl.lit(params.max_time_weight)).otherwise(
+            pl.max_horizontal(pl.lit(params.min_time_weight),
+                              params.max_time_weight * (-params.decay_rate * (published_days - params.decay_days)).exp())
+        )
+        view_penalty = pl.when(views >= params.full_views).then(pl.lit(1.0)).when(views >= params.mid_views).then(
+            params.mid_penalty + (1 - params.mid_penalty) * ((views - params.mid_views) / (params.full_views - params.mid_views))
+        ).otherwise(
+            pl.max_horizontal(pl.lit(params.min_penalty), params.mid_penalty * (views / params.mid_views))
+        )
+        length_bonus = pl.when(words.is_between(15000, 50000)).then(
+            1 + 0.12 * (1 - (words - 32500).abs() / 17500)
+        ).otherwise(pl.lit(1.0))
+        # 原实现中评论数在计算互动质量之后才填充缺失值
+        quality = (favorites * 2 + likes + pl.col('评论数')) / (views + 10000)
+        density = (likes + favorites) / (words / 1000).clip(lower_bound=1)
+        conversion = (favorites + 5) / (likes + 50)
+        word_weight = (words / 5000).pow(0.5).clip(upper_bound=1.0)
+
+        scored = frame.with_columns(
+            有效统计天数=effective_days,
+            日均浏览=daily_views,
+            点赞收藏比=likes / favorites.clip(lower_bound=1),
+            收藏率=(favorites + 1) / (views + 1000),
+            点赞率=(likes + 2) / (views + 1000),
+            互动转化率=conversion,
+            综合评分=(
+                _normalize(views) * params.views_weight +
+                _normalize(daily_views) * params.daily_views_weight +
+                _normalize(quality) * params.quality_weight +
+                _normalize(density) * params.density_weight +
+                word_weight * params.words_weight +
+                _normalize(conversion) * params.conversion_weight
+            ) * time_weight * view_penalty * length_bonus,
+        ).with_columns(
+            pl.col('__评论数').alias('评论数')
+        ).select(['__row', *df.columns, *FEATURE_COLUMNS]).collect()
+
+        result = _to_pandas(scored.drop('__row'), df)
+        result.index = df.index[scored['__row'].to_numpy()]
+        return result
+
+    def author_scores(self, scored: pd.DataFrame) -> pd.DataFrame:
+        import polars as pl
+
+        columns = ['作者', '综合评分', '字数', '浏览数', '点赞数', '收藏数']
+        stats = _to_polars(scored[columns]).lazy().filter(pl.col('作者').is_not_null()).group_by('作者').agg(
+            平均文章评分=pl.col('综合评分').mean(),
+            评分标准差=pl.col('综合评分').std().fill_nan(None),
+            文章数量=pl.col('综合评分').count().cast(pl.Int64),
+            总字数=pl.col('字数').cast(pl.Int64).sum(),
+            总浏览数=pl.col('浏览数').cast(pl.Int64).sum(),
+            总点赞数=pl.col('点赞数').cast(pl.Int64).sum(),
+            总收藏数=pl.col('收藏数').cast(pl.Int64).sum(),
+        ).with_columns(
+            内容产出力=_normalize(pl.col('总字数')) * 0.7 + _normalize(pl.col('文章数量')) * 0.3,
+            互动影响力=(_normalize(pl.col('总浏览数')) * 0.4 + _normalize(pl.col('总点赞数')) * 0.3 +
+                   _normalize(pl.col('总收藏数')) * 0.3),
+            质量稳定性=1 - _normalize(pl.col('评分标准差')),
+        ).with_columns(
+            作者评分=(pl.col('平均文章评分') * 0.4 + pl.col('内容产出力') * 0.25 +
+                  pl.col('互动影响力') * 0.25 + pl.col('质量稳定性') * 0.1)
+        ).with_columns(
+            作者评分=pl.col('作者评分') / pl.col('作者评分').max() * 100
+        ).collect()
+
+        result = _to_pandas(stats, scored).set_index('作者')
+        # 与 pandas 分组的顺序一致：分类类型按类别顺序，其余按取值排序
+        authors = scored['作者']
+        order = authors.cat.categories if isinstance(authors.dtype, pd.CategoricalDtype) else sorted(result.index)
+        present = set(result.index)
+        index = [author for author in order if author in present]
+        result = result.reindex(index)[AUTHOR_COLUMNS]
+        if isinstance(authors.dtype, pd.CategoricalDtype):
+            result.index = pd.CategoricalIndex(index, categories=authors.cat.categories, name='作者')
+        return result
+
+    def count_monthly(self, df: pd.DataFrame) -> Tuple[pd.Series, pd.DataFrame]:
+        import polars as pl
+
+        frame = _to_polars(df[['发表时间', '板块']]).lazy().with_columns(
+            年月=pl.col('发表时间').dt.strftime('%Y-%m')
+        ).filter(pl.col('年月').is_not_null())
+        total, by_block = pl.collect_all([
+            frame.group_by('年月').agg(数量=pl.len()).sort('年月'),
+            frame.filter(pl.col('板块').is_not_null()).group_by(['年月', '板块']).agg(数量=pl.len()),
+        ])
+
+        total_monthly = pd.Series(total['数量'].to_numpy().astype('int64'),
+                                  index=pd.Index(total['年月'].to_list(), name='年月'))
+        monthly_counts = _to_pandas(by_block, df).astype({'数量': 'int64'}).set_index(['年月', '板块'])['数量'] \
+            .unstack(fill_value=0).sort_index()
+        blocks = df['板块']
+        if isinstance(blocks.dtype, pd.CategoricalDtype):
+            monthly_counts = monthly_counts[[block for block in blocks.cat.categories if block in monthly_counts.columns]]
+        return total_monthly, monthly_counts
+
+
+def _normalize(expr):
+    """与 util.normalize 相同的最小-最大标准化，所有值相同时为 0"""
+    import polars as pl
+
+    low, high = expr.min(), expr.max()
+    return pl.when(high == low).then(expr * 0).otherwise((expr - low) / (high - low))
+
+
+def _to_polars(df: pd.DataFrame):
+    """逐列转换为 polars，不依赖 pyarrow；浮点 NaN 与缺失的文本转换为 null"""
+    import polars as pl
+
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+            columns.append(pl.Series(name, series.to_numpy(), nan_to_null=True))
+        else:
+            values = series.astype(object)
+            columns.append(pl.Series(name, values.where(series.notna(), None).tolist(), dtype=pl.String))
+    return pl.DataFrame(columns)
+
+
+def _to_pandas(frame, like: pd.DataFrame) -> pd.DataFrame:
+    """逐列转换回 pandas，不依赖 pyarrow；like 中的分类列恢复为相同类别的分类类型"""
+    import polars as pl
+
+    result = pd.DataFrame({
+        name: frame[name].to_list() if frame[name].dtype == pl.String else frame[name].to_numpy()
+        for name in frame.columns
+    })
+    for name in result.columns:
+        if name in like and isinstance(like[name].dtype, pd.CategoricalDtype):
+            result[name] = pd.Categorical(result[name], categories=like[name].cat.categories)
+    return result
+
+
+BACKENDS = {backend.name: backend for backend in (PandasBackend, PolarsBackend)}
+
+
+def get_backend(name: Optional[str] = None) -> AnalysisBackend:
+    """按名称或配置 analysis.backend 返回计算后端，polars 未安装时回退到 pandas"""
+    if name is None:
+        from util import CONFIG
+        name = (CONFIG.get('analysis') or {}).get('backend', 'pandas')
+    if name not in BACKENDS:
+        raise ValueError(f"未知的分析后端: {name}，可选 {sorted(BACKENDS)}")
+    try:
+        return BACKENDS[name]()
+    except ImportError as e:
+        logging.warning(f"无法使用分析后端 {name}（{e}），改用 pandas")
+        return PandasBackend()
+
+
+def check_parity(df: pd.DataFrame, backend: AnalysisBackend, rtol: float = 1e-9) -> List[str]:
+    """
+    以同一个当前时间分别用 pandas 与指定后端计算评分、作者汇总与趋势统计，返回不一致之处，空列表表示一致
+
+    数值列按相对误差 rtol 比较，缺失值视为相等
+    """
+    reference = PandasBackend()
+    now = datetime.now()
+    problems = []
+
+    expected = reference.score_posts(df, now=now)
+    actual = backend.score_posts(df, now=now)
+    problems += _compare_frames('评分', expected[actual.columns], actual, rtol)
+    problems += _compare_frames('作者汇总', reference.author_scores(expected)[AUTHOR_COLUMNS],
+                                backend.author_scores(actual), rtol)
+    expected_total, expected_blocks = reference.count_monthly(df)
+    actual_total, actual_blocks = backend.count_monthly(df)
+    problems += _compare_frames('月度总数', expected_total.to_frame('数量'), actual_total.to_frame('数量'), rtol)
+    problems += _compare_frames('月度板块分布', expected_blocks, actual_blocks, rtol)
+    return problems
+
+
+def _compare_frames(label: str, expected: pd.DataFrame, actual: pd.DataFrame, rtol: float) -> List[str]:
+    if expected.shape != actual.shape:
+        return [f"{label}: 形状不同 {expected.shape} != {actual.shape}"]
+    if list(map(str, expected.index)) != list(map(str, actual.index)):
+        return [f"{label}: 行索引不同"]
+    if list(map(str, expected.columns)) != list(map(str, actual.columns)):
+        return [f"{label}: 列不同 {list(expected.columns)} != {list(actual.columns)}"]
+    problems = []
+    for position, column in enumerate(expected.columns):
+        left, right = expected.iloc[:, position], actual.iloc[:, position]
+        if pd.api.types.is_numeric_dtype(left.dtype) and pd.api.types.is_numeric_dtype(right.dtype):
+            same = np.isclose(left.to_numpy(dtype=float), right.to_numpy(dtype=float), rtol=rtol, atol=0, equal_nan=True)
+        else:
+            same = (left.astype(object).to_numpy() == right.astype(object).to_numpy()) | (left.isna() & right.isna()).to_numpy()
+        if not same.all():
+            problems.append(f"{label}: 列 {column} 有 {(~same).sum()} 行不一致")
+    return problems
+
+
+if __name__ == '__main__':
+    import sys
+
+    from dataset import load_dataset
+    from logsetup import setup_logging
+    from util import init_config
+
+    setup_logging(init_config())
+    dataset = load_dataset(sys.argv[1] if len(sys.argv) > 1 else 'data.csv')
+    mismatches = check_parity(dataset, get_backend('polars'))
+    for mismatch in mismatches:
+        print(mismatch)
+    print('与 pandas 后端一致' if not mismatches else f'共 {len(mismatches)} 处不一致')
+    sys.exit(1 if mismatches else 0)
@@ -3,13 +3,16 @@ import logging
 from docx import Document
 from matplotlib import pyplot as plt
 
-from util import normalize
+from util import normalize, plot_lock
 
+MIN_ARTICLES = 3  # 作者排名的最少文章数要求
 
-def analyze_author(df, output_dir):
-    """分析作者并生成报告"""
+
+def author_scores(df):
+    """按作者汇总已评分的文章，计算作者评分（百分制），未排序、未按文章数过滤"""
     # 1. 计算作者级别的统计数据
-    author_stats = df.groupby('作者').agg({
+    # 作者为分类类型，只统计实际出现的作者
+    author_stats = df.groupby('作者', observed=True).agg({
         '综合评分': ['mean', 'std', 'count'],
         '字数': 'sum',
         '浏览数': 'sum',
@@ -42,12 +45,17 @@ def analyze_author(df, output_dir):
 
     # 将作者评分标准化到百分制
     author_stats['作者评分'] = (author_stats['作者评分'] / author_stats['作者评分'].max()) * 100
+    return author_stats
+
+
+def analyze_author(df, output_dir, backend=None):
+    """分析作者并生成报告，backend 为 analysis_backend 中的计算后端，默认使用 pandas"""
+    author_stats = backend.author_scores(df) if backend is not None else author_scores(df)
 
     # 4. 生成作者推荐排名
     author_ranking = author_stats.sort_values('作者评分', ascending=False)
 
     # 只保留发文量达到要求的作者
-    MIN_ARTICLES = 3  # 最少文章数要求
     author_ranking = author_ranking[author_ranking['文章数量'] >= MIN_ARTICLES]
 
     # 添加排名列
@@ -63,23 +71,24 @@ def analyze_author(df, output_dir):
     author_ranking.to_csv(output_dir / '作者推荐排名.csv', encoding='utf-8-sig')
 
     # 生成作者质量分布图
-    plt.figure(figsize=(12, 6))
-    plt.scatter(author_ranking['文章数量'], author_ranking['平均文章评分'],
-               alpha=0.5, s=author_ranking['总浏览数']/1000)
-
-    # 标注TOP5作者
-    top_5_authors = author_ranking.head()
-    for idx, row in top_5_authors.iterrows():
-        plt.annotate(idx,
-                    (row['文章数量'], row['平均文章评分']),
-                    xytext=(5, 5), textcoords='offset points')
-
-    plt.title('作者文章数量与质量分布')
-    plt.xlabel('文章数量')
-    plt.ylabel('平均文章评分')
-    plt.tight_layout()
-    plt.savefig(output_dir / '作者质量分布.png')
-    plt.close()
+    with plot_lock:
+        plt.figure(figsize=(12, 6))
+        plt.scatter(author_ranking['文章数量'], author_ranking['平均文章评分'],
+                   alpha=0.5, s=author_ranking['总浏览数']/1000)
+
+        # 标注TOP5作者
+        top_5_authors = author_ranking.head()
+        for idx, row in top_5_authors.iterrows():
+            plt.annotate(idx,
+                        (row['文章数量'], row['平均文章评分']),
+                        xytext=(5, 5), textcoords='offset points')
+
+        plt.title('作者文章数量与质量分布')
+        plt.xlabel('文章数量')
+        plt.ylabel('平均文章评分')
+        plt.tight_layout()
+        plt.savefig(output_dir / '作者质量分布.png')
+        plt.close()
 
     # 5. 为每个作者找出代表作
     def get_representative_works(author_articles, top_n=3):
@@ -4,31 +4,47 @@ from pathlib import Path
 import seaborn as sns
 import logging
 
+from dataset import load_dataset
+from util import plot_lock
+
 plt.rcParams['font.sans-serif'] = ['SimHei']  # 设置中文字体
 plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
 
-def analyze_post_trends(csv_path: str = "data.csv") -> None:
-    """分析文章发表趋势并生成报表"""
-    logging.info("开始分析文章发表趋势")
+def count_monthly(df):
+    """按发表年月统计文章总数与各板块的文章数，返回 (总数, 年月 x 板块 的数量表)"""
+    # 年月列不写回数据集，避免影响共享同一数据集的其他分析
+    months = df['发表时间'].dt.strftime('%Y-%m').rename('年月')
 
-    # 读取CSV文件
-    df = pd.read_csv(csv_path)
+    # 按年月和板块统计文章数量
+    by_block = df.groupby([months, df['板块']], observed=True).size().unstack(fill_value=0)
+    return df.groupby(months).size(), by_block
 
-    # 将发表时间转换为datetime类型
-    df['发表时间'] = pd.to_datetime(df['发表时间'])
 
-    # 添加年月列
-    df['年月'] = df['发表时间'].dt.strftime('%Y-%m')
+def analyze_post_trends(data="data.csv", output_dir='分析报告', backend=None) -> None:
+    """
+    分析文章发表趋势并生成报表，data 可以是 CSV 路径或已加载的数据集，
+    backend 为 analysis_backend 中的计算后端，默认使用 pandas
+    """
+    logging.info("开始分析文章发表趋势")
 
-    # 按年月和板块统计文章数量
-    monthly_counts = df.groupby(['年月', '板块']).size().unstack(fill_value=0)
-    total_monthly = df.groupby('年月').size()
+    df = data if isinstance(data, pd.DataFrame) else load_dataset(data)
+    total_monthly, monthly_counts = backend.count_monthly(df) if backend is not None else count_monthly(df)
 
     # 创建输出目录
-    output_dir = Path("分析报告")
+    output_dir = Path(output_dir)
     output_dir.mkdir(exist_ok=True)
 
+    with plot_lock:
+        _plot_trends(total_monthly, monthly_counts, output_dir)
+
+    _write_report(df, total_monthly, output_dir)
+
+    logging.info("分析完成，报告已生成")
+
+
+def _plot_trends(total_monthly, monthly_counts, output_dir: Path) -> None:
+    """生成趋势图表"""
     # 生成总体趋势图
     plt.figure(figsize=(15, 8))
     total_monthly.plot(kind='line', marker='o')
@@ -64,7 +80,9 @@ def analyze_post_trends(csv_path: str = "data.csv") -> None:
     plt.savefig(output_dir / '发表数量热力图.png')
     plt.close()
 
-    # 生成统计报告
+
+def _write_report(df, total_monthly, output_dir: Path) -> None:
+    """生成统计报告"""
     with open(output_dir / '统计报告.txt', 'w', encoding='utf-8') as f:
         f.write('文章发表统计报告\n')
         f.write('=' * 50 + '\n\n')
@@ -83,5 +101,3 @@ def analyze_post_trends(csv_path: str = "data.csv") -> None:
         top_months = total_monthly.sort_values(ascending=False).head()
         for month, count in top_months.items():
             f.write(f'{month}: {count}篇\n')
-
-    logging.info("分析完成，报告已生成")
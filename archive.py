@@ -0,0 +1,124 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_archives: Dict[str, 'PageArchive'] = {}
+_archives_lock = threading.Lock()
+
+
+def open_archive(directory: str = 'archive', readonly: bool = False) -> 'PageArchive':
+    """返回目录对应的共享归档实例"""
+    key = f"{Path(directory).resolve()}:{readonly}"
+    with _archives_lock:
+        if key not in _archives:
+            _archives[key] = PageArchive(directory, readonly)
+        return _archives[key]
+
+
+class ArchiveMissError(KeyError):
+    """归档中没有该页面"""
+    pass
+
+
+class ArchivedResponse:
+    """从归档读取的页面，提供与 requests.Response 相同的 text 与 content 属性"""
+
+    def __init__(self, url: str, content: bytes, encoding: Optional[str], fetched_at: int):
+        self.url = url
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.fetched_at = fetched_at
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+
+class PageArchive:
+    """
+    抓取到的列表页与帖子页的压缩归档
+
+    页面内容以 sha256 寻址并用 zlib 压缩，相同内容只保存一份；
+    每次抓取记录 URL、抓取时间与内容哈希，可按 URL 取最新或指定时间之前的版本
+    """
+
+    def __init__(self, directory: str = 'archive', readonly: bool = False):
+        self.directory = Path(directory)
+        self.db_path = self.directory / 'pages.db'
+        self._lock = threading.Lock()
+        if readonly:
+            if not self.db_path.exists():
+                raise FileNotFoundError(f"页面归档不存在: {self.db_path}")
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS fetches (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    fetched_at INTEGER NOT NULL,
+                    sha TEXT NOT NULL,
+                    encoding TEXT
+                );
+                CREATE INDEX IF NOT EXISTS fetches_url ON fetches (url, fetched_at);
+            ''')
+            self._conn.commit()
+
+    def put(self, url: str, content: bytes, encoding: Optional[str] = None,
+            fetched_at: Optional[int] = None) -> str:
+        """保存一次抓取，返回内容哈希"""
+        sha = hashlib.sha256(content).hexdigest()
+        fetched_at = int(fetched_at if fetched_at is not None else time.time())
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM blobs WHERE sha = ?', (sha,)).fetchone() is None:
+                self._conn.execute('INSERT INTO blobs (sha, data) VALUES (?, ?)', (sha, zlib.compress(content, 6)))
+            self._conn.execute('INSERT INTO fetches (url, fetched_at, sha, encoding) VALUES (?, ?, ?, ?)',
+                               (url, fetched_at, sha, encoding))
+            self._conn.commit()
+        return sha
+
+    def get(self, url: str, before: Optional[int] = None) -> ArchivedResponse:
+        """取 URL 最新的一次抓取，指定 before 时取该时间之前的最新一次"""
+        query = ('SELECT f.fetched_at, f.encoding, b.data FROM fetches f JOIN blobs b ON b.sha = f.sha '
+                 'WHERE f.url = ?')
+        params = [url]
+        if before is not None:
+            query += ' AND f.fetched_at <= ?'
+            params.append(before)
+        query += ' ORDER BY f.fetched_at DESC, f.id DESC LIMIT 1'
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+        if row is None:
+            raise ArchiveMissError(url)
+        fetched_at, encoding, data = row
+        return ArchivedResponse(url, zlib.decompress(data), encoding, fetched_at)
+
+    def urls(self, pattern: str = '%', before: Optional[int] = None) -> List[str]:
+        """按 SQL LIKE 模式列出归档中的 URL"""
+        query = 'SELECT DISTINCT url FROM fetches WHERE url LIKE ?'
+        params = [pattern]
+        if before is not None:
+            query += ' AND fetched_at <= ?'
+            params.append(before)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query, params)]
+
+    def fetcher(self, before: Optional[int] = None):
+        """返回只读取归档、不访问网络的请求函数"""
+        return lambda url: self.get(url, before)
+
+    def stats(self) -> dict:
+        with self._lock:
+            fetches, urls = self._conn.execute('SELECT COUNT(*), COUNT(DISTINCT url) FROM fetches').fetchone()
+            blobs, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM blobs').fetchone()
+        return {'fetches': fetches, 'urls': urls, 'blobs': blobs, 'compressed_bytes': size}
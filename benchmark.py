@@ -0,0 +1,325 @@
+import atexit
+import base64
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 默认的基准结果文件
+BASELINE_PATH = 'benchmarks/baseline.json'
+# 中位数比基准慢超过该比例视为性能回退
+DEFAULT_THRESHOLD = 0.2
+
+
+@dataclass
+class Benchmark:
+    """setup 准备测试数据并返回被测的无参函数，准备过程不计入耗时"""
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+
+
+def build_list_page(threads: int = 50, page_num: int = 1, seed: int = 0) -> str:
+    """生成与论坛板块列表页结构相同的页面"""
+    rng = random.Random(seed)
+    items = []
+    for i in range(threads):
+        tid = 10000 + page_num * threads + i
+        uid = rng.randint(1, 5000)
+        day, hour = rng.randint(1, 28), rng.randint(0, 23)
+        title = ''.join(rng.choice('荆棘鸟的涅槃校园计划填坑长篇短篇同人') for _ in range(rng.randint(4, 16)))
+        items.append(
+            f'<tbody id="normalthread_{tid}"><tr><th>'
+            f'<a href="forum.php?mod=viewthread&amp;tid={tid}&amp;extra=page%3D{page_num}" class="s xst">{title}'
+            f'<span title="2024-10-{day} {hour:02d}:11">[最后更新: 2024-10-{day}]</span></a>'
+            f'<div class="acgifby1"><a href="home.php?mod=space&amp;uid={uid}">作者{uid}</a> '
+            f'<span><span title="2023-1-{day} 08:05">2023-1-{day}</span></span></div>'
+            f'<a cs="1" href="home.php?mod=space&amp;uid={uid}">作者{uid}</a>'
+            f'<div class="acgifnums"><a class="xi2">{rng.randint(0, 500)}</a>'
+            f'<span>{rng.choice([str(rng.randint(100, 9999)), f"{rng.randint(1, 30)}.{rng.randint(0, 9)}万"])}</span>'
+            f'</div></th></tr></tbody>'
+        )
+    return (f'<html><body><div class="pg"><span title="共 20 页"> / 20 页</span></div>'
+            f'<table>{"".join(items)}</table></body></html>')
+
+
+def build_sample_page(posts: int = 200, paragraphs_per_post: int = 40, seed: int = 0) -> str:
+    """生成与真实帖子结构相似的页面，包含隐藏内容、干扰码、换行与引用"""
+    rng = random.Random(seed)
+    chars = '的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会'
+    parts = ['<html><body>']
+    for post in range(posts):
+        parts.append(f'<td class="t_f" id="postmessage_{post}"><div>')
+        for _ in range(paragraphs_per_post):
+            text = ''.join(rng.choice(chars) for _ in range(rng.randint(40, 160)))
+            parts.append(f'<div align="left"><font face="微软雅黑"><font size="3">&nbsp; &nbsp;{text}'
+                         f'<span style="display:none">{rng.random()}</span>'
+                         f'<font class="jammer">x{rng.randint(0, 99)} y\x0b</font>'
+                         f'\r\n\t {text[:20]}</font></font></div><br />\r\n')
+        parts.append('<div class="quote"><blockquote>引用内容</blockquote></div>')
+        parts.append('<i class="pstatus">本帖最后由 作者 编辑</i><a href="#">链接</a></div></td>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def build_encoded_script(posts: int = 2, seed: int = 0) -> str:
+    """生成与帖子页中 Base64 加密正文相同形式的脚本"""
+    encoded = base64.b64encode(build_sample_page(posts=posts, seed=seed).encode('utf-8')).decode('ascii')
+    size = len(encoded) // 4 + 1
+    parts = [encoded[i:i + size] for i in range(0, len(encoded), size)]
+    names = [f'ws{i}' for i in range(len(parts))]
+    lines = [f'var {name} = "{part}";' for name, part in zip(names, parts)]
+    lines.append(f'document.write(Base64.decode({"+".join(names)}));')
+    return '\n'.join(lines)
+
+
+def build_titles(count: int = 1000, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    titles = []
+    for _ in range(count):
+        title = ''.join(rng.choice('荆棘鸟的涅槃校园计划ABCabc123 ._♥【】，：！@#') for _ in range(rng.randint(5, 30)))
+        titles.append(title + (f'[最后更新: 2024-{rng.randint(1, 12)}-{rng.randint(1, 28)}]' if rng.random() < 0.5 else ''))
+    return titles
+
+
+def build_dataset(rows: int = 5000, seed: int = 0):
+    """生成与 load_dataset 结果类型相同的数据集"""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    now = pd.Timestamp.now().floor('min')
+    created = now - pd.to_timedelta(rng.integers(0, 1500, rows), unit='D')
+    return pd.DataFrame({
+        '标题': [f'标题{i}' for i in range(rows)],
+        '作者': pd.Categorical([f'作者{i}' for i in rng.integers(0, rows // 10 + 1, rows)]),
+        '评论数': rng.integers(0, 500, rows).astype('int32'),
+        '浏览数': rng.integers(0, 200000, rows).astype('int32'),
+        '点赞数': rng.integers(0, 300, rows).astype('int32'),
+        '收藏数': rng.integers(0, 2000, rows).astype('int32'),
+        '字数': rng.integers(0, 300000, rows).astype('int32'),
+        '板块': pd.Categorical(rng.choice(['中长篇', '短篇新区', '重度区'], rows)),
+        '发表时间': created,
+        '更新时间': created + pd.to_timedelta(rng.integers(0, 300, rows), unit='D'),
+        '链接': [f'https://www.jingjiniao.info/forum.php?mod=viewthread&tid={i}&page=1&authorid=1' for i in range(rows)],
+    })
+
+
+def _legacy_extract(t_f) -> Tuple[list, int]:
+    """原先 thread_spider 与 process_tags 中的正文提取实现，仅用于与 text_extract.extract_text 对比"""
+    for tags in t_f:
+        for tag in tags.find_all(style='display:none') + tags.find_all(class_='jammer') \
+                   + tags.find_all(['br', 'a', 'i']) + tags.find_all('div', class_='quote'):
+            tag.decompose()
+    paragraphs = []
+    word_count = 0
+    for tags in t_f:
+        temp_text = ''
+        for tag in tags:
+            if tag.name == 'script':
+                continue
+            current_text = tag.text.strip()
+            current_text = re.sub(r'\s+', ' ', current_text)
+            temp_text += current_text
+            if temp_text.strip():
+                clean = ''.join(char for char in temp_text.strip() if ord(char) >= 32 or char in '\n\r\t')
+                paragraphs.append(clean)
+                word_count += len(clean)
+                temp_text = ''
+    return paragraphs, word_count
+
+
+def _setup_parse_page_data():
+    from bs4 import BeautifulSoup
+    from forum import ForumData, parse_page_data
+
+    soup = BeautifulSoup(build_list_page(), 'html.parser')
+    return lambda: parse_page_data(soup, ForumData(), 2)
+
+
+def _setup_link_fields():
+    from bs4 import BeautifulSoup
+    from forum import _parse_tid, _parse_update_time
+
+    links = BeautifulSoup(build_list_page(), 'html.parser').select('.s.xst')
+
+    def run():
+        for link in links:
+            _parse_update_time(link)
+            _parse_tid(link)
+    return run
+
+
+def _setup_decode():
+    from decode import decode_base64_in_js
+
+    script = build_encoded_script()
+    return lambda: decode_base64_in_js(script)
+
+
+def _setup_process_tags():
+    from bs4 import BeautifulSoup
+    from myThread import process_tags
+    from store import ThreadContent
+    from text_extract import strip_unwanted
+
+    t_f = BeautifulSoup(build_sample_page(posts=20), 'html.parser').select('.t_f div')
+    for tags in t_f:
+        strip_unwanted(tags)
+    return lambda: process_tags(t_f, ThreadContent(), False)
+
+
+def _setup_extract(extract):
+    """提取会移除页面中的节点，每次调用重新解析页面，耗时包含解析"""
+    def setup():
+        from bs4 import BeautifulSoup
+
+        html = build_sample_page(posts=5)
+        return lambda: extract(BeautifulSoup(html, 'html.parser').select('.t_f div'))
+    return setup
+
+
+def _extract_text(t_f):
+    from text_extract import extract_text
+    return extract_text(t_f)
+
+
+def _setup_clean_title():
+    from util import clean_title
+
+    titles = build_titles()
+
+    def run():
+        for title in titles:
+            clean_title(title)
+    return run
+
+
+def _setup_update_csv():
+    import csv
+    from util import CSV_HEADER, update_csv
+
+    directory = tempfile.mkdtemp(prefix='jjn_bench_')
+    atexit.register(shutil.rmtree, directory, True)
+    filename = os.path.join(directory, 'data.csv')
+    rows = build_dataset(5000).astype(str).values.tolist()
+    with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(rows)
+    # 更新 100 行，文件内容每次运行后保持不变
+    new_data = {str(i): rows[i] for i in range(0, 5000, 50)}
+    return lambda: update_csv(new_data, filename)
+
+
+def _setup_score_posts():
+    from analysis import score_posts
+
+    df = build_dataset(5000)
+    return lambda: score_posts(df)
+
+
+BENCHMARKS = [
+    Benchmark('parse_page_data', _setup_parse_page_data),
+    Benchmark('parse_update_time_tid', _setup_link_fields),
+    Benchmark('decode_base64_in_js', _setup_decode),
+    Benchmark('process_tags', _setup_process_tags),
+    Benchmark('extract_text', _setup_extract(_extract_text)),
+    Benchmark('extract_text_legacy', _setup_extract(_legacy_extract)),
+    Benchmark('clean_title', _setup_clean_title),
+    Benchmark('update_csv', _setup_update_csv),
+    Benchmark('score_posts', _setup_score_posts),
+]
+
+
+def _measure(func: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """先确定每轮调用次数使单轮耗时不少于 min_time，再重复测量 repeat 轮"""
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number * 1000)
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples),
+            'stdev_ms': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            'number': number, 'repeat': repeat}
+
+
+def run_benchmarks(names: Optional[List[str]] = None, repeat: int = 7, min_time: float = 0.1) -> dict:
+    """执行基准测试，返回包含运行环境与各项耗时的结果"""
+    unknown = set(names or []) - {benchmark.name for benchmark in BENCHMARKS}
+    if unknown:
+        raise ValueError(f"未知的基准测试: {sorted(unknown)}")
+    results = {}
+    for benchmark in BENCHMARKS:
+        if names and benchmark.name not in names:
+            continue
+        results[benchmark.name] = _measure(benchmark.setup(), repeat, min_time)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """按中位数与基准对比，比值超过 1 + threshold 的项标记为回退"""
+    rows = []
+    for name, current in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        ratio = current['median_ms'] / base['median_ms'] if base and base['median_ms'] else None
+        rows.append({'name': name, 'median_ms': current['median_ms'],
+                     'baseline_ms': base['median_ms'] if base else None, 'ratio': ratio,
+                     'regressed': ratio is not None and ratio > 1 + threshold})
+    return rows
+
+
+def save_results(results: dict, path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def print_report(results: dict, comparison: Optional[List[dict]] = None) -> None:
+    print(f"{'基准测试':<24}{'中位数(毫秒)':>14}{'最快(毫秒)':>14}{'基准(毫秒)':>14}{'比值':>8}")
+    rows = {row['name']: row for row in comparison or []}
+    for name, result in results['results'].items():
+        row = rows.get(name, {})
+        base = f"{row['baseline_ms']:.3f}" if row.get('baseline_ms') is not None else '-'
+        ratio = f"{row['ratio']:.2f}" if row.get('ratio') is not None else '-'
+        flag = '  回退' if row.get('regressed') else ''
+        print(f"{name:<24}{result['median_ms']:>14.3f}{result['min_ms']:>14.3f}{base:>14}{ratio:>8}{flag}")
+
+
+if __name__ == '__main__':
+    results = run_benchmarks(repeat=5)
+    print_report(results, compare(results, load_results(BASELINE_PATH)) if os.path.exists(BASELINE_PATH) else None)
@@ -0,0 +1,210 @@
+import concurrent.futures
+import itertools
+import logging
+import random
+import time
+from dataclasses import asdict, fields, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from analysis import ScoringParams, score_posts
+from dataset import load_dataset
+
+# 随机采样时各参数的取值范围
+DEFAULT_SPACE = {
+    'max_time_weight': (1.1, 1.6),
+    'min_time_weight': (0.5, 0.9),
+    'decay_days': (15, 90),
+    'decay_rate': (0.01, 0.08),
+    'full_views': (12000, 30000),
+    'mid_views': (3000, 10000),
+    'mid_penalty': (0.7, 0.95),
+    'min_penalty': (0.5, 0.85),
+    'views_weight': (0.0, 0.4),
+    'daily_views_weight': (0.0, 0.4),
+    'quality_weight': (0.0, 0.4),
+    'density_weight': (0.0, 0.2),
+    'words_weight': (0.0, 0.1),
+    'conversion_weight': (0.0, 0.4),
+}
+# 与参数无关的评分分量，顺序与 WEIGHT_FIELDS 中的权重一致
+COMPONENT_COLUMNS = ['浏览数_标准化', '日均浏览_标准化', '互动质量_标准化',
+                     '互动密度_标准化', '字数权重', '互动转化率_标准化']
+WEIGHT_FIELDS = ['views_weight', 'daily_views_weight', 'quality_weight',
+                 'density_weight', 'words_weight', 'conversion_weight']
+# 字数分布统计区间，与 evaluate_ranking_quality 一致
+WORD_RANGES = [(0, 15000), (15000, 30000), (30000, 50000), (50000, float('inf'))]
+
+# 工作进程内的特征，由 _init_worker 设置
+_worker_features = None
+
+
+def prepare_features(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    计算一次与参数无关的评分分量和评估指标所需的列，所有参数组共用
+    """
+    scored = score_posts(df)
+    # 与 evaluate_ranking_quality 相同：发表时间按日期计算文章年龄
+    age = (pd.Timestamp.now() - scored['发表时间'].dt.normalize()).dt.days
+    return {
+        'components': scored[COMPONENT_COLUMNS].to_numpy(dtype=np.float64).T.copy(),
+        'published_days': scored['发布时长'].to_numpy(dtype=np.float64),
+        'views': scored['浏览数'].to_numpy(dtype=np.float64),
+        'length_bonus': scored['长度奖励'].to_numpy(dtype=np.float64),
+        'age': age.to_numpy(dtype=np.float64),
+        'words': scored['字数'].to_numpy(dtype=np.float64),
+        'daily_views': scored['日均浏览'].to_numpy(dtype=np.float64),
+        'interaction': ((scored['点赞数'] + scored['收藏数']) / scored['浏览数'].clip(lower=1)).to_numpy(),
+        'favorite_rate': scored['收藏率'].to_numpy(dtype=np.float64),
+        'like_rate': scored['点赞率'].to_numpy(dtype=np.float64),
+        'conversion': scored['互动转化率'].to_numpy(dtype=np.float64),
+    }
+
+
+def score_batch(features: Dict[str, np.ndarray], params_list: List[ScoringParams]) -> np.ndarray:
+    """一次计算一批参数组的综合评分，返回 参数组数 × 文章数 的矩阵"""
+    column = lambda name: np.array([getattr(p, name) for p in params_list], dtype=np.float64)[:, None]
+    weights = np.array([[getattr(p, name) for name in WEIGHT_FIELDS] for p in params_list])
+    base = weights @ features['components']
+
+    days = features['published_days'][None, :]
+    max_weight, min_weight = column('max_time_weight'), column('min_time_weight')
+    decay_days, decay_rate = column('decay_days'), column('decay_rate')
+    time_weight = np.where(days <= decay_days, max_weight,
+                           np.maximum(min_weight, max_weight * np.exp(-decay_rate * (days - decay_days))))
+
+    views = features['views'][None, :]
+    full_views, mid_views = column('full_views'), column('mid_views')
+    mid_penalty, min_penalty = column('mid_penalty'), column('min_penalty')
+    view_penalty = np.where(
+        views >= full_views, 1.0,
+        np.where(views >= mid_views,
+                 mid_penalty + (1 - mid_penalty) * (views - mid_views) / (full_views - mid_views),
+                 np.maximum(min_penalty, mid_penalty * views / mid_views))
+    )
+    return base * time_weight * view_penalty * features['length_bonus'][None, :]
+
+
+def ranking_metrics(features: Dict[str, np.ndarray], scores: np.ndarray, top_n: int = 50) -> pd.DataFrame:
+    """按 evaluate_ranking_quality 的口径计算每个参数组排名的评估指标"""
+    top_n = min(top_n, scores.shape[1])
+    # 只需要前 top_n 名，先部分排序再对这部分排序
+    top = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    order = np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    take = lambda name: features[name][order]
+
+    age, words = take('age'), take('words')
+    metrics = {
+        '前10名30天内占比': (age[:, :10] <= 30).mean(axis=1),
+        '前50名90天内占比': (age <= 90).mean(axis=1),
+        '前10名分数比值': top_scores[:, 0] / top_scores[:, min(9, top_n - 1)],
+        '前50名分数比值': top_scores[:, 0] / top_scores[:, top_n - 1],
+        '前10名平均字数': words[:, :10].mean(axis=1),
+        '前10名平均日均浏览': take('daily_views')[:, :10].mean(axis=1),
+        '前10名字数中位数': np.median(words[:, :10], axis=1),
+        '前10名互动率': take('interaction')[:, :10].mean(axis=1),
+        '10-30名平均分/前10名平均分': top_scores[:, 9:29].mean(axis=1) / top_scores[:, :10].mean(axis=1),
+    }
+    for start, end in WORD_RANGES:
+        label = f"前50名{start}-{end if end != float('inf') else '以上'}字文章数"
+        metrics[label] = ((words > start) & (words <= end)).sum(axis=1)
+    metrics['前10名平均收藏率'] = take('favorite_rate')[:, :10].mean(axis=1)
+    metrics['前10名平均点赞率'] = take('like_rate')[:, :10].mean(axis=1)
+    metrics['前10名平均互动转化率'] = take('conversion')[:, :10].mean(axis=1)
+    return pd.DataFrame(metrics)
+
+
+def grid(space: Dict[str, list], base: ScoringParams = ScoringParams()) -> List[ScoringParams]:
+    """按给定取值的笛卡尔积生成参数组，未列出的参数使用默认值"""
+    names = list(space)
+    return [replace(base, **dict(zip(names, values))) for values in itertools.product(*space.values())]
+
+
+def random_sample(n: int, space: Optional[Dict[str, tuple]] = None, seed: int = 0,
+                  base: ScoringParams = ScoringParams()) -> List[ScoringParams]:
+    """在取值范围内均匀随机采样参数组"""
+    rng = random.Random(seed)
+    space = space or DEFAULT_SPACE
+    return [replace(base, **{name: rng.uniform(low, high) for name, (low, high) in space.items()})
+            for _ in range(n)]
+
+
+def _init_worker(features: Dict[str, np.ndarray]) -> None:
+    """工作进程初始化：特征只传输一次"""
+    global _worker_features
+    _worker_features = features
+
+
+def _evaluate_batch(params_list: List[ScoringParams]) -> pd.DataFrame:
+    return ranking_metrics(_worker_features, score_batch(_worker_features, params_list))
+
+
+def calibrate(df: pd.DataFrame, params_list: List[ScoringParams], batch_size: int = 64,
+              max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    对每组参数计算排名并评估，返回参数与指标组成的表，第一行为当前默认参数
+
+    参数组按批分发到多个进程，每个进程只接收一次预先计算的特征
+    """
+    start_time = time.time()
+    params_list = [ScoringParams()] + list(params_list)
+    features = prepare_features(df)
+    batches = [params_list[i:i + batch_size] for i in range(0, len(params_list), batch_size)]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                initargs=(features,)) as executor:
+        metrics = pd.concat(list(executor.map(_evaluate_batch, batches)), ignore_index=True)
+
+    table = pd.concat([pd.DataFrame([asdict(p) for p in params_list]), metrics], axis=1)
+    table.insert(0, '试验', range(len(table)))
+    logging.info(f"权重校准完成，共 {len(params_list)} 组参数，{len(features['views'])} 篇文章，"
+                 f"耗时: {time.time() - start_time:.2f}秒")
+    return table
+
+
+def run_calibration(csv_path: str = "data.csv", trials: int = 1000, space_file: Optional[str] = None,
+                    sort_by: Optional[str] = None, output_file: str = '分析报告/权重校准.csv',
+                    seed: int = 0, max_workers: Optional[int] = None) -> pd.DataFrame:
+    """
+    加载数据集执行权重校准并保存结果
+
+    Args:
+        space_file: YAML 文件，grid 下为参数的取值列表（网格搜索），
+                    random 下为参数的 [下限, 上限]（随机采样 trials 组），默认在 DEFAULT_SPACE 内随机采样
+        sort_by: 结果按该列降序排列
+    """
+    import yaml
+
+    spec = {}
+    if space_file:
+        with open(space_file, 'r', encoding='utf-8') as f:
+            spec = yaml.safe_load(f) or {}
+    known = {f.name for f in fields(ScoringParams)}
+    for section in ('grid', 'random'):
+        unknown = set(spec.get(section) or {}) - known
+        if unknown:
+            raise ValueError(f"未知的评分参数: {sorted(unknown)}")
+
+    if spec.get('grid'):
+        params_list = grid(spec['grid'])
+    else:
+        space = {name: tuple(bounds) for name, bounds in (spec.get('random') or DEFAULT_SPACE).items()}
+        params_list = random_sample(trials, space, seed)
+
+    table = calibrate(load_dataset(csv_path), params_list, max_workers=max_workers)
+    if sort_by:
+        table = table.sort_values(sort_by, ascending=False, kind='stable')
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(output_file, index=False, encoding='utf-8-sig')
+    logging.info(f"校准结果已保存到 {output_file}")
+    return table
+
+
+if __name__ == '__main__':
+    from logsetup import setup_logging
+    setup_logging()
+    print(run_calibration(trials=200).head(10).to_string())
@@ -0,0 +1,76 @@
+import logging
+from typing import Iterator, List, Optional
+
+import pandas as pd
+
+from util import TIME_FORMAT
+
+# 计数列，数值较小，使用 32 位整数保存
+NUMERIC_COLUMNS = ['评论数', '浏览数', '点赞数', '收藏数', '字数']
+# 需要转换为时间类型的列
+DATETIME_COLUMNS = ['发表时间', '更新时间']
+# 取值重复度高的文本列，使用分类类型保存
+CATEGORY_COLUMNS = ['作者', '板块']
+# 读取 CSV 时使用的类型，计数列和时间列读取后再转换
+READ_DTYPES = {column: 'category' for column in CATEGORY_COLUMNS}
+COUNT_DTYPE = 'int32'
+
+
+def load_dataset(csv_path: str = "data.csv", columns: Optional[List[str]] = None,
+                 chunksize: Optional[int] = None) -> pd.DataFrame:
+    """
+    读取爬取结果并统一数据类型，所有分析共用同一份数据
+
+    Args:
+        columns: 只读取这些列，默认全部
+        chunksize: 按块读取再合并，避免整个文件的原始文本同时驻留内存
+    """
+    logging.info(f"加载数据集 {csv_path}")
+    if chunksize is None:
+        return _convert(pd.read_csv(csv_path, usecols=columns, dtype=_read_dtypes(columns)))
+
+    chunks = list(iter_dataset(csv_path, chunksize, columns))
+    if not chunks:
+        return _convert(pd.read_csv(csv_path, usecols=columns, dtype=_read_dtypes(columns)))
+    # 各块的分类取值不同，合并前统一为全部取值的并集
+    for column in CATEGORY_COLUMNS:
+        if column in chunks[0]:
+            categories = pd.api.types.union_categoricals([chunk[column] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[column] = chunk[column].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def iter_dataset(csv_path: str = "data.csv", chunksize: int = 100000,
+                 columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """按块读取数据集，每块都已转换好类型，适合流式统计超出内存的数据"""
+    with pd.read_csv(csv_path, usecols=columns, dtype=_read_dtypes(columns), chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _convert(chunk)
+
+
+def _read_dtypes(columns: Optional[List[str]]) -> dict:
+    return {column: dtype for column, dtype in READ_DTYPES.items() if columns is None or column in columns}
+
+
+def _convert(df: pd.DataFrame) -> pd.DataFrame:
+    """计数列转换为紧凑整数，时间列按固定格式解析"""
+    for column in NUMERIC_COLUMNS:
+        if column not in df:
+            continue
+        values = pd.to_numeric(df[column], errors='coerce')
+        # 有缺失或非法值时保留浮点类型，与原先的 NaN 语义一致
+        df[column] = values if values.isna().any() else values.astype(COUNT_DTYPE)
+    for column in DATETIME_COLUMNS:
+        if column in df:
+            df[column] = _parse_datetime(df[column])
+    return df
+
+
+def _parse_datetime(series: pd.Series) -> pd.Series:
+    """按论坛时间格式解析，少量其他格式的值再逐个推断"""
+    parsed = pd.to_datetime(series, format=TIME_FORMAT, errors='coerce')
+    failed = parsed.isna() & series.notna()
+    if failed.any():
+        parsed[failed] = pd.to_datetime(series[failed], format='mixed', errors='coerce')
+    return parsed
@@ -0,0 +1,301 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 签名长度与 LSH 分段：16 段每段 8 个值，相似度约 0.7 以上的文章大概率落入同一桶
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# 按字切分的片段长度
+SHINGLE_SIZE = 5
+# 每次计算的片段数，限制临时矩阵的内存
+CHUNK_SIZE = 8192
+# 全文签名用于聚类，首页签名用于爬取时提前判断重复
+KINDS = ('full', 'head')
+
+_rng = np.random.RandomState(20240101)
+
+
+def _random_uint64(size: int) -> np.ndarray:
+    high = _rng.randint(0, 2 ** 32, size, dtype=np.uint64)
+    low = _rng.randint(0, 2 ** 32, size, dtype=np.uint64)
+    return (high << np.uint64(32)) | low
+
+
+# 乘移位哈希的参数：a 为 64 位奇数，乘积在 64 位上溢出回绕后取高 32 位
+_A = _random_uint64(NUM_PERM) | np.uint64(1)
+_B = _random_uint64(NUM_PERM)
+_SHINGLE_BASE = np.uint64(1000003)
+
+_indexes: Dict[Tuple[str, int], 'DuplicateIndex'] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(path: str = 'dedup/index.db') -> 'DuplicateIndex':
+    """返回路径对应的共享索引实例，每个进程各自打开连接"""
+    key = (str(Path(path).resolve()), os.getpid())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = DuplicateIndex(path)
+        return _indexes[key]
+
+
+def _shingles(text: str) -> np.ndarray:
+    """去除空白后按 SHINGLE_SIZE 个字取片段，返回去重后的 32 位片段哈希"""
+    codes = np.frombuffer(''.join(text.split()).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < SHINGLE_SIZE:
+        return np.unique(codes) if len(codes) else codes
+    count = len(codes) - SHINGLE_SIZE + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for i in range(SHINGLE_SIZE):
+        hashes = hashes * _SHINGLE_BASE + codes[i:i + count]
+    return np.unique(hashes & np.uint64(0xFFFFFFFF))
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """计算文本的 MinHash 签名，文本过短时返回 None"""
+    shingles = _shingles(text)
+    if len(shingles) == 0:
+        return None
+    signature = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint64)
+    for start in range(0, len(shingles), CHUNK_SIZE):
+        chunk = shingles[start:start + CHUNK_SIZE]
+        # (a * x + b) mod 2^64 的高 32 位作为排列后的值
+        permuted = (np.outer(_A, chunk) + _B[:, None]) >> np.uint64(32)
+        signature = np.minimum(signature, permuted.min(axis=1))
+    return signature.astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """由签名估计的 Jaccard 相似度"""
+    return float(np.mean(a == b))
+
+
+def _band_keys(signature: np.ndarray) -> List[int]:
+    data = signature.astype('<u4').tobytes()
+    step = ROWS * 4
+    return [int.from_bytes(hashlib.blake2b(data[i:i + step], digest_size=8).digest(), 'little', signed=True)
+            for i in range(0, len(data), step)]
+
+
+class DuplicateIndex:
+    """
+    近似重复文章索引
+
+    每篇文章保存全文与首页两份 MinHash 签名，签名分段后按段哈希分桶存入 SQLite，
+    查询只比较同桶的候选文章，不需要遍历全部文章
+    """
+
+    def __init__(self, path: str = 'dedup/index.db'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS threads (
+                tid INTEGER PRIMARY KEY,
+                title TEXT,
+                author TEXT,
+                block TEXT,
+                words INTEGER NOT NULL,
+                full_signature BLOB NOT NULL,
+                head_signature BLOB
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                kind TEXT NOT NULL,
+                band INTEGER NOT NULL,
+                key INTEGER NOT NULL,
+                tid INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_key ON bands (kind, band, key);
+            CREATE INDEX IF NOT EXISTS bands_tid ON bands (tid);
+        ''')
+        self._conn.commit()
+
+    def add(self, tid: int, text: str, head_text: Optional[str] = None, title: Optional[str] = None,
+            author: Optional[str] = None, block: Optional[str] = None) -> bool:
+        """写入或替换一篇文章的签名，文本过短无法计算签名时返回 False"""
+        full = minhash(text)
+        if full is None:
+            return False
+        head = minhash(head_text) if head_text else None
+        rows = [('full', band, key, tid) for band, key in enumerate(_band_keys(full))]
+        if head is not None:
+            rows += [('head', band, key, tid) for band, key in enumerate(_band_keys(head))]
+        with self._lock:
+            self._conn.execute('DELETE FROM bands WHERE tid = ?', (tid,))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO threads (tid, title, author, block, words, full_signature, head_signature) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (tid, title, author, block, sum(len(line) for line in text.split('\n')), full.tobytes(),
+                 head.tobytes() if head is not None else None)
+            )
+            self._conn.executemany('INSERT INTO bands (kind, band, key, tid) VALUES (?, ?, ?, ?)', rows)
+            self._conn.commit()
+        return True
+
+    def add_copy(self, tid: int, original_tid: int, title: Optional[str] = None, author: Optional[str] = None,
+                 block: Optional[str] = None) -> None:
+        """跳过下载的重复文章沿用原文的签名，使其出现在重复文章簇中"""
+        with self._lock:
+            self._conn.execute('DELETE FROM bands WHERE tid = ?', (tid,))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO threads (tid, title, author, block, words, full_signature, head_signature) '
+                'SELECT ?, ?, ?, ?, words, full_signature, head_signature FROM threads WHERE tid = ?',
+                (tid, title, author, block, original_tid)
+            )
+            self._conn.execute('INSERT INTO bands (kind, band, key, tid) '
+                               'SELECT kind, band, key, ? FROM bands WHERE tid = ?', (tid, original_tid))
+            self._conn.commit()
+
+    def query(self, text: str, kind: str = 'full', threshold: float = 0.8,
+              exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """查找与文本相似度不低于阈值的文章，按相似度从高到低返回 (tid, 相似度)"""
+        signature = minhash(text)
+        if signature is None:
+            return []
+        column = 'full_signature' if kind == 'full' else 'head_signature'
+        with self._lock:
+            candidates = set()
+            for band, key in enumerate(_band_keys(signature)):
+                candidates.update(row[0] for row in self._conn.execute(
+                    'SELECT tid FROM bands WHERE kind = ? AND band = ? AND key = ?', (kind, band, key)))
+            candidates.discard(exclude)
+            matches = []
+            for tid in candidates:
+                row = self._conn.execute(f'SELECT {column} FROM threads WHERE tid = ?', (tid,)).fetchone()
+                if row and row[0]:
+                    score = similarity(signature, np.frombuffer(row[0], dtype=np.uint32))
+                    if score >= threshold:
+                        matches.append((tid, score))
+        return sorted(matches, key=lambda match: -match[1])
+
+    def get(self, tid: int) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute('SELECT tid, title, author, block, words FROM threads WHERE tid = ?',
+                                     (tid,)).fetchone()
+        return dict(zip(('tid', 'title', 'author', 'block', 'words'), row)) if row else None
+
+    def clusters(self, threshold: float = 0.8) -> List[List[dict]]:
+        """
+        将全文相似度不低于阈值的文章合并为簇，只比较同桶的文章对，
+        每个簇按 tid 排序，最早发布的排在最前
+        """
+        with self._lock:
+            buckets = self._conn.execute(
+                "SELECT group_concat(tid) FROM bands WHERE kind = 'full' GROUP BY band, key HAVING COUNT(*) > 1"
+            ).fetchall()
+            signatures = {}
+            for tid, blob in self._conn.execute('SELECT tid, full_signature FROM threads'):
+                signatures[tid] = np.frombuffer(blob, dtype=np.uint32)
+
+        parent = {}
+
+        def find(tid):
+            parent.setdefault(tid, tid)
+            while parent[tid] != tid:
+                parent[tid] = parent[parent[tid]]
+                tid = parent[tid]
+            return tid
+
+        checked = set()
+        for (tids,) in buckets:
+            tids = sorted(int(tid) for tid in tids.split(','))
+            for i, a in enumerate(tids):
+                for b in tids[i + 1:]:
+                    if (a, b) in checked:
+                        continue
+                    checked.add((a, b))
+                    if similarity(signatures[a], signatures[b]) >= threshold:
+                        parent[find(b)] = find(a)
+
+        groups: Dict[int, List[int]] = {}
+        for tid in parent:
+            groups.setdefault(find(tid), []).append(tid)
+        result = []
+        for tids in groups.values():
+            if len(tids) > 1:
+                tids.sort()
+                head = signatures[tids[0]]
+                members = []
+                for tid in tids:
+                    info = self.get(tid)
+                    info['similarity'] = similarity(head, signatures[tid])
+                    members.append(info)
+                result.append(members)
+        return sorted(result, key=lambda members: members[0]['tid'])
+
+
+def _config() -> dict:
+    from util import CONFIG
+    return CONFIG.get('dedup') or {}
+
+
+def record_thread(tid, text: str, head_text: Optional[str] = None, title: Optional[str] = None,
+                  author: Optional[str] = None, block: Optional[str] = None) -> None:
+    """按配置记录爬取到的文章签名，失败只记录日志"""
+    dedup_config = _config()
+    if not dedup_config.get('enabled') or tid is None:
+        return
+    try:
+        open_index(dedup_config.get('path', 'dedup/index.db')).add(int(tid), text, head_text, title, author, block)
+    except Exception as e:
+        logging.error(f"记录文章 {tid} 的重复检测签名失败: {e}")
+
+
+def find_duplicate(tid, head_text: str, title: Optional[str] = None, author: Optional[str] = None,
+                   block: Optional[str] = None) -> Optional[dict]:
+    """
+    按配置用首页内容查找已完整爬取过的重复文章，用于跳过后续页面的下载；未开启或没有重复时返回 None
+
+    找到重复文章时该 tid 沿用原文的签名记录下来
+    """
+    dedup_config = _config()
+    if not dedup_config.get('enabled') or not dedup_config.get('skip_duplicates') or tid is None:
+        return None
+    try:
+        index = open_index(dedup_config.get('path', 'dedup/index.db'))
+        matches = index.query(head_text, 'head', dedup_config.get('skip_threshold', 0.9), exclude=int(tid))
+        if not matches:
+            return None
+        duplicate = index.get(matches[0][0])
+        index.add_copy(int(tid), duplicate['tid'], title, author, block)
+        return duplicate
+    except Exception as e:
+        logging.error(f"查找文章 {tid} 的重复文章失败: {e}")
+        return None
+
+
+def write_report(index: DuplicateIndex, output_file: str = '分析报告/重复文章.csv',
+                 threshold: float = 0.8) -> int:
+    """输出重复文章簇，返回簇的数量"""
+    import csv
+
+    clusters = index.clusters(threshold)
+    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['簇', 'tid', '标题', '作者', '板块', '字数', '与首篇相似度'])
+        for number, members in enumerate(clusters, 1):
+            for member in members:
+                writer.writerow([number, member['tid'], member['title'], member['author'], member['block'],
+                                 member['words'], f"{member['similarity']:.2f}"])
+    logging.info(f"共发现 {len(clusters)} 组重复文章，已保存到 {output_file}")
+    return len(clusters)
+
+
+if __name__ == '__main__':
+    from benchmark import build_sample_page
+    index = DuplicateIndex('/tmp/dedup_demo.db')
+    original = build_sample_page(posts=5, seed=1)
+    index.add(1, original, original[:2000], '原文')
+    index.add(2, original.replace('的', '地', 20), None, '转载')
+    index.add(3, build_sample_page(posts=5, seed=2), None, '其他')
+    print(index.clusters())
@@ -0,0 +1,170 @@
+import logging
+import re
+import threading
+from typing import Iterable, Optional
+
+# 论坛提示页（#messagetext）与整页错误中表示本次运行无法继续的文字，可在配置 fatal 中覆盖
+AUTH_PATTERNS = ['先登录', '未登录', '需要登录', '登录后才能', '请登录']
+BAN_PATTERNS = ['IP 已经被禁止', 'IP已经被禁止', 'IP 地址不在被允许', '帐号被禁止', '账号被禁止', '用户被禁止',
+                '禁止访问']
+MAINTENANCE_PATTERNS = ['站点已关闭', '站点关闭', '论坛维护', '系统维护', '正在维护', '升级维护']
+# 不含提示框的整页只在较短时检查，避免把正文中的文字误判为错误
+SHORT_PAGE_BYTES = 8192
+
+MESSAGETEXT_PATTERN = re.compile(r'id="messagetext"[^>]*>(.*?)</div>', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+class FatalError(Exception):
+    """本次运行无法继续的错误，所有线程池停止提交任务，已完成的结果写入后以 exit_code 退出"""
+    exit_code = 3
+    description = '致命错误'
+
+
+class AuthError(FatalError):
+    """cookie 有误或已过期，论坛要求登录"""
+    exit_code = 3
+    description = '登录失效'
+
+
+class BannedError(FatalError):
+    """IP 或帐号被论坛禁止访问"""
+    exit_code = 4
+    description = '被禁止访问'
+
+
+class MaintenanceError(FatalError):
+    """论坛关闭或维护中"""
+    exit_code = 5
+    description = '论坛维护中'
+
+
+class CancelToken:
+    """
+    整个运行共享的取消标记
+
+    第一次遇到致命错误时记录该错误，之后所有请求与重试在发出前检查标记并抛出同类错误，
+    线程池中尚未开始的任务因此立即结束，不再逐个请求、重试和记录日志
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.error: Optional[FatalError] = None
+
+    def cancel(self, error: FatalError) -> bool:
+        """记录致命错误并取消，已经取消时保留第一个错误，返回本次是否触发了取消"""
+        with self._lock:
+            if self.error is not None:
+                return False
+            self.error = error
+            self._event.set()
+        logging.critical(f"{error.description}，停止本次运行: {error}")
+        return True
+
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """已取消时抛出与第一个错误同类的异常，每个线程各自创建异常对象"""
+        if self._event.is_set():
+            raise type(self.error)(str(self.error))
+
+    def reset(self) -> None:
+        with self._lock:
+            self.error = None
+            self._event.clear()
+
+
+# 当前运行的取消标记，由 util.make_request 与各线程池检查
+cancel_token = CancelToken()
+
+
+def _patterns(config: Optional[dict], key: str, defaults: Iterable[str]) -> list:
+    return list((config or {}).get(key) or defaults)
+
+
+def classify_text(text: str, config: Optional[dict] = None) -> Optional[FatalError]:
+    """按提示文字判断错误类别，不属于致命错误时返回 None"""
+    for patterns, error_class in ((_patterns(config, 'ban_patterns', BAN_PATTERNS), BannedError),
+                                  (_patterns(config, 'maintenance_patterns', MAINTENANCE_PATTERNS), MaintenanceError),
+                                  (_patterns(config, 'auth_patterns', AUTH_PATTERNS), AuthError)):
+        for pattern in patterns:
+            if pattern in text:
+                return error_class(' '.join(text.split())[:200])
+    return None
+
+
+def classify_response(status_code: int, content: bytes, encoding: Optional[str] = None,
+                      config: Optional[dict] = None) -> Optional[FatalError]:
+    """
+    判断一次响应是否表示本次运行无法继续
+
+    只检查论坛提示框 #messagetext 中的文字，以及不含帖子内容的短页面；
+    单个主题被删除、阅读权限不足等提示不是致命错误，由调用方按普通失败处理。
+    普通页面只在字节中查找提示框，不做解码
+    """
+    if status_code not in (403, 503) and b'messagetext' not in content and len(content) > SHORT_PAGE_BYTES:
+        return None
+    text = content.decode(encoding or 'utf-8', errors='replace')
+    if status_code == 403:
+        return BannedError(f"HTTP 403 {classify_text(TAG_PATTERN.sub(' ', text), config) or ''}".strip())
+    if status_code == 503:
+        return MaintenanceError(f"HTTP 503 {classify_text(TAG_PATTERN.sub(' ', text), config) or ''}".strip())
+    match = MESSAGETEXT_PATTERN.search(text)
+    if match:
+        return classify_text(TAG_PATTERN.sub(' ', match.group(1)), config)
+    if len(content) <= SHORT_PAGE_BYTES:
+        return classify_text(TAG_PATTERN.sub(' ', text), config)
+    return None
+
+
+def check_login(text: str) -> Optional[AuthError]:
+    """
+    根据页面判断当前 cookie 是否已登录
+
+    Discuz 页面的脚本中 discuz_uid 为当前用户的 uid，游客为 0；页面中没有该变量时只要求能看到主题链接
+    """
+    match = re.search(r"discuz_uid\s*=\s*'(\d+)'", text)
+    if match and match.group(1) == '0':
+        return AuthError("论坛将当前 cookie 识别为游客，cookie 可能有误或已过期")
+    if 's xst' not in text:
+        return AuthError("列表页中找不到主题链接，cookie 可能有误或已过期")
+    return None
+
+
+def preflight(block_url: str) -> None:
+    """
+    正式爬取前请求一次板块第一页，确认 cookie 有效、未被禁止、论坛未在维护，否则抛出对应的 FatalError
+
+    make_request 发现致命错误时已取消本次运行，这里只需补充登录状态的检查；配置 fatal.preflight 为 false 时跳过
+    """
+    from util import CONFIG, make_request
+
+    if not (CONFIG.get('fatal') or {}).get('preflight', True):
+        return
+    try:
+        response = make_request(block_url)
+    except FatalError:
+        raise
+    except Exception as e:
+        # 网络错误不能说明登录状态，交给各板块按普通失败处理
+        logging.warning(f"登录状态检查请求失败，跳过检查: {e}")
+        return
+    error = check_login(response.text)
+    if error is not None:
+        cancel_token.cancel(error)
+        raise error
+    logging.info("登录状态检查通过")
+
+
+if __name__ == '__main__':
+    samples = {
+        '提示页': '<div id="messagetext" class="alert_info"><p>抱歉，您尚未登录，没有权限访问该版块</p></div>',
+        '被禁止': '<html><body>抱歉，您的 IP 地址不在被允许访问的范围内</body></html>',
+        '维护': '<div id="messagetext"><p>站点已关闭，请稍后访问</p></div>',
+        '主题不存在': '<div id="messagetext"><p>抱歉，指定的主题不存在或已被删除或正在被审核</p></div>',
+    }
+    for name, page in samples.items():
+        error = classify_response(200, page.encode('utf-8'))
+        print(name, type(error).__name__ if error else '非致命', error or '')
@@ -0,0 +1,169 @@
+import logging
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator, List, Optional
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from decode import decode_base64_in_js
+from fatal import FatalError
+from text_extract import iter_paragraphs, strip_unwanted
+
+# 打印视图中每个楼层以分隔线开始，楼层头部的作者、时间、标题以两个换行结束
+PRINTABLE_POST_SEPARATOR = re.compile(r'<hr[^>]*>', re.IGNORECASE)
+PRINTABLE_POST_HEADER = re.compile(r'^.*?<br\s*/?>\s*<br\s*/?>', re.DOTALL | re.IGNORECASE)
+
+
+def fetch_thread_page(fetch: Callable, url: str) -> BeautifulSoup:
+    """
+    获取帖子页，请求失败或返回论坛提示页时抛出异常
+    """
+    response = fetch(url)
+    if response is None:
+        raise Exception('请求超时')
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    if len(soup.select("#messagetext")) > 0:
+        error_message = soup.select("#messagetext")[0].text + soup.select("#messagetext")[0].next_sibling.text
+        raise Exception(error_message)
+    return soup
+
+
+def parse_thread_page(soup: BeautifulSoup) -> list:
+    """
+    解码加密正文并移除干扰节点，返回帖子页正文的 (节点, 文本) 列表
+    """
+    t_f = soup.select(".t_f div")
+    if len(soup.select(".t_f script")) == 2:
+        base64_js_str = soup.select(".t_f script")[1].text
+        wmsj_enmessage_str = decode_base64_in_js(base64_js_str)
+        wmsj_enmessageTag = BeautifulSoup(wmsj_enmessage_str, 'html.parser')
+        t_f.insert(0, wmsj_enmessageTag)
+    for tags in t_f:
+        strip_unwanted(tags)
+    return list(iter_paragraphs(t_f))
+
+
+@dataclass
+class ThreadPage:
+    """
+    获取到的一段正文
+
+    soup 为普通帖子页，打印视图等没有对应帖子页时为 None；
+    page_num 为帖子页的页码，打印视图为 None；has_more 表示之后还有内容
+    """
+    soup: Optional[BeautifulSoup]
+    items: list
+    page_num: Optional[int]
+    has_more: bool
+
+
+class ThreadFetcher:
+    """获取一篇文章全部正文的策略，按顺序返回各段正文，调用方可随时停止"""
+    name = ''
+
+    def iter_pages(self, thread_url: str, fetch: Callable) -> Iterator[ThreadPage]:
+        raise NotImplementedError
+
+
+class PaginatedFetcher(ThreadFetcher):
+    """逐页获取帖子页，沿下一页链接前进"""
+    name = 'paginated'
+
+    def iter_pages(self, thread_url: str, fetch: Callable, page_num: int = 1) -> Iterator[ThreadPage]:
+        while True:
+            soup = fetch_thread_page(fetch, thread_url)
+            next_link = soup.select('.nxt')
+            yield ThreadPage(soup, parse_thread_page(soup), page_num, bool(next_link))
+            if not next_link:
+                return
+            thread_url = urljoin(thread_url, next_link[0].attrs['href'])
+            page_num += 1
+
+
+class PrintableFetcher(ThreadFetcher):
+    """
+    先获取第一页，再通过打印视图一次获取全部楼层
+
+    第一页提供标题、点赞收藏数与封面，并用于校验打印视图：打印视图的开头必须与第一页的正文完全一致，
+    否则（内容缺失、被混淆或结构不同）从第二页开始回退到逐页获取
+    """
+    name = 'printable'
+
+    def __init__(self):
+        self.fallback = PaginatedFetcher()
+
+    def iter_pages(self, thread_url: str, fetch: Callable) -> Iterator[ThreadPage]:
+        soup = fetch_thread_page(fetch, thread_url)
+        next_link = soup.select('.nxt')
+        first = ThreadPage(soup, parse_thread_page(soup), 1, bool(next_link))
+        yield first
+        if not next_link:
+            return
+
+        remainder = None
+        try:
+            remainder = self._printable_remainder(thread_url, fetch, [text for _, text in first.items])
+        except FatalError:
+            raise
+        except Exception as e:
+            logging.warning(f"获取 {thread_url} 的打印视图失败: {e}")
+        if remainder is not None:
+            yield ThreadPage(None, remainder, None, False)
+        else:
+            logging.info(f"{thread_url} 的打印视图不可用，回退到逐页获取")
+            yield from self.fallback.iter_pages(urljoin(thread_url, next_link[0].attrs['href']), fetch, 2)
+
+    def _printable_remainder(self, thread_url: str, fetch: Callable, first_texts: List[str]) -> Optional[list]:
+        """返回打印视图中第一页之后的正文，与第一页对不上时返回 None"""
+        response = fetch(printable_url(thread_url))
+        if response is None:
+            return None
+        items = parse_printable(response.text)
+        if items is None:
+            return None
+        texts = [text for _, text in items]
+        if len(texts) <= len(first_texts) or texts[:len(first_texts)] != first_texts:
+            return None
+        return items[len(first_texts):]
+
+
+def printable_url(thread_url: str) -> str:
+    """由帖子链接构造打印视图的链接，保留只看作者的参数"""
+    query = parse_qs(urlparse(thread_url).query)
+    params = {'mod': 'viewthread', 'action': 'printable', 'tid': query['tid'][0]}
+    if 'authorid' in query:
+        params['authorid'] = query['authorid'][0]
+    return urljoin(thread_url, 'forum.php?' + urlencode(params))
+
+
+def parse_printable(html: str) -> Optional[list]:
+    """
+    解析打印视图，返回与帖子页相同方式切分的 (节点, 文本) 列表；
+    没有楼层或正文经过加密时返回 None
+    """
+    if 'Base64.decode' in html:
+        return None
+    posts = PRINTABLE_POST_SEPARATOR.split(html)[1:]
+    if not posts:
+        return None
+    # 楼层内容与帖子页 .t_f 中的内容相同，包装为同样的结构后按帖子页的方式解析
+    messages = []
+    for post in posts:
+        post = re.split(r'</body>', post, flags=re.IGNORECASE)[0]
+        messages.append(f'<td class="t_f">{PRINTABLE_POST_HEADER.sub("", post, count=1)}</td>')
+    return parse_thread_page(BeautifulSoup(f'<table><tr>{"".join(messages)}</tr></table>', 'html.parser'))
+
+
+FETCHERS = {fetcher.name: fetcher for fetcher in (PaginatedFetcher, PrintableFetcher)}
+
+
+def get_fetcher(name: Optional[str] = None) -> ThreadFetcher:
+    """按名称或配置 fetch.strategy 返回正文获取策略，默认逐页获取"""
+    if name is None:
+        from util import CONFIG
+        name = (CONFIG.get('fetch') or {}).get('strategy', 'paginated')
+    if name not in FETCHERS:
+        raise ValueError(f"未知的正文获取方式: {name}，可选 {sorted(FETCHERS)}")
+    return FETCHERS[name]()
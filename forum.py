@@ -1,53 +1,91 @@
-from datetime import datetime
-
 from bs4 import BeautifulSoup
 import re
 import concurrent.futures
+from frontier import BudgetExhausted
+from history import open_store
+from ledger import BLOCK, get_ledger, record_failure, resolve_failure
+from logsetup import log_fields, setup_logging
 from myThread import thread_spider
+from profiling import profile_stage
+from registry import TidRegistry
+from store import get_output_store
 from util import *
 import logging
-from typing import Optional, Tuple
-from dataclasses import dataclass, field
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+
+class ThreadRecord:
+    """
+    单个主题的数据，计数、tid、uid 以整数保存，时间以时间戳保存
+    """
+    __slots__ = ('tid', 'uid', 'title', 'author', 'comments', 'views', 'update_time',
+                 'create_time', 'recommends', 'favorites', 'word_count')
+
+    def __init__(self, tid: int, uid: int, title: str, author: str, comments: int, views: int,
+                 update_time: int, create_time: int, recommends: int = 0, favorites: int = 0,
+                 word_count: int = 0):
+        self.tid = tid
+        self.uid = uid
+        self.title = title
+        self.author = author
+        self.comments = comments
+        self.views = views
+        self.update_time = update_time
+        self.create_time = create_time
+        self.recommends = recommends
+        self.favorites = favorites
+        self.word_count = word_count
+
+    @property
+    def link(self) -> str:
+        return f'https://www.jingjiniao.info/forum.php?mod=viewthread&tid={self.tid}&page=1&authorid={self.uid}'
+
+    def to_row(self, block_name: str) -> list:
+        """转换为 data.csv 中的一行"""
+        return [self.title, self.author, self.comments, self.views, self.recommends,
+                self.favorites, self.word_count, block_name, format_time(self.create_time),
+                format_time(self.update_time), self.link]
+
+    @classmethod
+    def from_row(cls, row: dict) -> 'ThreadRecord':
+        """从 data.csv 中的一行构造记录"""
+        uid_match = re.search(r'authorid=(\d+)', row['链接'])
+        return cls(tid=int(extract_tid_from_url(row['链接'])),
+                   uid=int(uid_match.group(1)) if uid_match else 0,
+                   title=row['标题'], author=row['作者'],
+                   comments=parse_count(row['评论数']), views=parse_count(row['浏览数']),
+                   update_time=parse_time(row['更新时间']), create_time=parse_time(row['发表时间']),
+                   recommends=parse_count(row['点赞数']), favorites=parse_count(row['收藏数']),
+                   word_count=parse_count(row['字数']))
+
 
-@dataclass
 class ForumData:
-    """论坛数据容器类"""
-    links: List[str] = field(default_factory=list)
-    comments: List[str] = field(default_factory=list)
-    views: List[str] = field(default_factory=list)
-    authors: List[str] = field(default_factory=list)
-    tids: List[str] = field(default_factory=list)
-    uids: List[str] = field(default_factory=list)
-    titles: List[str] = field(default_factory=list)
-    update_times: List[str] = field(default_factory=list)
-    create_times: List[str] = field(default_factory=list)
-    recommends: List[int] = field(default_factory=list)
-    favorites: List[int] = field(default_factory=list)
-    word_counts: List[int] = field(default_factory=list)
-    _tid_set: set = field(default_factory=set)  # 新增：用于追踪已存在的tid
-
-    def add_thread(self, tid: str, link: str, comment: str, view: str, 
-                  author: str, uid: str, title: str, update_time: str, 
-                  create_time: str) -> bool:
+    """论坛数据容器类，按 tid 保存主题记录，合并时只移动记录的引用"""
+    __slots__ = ('records',)
+
+    def __init__(self):
+        self.records: Dict[int, ThreadRecord] = {}
+
+    def add_thread(self, record: ThreadRecord) -> bool:
         """
         添加一个主题的数据，如果tid已存在则返回False
         """
-        if tid in self._tid_set:
+        if record.tid in self.records:
             return False
-            
-        self._tid_set.add(tid)
-        self.tids.append(tid)
-        self.links.append(link)
-        self.comments.append(comment)
-        self.views.append(view)
-        self.authors.append(author)
-        self.uids.append(uid)
-        self.titles.append(title)
-        self.update_times.append(update_time)
-        self.create_times.append(create_time)
+        self.records[record.tid] = record
         return True
 
+    def merge(self, other: 'ForumData') -> None:
+        """合并另一个容器中的记录，已存在的 tid 保留原记录"""
+        for tid, record in other.records.items():
+            self.records.setdefault(tid, record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[ThreadRecord]:
+        return iter(self.records.values())
+
 class ForumSpiderError(Exception):
     """爬虫相关的自定义异常基类"""
     pass
@@ -60,135 +98,206 @@ class NetworkError(ForumSpiderError):
     """网络请求错误"""
     pass
 
-def main_spider(block_name: str, block_url: str, download_images: bool, last_crawled_data: dict) -> Optional[ForumData]:
+def main_spider(block_name: str, block_url: str, download_images: bool, last_crawled_data: Dict[int, int],
+                registry: Optional[TidRegistry] = None, plan=None) -> Optional[ForumData]:
+    """
+    爬取一个板块
+
+    Args:
+        last_crawled_data: 已爬取主题的 tid 到更新时间戳的映射，用于增量更新
+        registry: 多个板块并行爬取时共享的主题登记表，用于跨板块去重
+        plan: frontier.CrawlPlan，按优先级提交主题任务并在预算用尽时推迟其余任务
+    """
     logger = logging.getLogger(__name__)
     total_data = ForumData()
     
     try:
-        # 首先获取第一页以确定总页数
-        response = make_request(block_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        if len(soup.select("#messagetext")) > 0:
-            error_message = soup.select("#messagetext")[0].text + soup.select("#messagetext")[0].next_sibling.text
-            raise NetworkError(error_message)
-        
-        last_page_num = int(_get_last_page_number(soup))
-        logger.info(f"检测到总页数: {last_page_num}")
+        # 首先获取第一页以确定总页数，获取方式由配置 listing.backend 决定
+        from listing import get_listing
+        listing = get_listing()
+        first_data, last_page_num = listing.first_page(block_url)
+        logger.info(f"检测到总页数: {last_page_num}", extra=log_fields(block=block_name, stage='listing'))
         
-        # 生成所有页面的URL
-        page_urls = []
-        for page_num in range(1, last_page_num + 1):
-            if page_num == 1:
-                page_urls.append(block_url)
-            else:
-                page_url = block_url.replace("-1.html", f"-{page_num}.html")
-                page_urls.append(page_url)
-        
-        # 使用线程池并行处理所有页面
-        page_data_list = []
+        # 列表页上出现的全部主题，用于记录互动数据历史
+        listed: List[ThreadRecord] = []
+
+        def add_page(page_data: Optional[ForumData]) -> None:
+            if not page_data:
+                return
+            # 只保留需要更新的主题，记录直接并入总数据，不复制字段
+            listed.extend(page_data)
+            for record in page_data:
+                last_update = last_crawled_data.get(record.tid)
+                if last_update is not None and record.update_time <= last_update:
+                    continue
+                total_data.add_thread(record)
+
+        add_page(first_data)
+        # 使用线程池并行处理其余页面，有计划时上次因预算用尽未获取的页先提交
+        pages = range(2, last_page_num + 1)
+        pages = plan.page_order(block_name, pages) if plan is not None else list(pages)
+        deferred_pages = []
         page_thread_pool_size = CONFIG['spider']['page_thread_pool_size']
         with concurrent.futures.ThreadPoolExecutor(max_workers=page_thread_pool_size) as executor:
-            future_to_url = {
-                executor.submit(_fetch_page_data, url, page_num + 1): url 
-                for page_num, url in enumerate(page_urls)
+            future_to_page = {
+                executor.submit(listing.fetch_page, block_url, page_num): page_num
+                for page_num in pages
             }
             
-            for future in concurrent.futures.as_completed(future_to_url):
-                url = future_to_url[future]
+            for future in concurrent.futures.as_completed(future_to_page):
+                if future.cancelled():
+                    continue
                 try:
-                    page_data = future.result()
-                    if page_data:
-                        # 创建一个新的ForumData对象来存储需要更新的数据
-                        updated_page_data = ForumData()
-                        # 检查是否需要更新
-                        for i, tid in enumerate(page_data.tids):
-                            if tid in last_crawled_data:
-                                # 比较更新时间
-                                last_update = datetime.strptime(last_crawled_data[tid], '%Y-%m-%d %H:%M')
-                                current_update = datetime.strptime(page_data.update_times[i], '%Y-%m-%d %H:%M')
-                                if current_update <= last_update:
-                                    continue
-                            # 只添加需要更新的数据
-                            updated_page_data.add_thread(
-                                tid=page_data.tids[i],
-                                link=page_data.links[i],
-                                comment=page_data.comments[i],
-                                view=page_data.views[i],
-                                author=page_data.authors[i],
-                                uid=page_data.uids[i],
-                                title=page_data.titles[i],
-                                update_time=page_data.update_times[i],
-                                create_time=page_data.create_times[i]
-                            )
-                        # 只有当有需要更新的数据时才添加到列表中
-                        if updated_page_data.tids:
-                            page_data_list.append(updated_page_data)
+                    add_page(future.result())
+                except FatalError:
+                    _cancel_pending(future_to_page)
+                except BudgetExhausted:
+                    deferred_pages.append(future_to_page[future])
                 except Exception as e:
-                    logger.error(f'处理页面 {url} 失败: {e}')
+                    logger.error(f'处理 {block_name} 第 {future_to_page[future]} 页失败: {e}')
+        # 列表页中途遇到致命错误时还没有爬取任何主题，直接结束
+        cancel_token.check()
+        if deferred_pages:
+            logger.info(f"请求预算用尽，{block_name} 的 {len(deferred_pages)} 个列表页留待下次运行",
+                        extra=log_fields(block=block_name, stage='listing'))
+            if plan is not None:
+                plan.defer_pages(block_name, deferred_pages)
 
-        # 合并所有页面数据
-        for page_data in page_data_list:
-            _merge_page_data(total_data, page_data)
-
-        # 获取完所有页面数据后，使用集合去重确保任务不重复
-        processed_tasks = set()  # 用于追踪已提交的任务
+        # 获取完所有页面数据后，按 tid 提交任务，ForumData 已保证板块内不重复，
+        # 登记表保证其他板块正在或已经爬取的主题不会重复下载
+        if registry is None:
+            registry = TidRegistry([block_name])
+        for record in total_data:
+            registry.claim(record.tid, block_name)
+        # 线程池按提交顺序执行，有计划时按优先级从高到低提交
+        records = plan.order(total_data) if plan is not None else list(total_data)
         with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-            # 修改为使用字典存储future和对应的索引
-            future_to_index = {}
-            for i, (tid, link, title) in enumerate(zip(total_data.tids, total_data.links, total_data.titles)):
-                task_key = f"{tid}"
-                if task_key not in processed_tasks:
-                    processed_tasks.add(task_key)
-                    future = executor.submit(threadWrapper, link, block_name, title, download_images)
-                    future_to_index[future] = i  # 存储future和对应的索引
-
-            # 预先初始化结果列表
-            total_data.recommends = [0] * len(total_data.tids)
-            total_data.favorites = [0] * len(total_data.tids)
-            total_data.word_counts = [0] * len(total_data.tids)
-            
+            future_to_record = {}
+            for record in records:
+                task = (registry.fetch, record.tid, block_name, threadWrapper, record.link)
+                options = {'name': record.title, 'download_images': download_images, 'author': record.author}
+                future = (executor.submit(plan.run, block_name, record, *task, **options) if plan is not None
+                          else executor.submit(*task, **options))
+                future_to_record[future] = record
+
             # 处理线程结果
-            _process_thread_results(future_to_index, total_data)
+            completed = _process_thread_results(future_to_record)
         
-        # 保存数据
-        write_to_csv(total_data.titles, total_data.authors, total_data.comments,
-                    total_data.views, block_name, total_data.update_times, 
-                    total_data.links, "data.csv", total_data.recommends, total_data.favorites,
-                    total_data.create_times, total_data.word_counts)
+        # 保存数据，同时出现在多个板块的主题只由拥有它的板块写入
+        owned = [record for record in total_data if registry.owns(record.tid, block_name)]
+        if len(owned) < len(total_data):
+            logger.info(f"{block_name} 中有 {len(total_data) - len(owned)} 个主题归属其他板块，跳过写入")
+        # 推迟、失败或因取消未完成的主题不写入，保留原有的行与更新时间，下次运行仍会爬取
+        unfinished = [record for record in owned if record.tid not in completed]
+        if unfinished:
+            logger.warning(f"{block_name} 有 {len(unfinished)} 个主题未完成，保留原有数据")
+            _attach_failed_rows(block_name, unfinished)
+        finished = [record for record in owned if record.tid in completed]
+        _relocate_saved(registry, block_name, finished)
+        write_to_csv(finished, block_name, "data.csv")
+        _record_history(block_name, listed, total_data)
+        cancel_token.check()
+        resolve_failure(BLOCK, block_name)
         
         return total_data
         
+    except FatalError:
+        raise
+    except BudgetExhausted as e:
+        # 第一页就已用尽预算时整个板块留待下次运行
+        logger.info(f"请求预算用尽，{block_name} 留待下次运行: {e}", extra=log_fields(block=block_name, stage='listing'))
+        if plan is not None:
+            plan.defer_pages(block_name, [1])
+        return None
     except Exception as e:
         logger.error(f'爬取 {block_name} 失败: {e}', exc_info=True)
+        record_failure(BLOCK, block_name, block_name, block_url, e)
         return None
 
-def _fetch_page_data(url: str, page_num: int) -> Optional[ForumData]:
+def _relocate_saved(registry: TidRegistry, block_name: str, records: List[ThreadRecord]) -> None:
+    """
+    将其他板块先行爬取、保存在其他板块下的正文移到归属板块下
+
+    爬取开始时已登记的归属板块直接作为保存位置，只有在爬取开始后才列出该主题的更靠前的板块需要移动
+    """
+    output = None
+    for record in records:
+        saved = registry.saved_block(record.tid)
+        if saved is None or saved == block_name:
+            continue
+        try:
+            output = output or get_output_store()
+            if output.move(record.tid, saved, block_name, clean_title(record.title)):
+                logging.getLogger(__name__).info(f"主题 {record.tid} 的正文从 {saved} 移到 {block_name}")
+            registry.mark_saved(record.tid, block_name)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"移动主题 {record.tid} 的正文到 {block_name} 失败: {e}")
+
+def _attach_failed_rows(block_name: str, records: List[ThreadRecord]) -> None:
+    """为台账中失败的文章保存列表页上的数据，重试成功后据此写入 data.csv"""
+    try:
+        ledger = get_ledger()
+        if ledger is not None:
+            ledger.attach_rows({record.tid: dict(zip(CSV_HEADER, record.to_row(block_name))) for record in records})
+    except Exception as e:
+        logging.getLogger(__name__).error(f"保存 {block_name} 失败主题的数据失败: {e}")
+
+def _record_history(block_name: str, listed: List[ThreadRecord], crawled: ForumData) -> None:
+    """
+    将本次列表页上所有主题的互动数据追加到历史中
+
+    浏览数与评论数来自列表页；点赞数与收藏数只有成功爬取的主题才有，其余沿用上次的值
+    """
+    history_config = CONFIG.get('history') or {}
+    if not history_config.get('enabled') or not listed:
+        return
+    logger = logging.getLogger(__name__)
+    try:
+        snapshots = []
+        for record in listed:
+            known = record.tid in crawled.records and record.word_count > 0
+            snapshots.append((record.tid, record.views,
+                              record.recommends if known else None,
+                              record.favorites if known else None,
+                              record.comments))
+        store = open_store(history_config.get('dir', 'history'), history_config.get('keyframe_interval', 30))
+        rows = store.append(block_name, snapshots, authors={record.tid: record.author for record in listed})
+        logger.info(f"{block_name} 互动数据历史写入 {rows} 行")
+    except Exception as e:
+        logger.error(f"记录 {block_name} 互动数据历史失败: {e}")
+
+def _fetch_page_data(url: str, page_num: int, fetch: Optional[Callable] = None) -> Optional[ForumData]:
     """
     获取单个页面的数据
     
     Args:
         url: 页面URL
         page_num: 页码
+        fetch: 获取页面的函数，默认联网请求，重新解析时从页面归档读取
         
     Returns:
         ForumData 对象或在发生错误时返回 None
     """
     logger = logging.getLogger(__name__)
     try:
-        response = make_request(url)
+        return _get_page_data(url, page_num, fetch)
+    except FatalError:
+        raise
+    except Exception as e:
+        logger.error(f'获取页面 {url} 数据失败: {e}')
+        return None
+
+def _get_page_data(url: str, page_num: int, fetch: Optional[Callable] = None) -> ForumData:
+    """获取并解析单个列表页，失败时抛出异常"""
+    with profile_stage('listing'):
+        response = (fetch or make_request)(url)
         soup = BeautifulSoup(response.text, 'html.parser')
-        
+
         if len(soup.select("#messagetext")) > 0:
             error_message = soup.select("#messagetext")[0].text + soup.select("#messagetext")[0].next_sibling.text
             raise NetworkError(error_message)
-        
-        page_data = parse_page_data(soup, ForumData(), page_num)
-        return page_data
-        
-    except Exception as e:
-        logger.error(f'获取页面 {url} 数据失败: {e}')
-        return None
+
+        return parse_page_data(soup, ForumData(), page_num)
 
 def _get_last_page_number(soup: BeautifulSoup) -> str:
     """获取最后一页的页码"""
@@ -204,45 +313,58 @@ def _get_next_page_url(soup: BeautifulSoup) -> Optional[str]:
 
 def _merge_page_data(total_data: ForumData, page_data: ForumData) -> None:
     """合并页面数据到总数据中，会自动去除重复的主题"""
-    for i, tid in enumerate(page_data.tids):
-        total_data.add_thread(
-            tid=tid,
-            link=page_data.links[i],
-            comment=page_data.comments[i],
-            view=page_data.views[i],
-            author=page_data.authors[i],
-            uid=page_data.uids[i],
-            title=page_data.titles[i],
-            update_time=page_data.update_times[i],
-            create_time=page_data.create_times[i]
-        )
-
-def _process_thread_results(future_to_index: dict, total_data: ForumData) -> None:
-    """处理线程执行结果"""
+    total_data.merge(page_data)
+
+def _cancel_pending(futures) -> None:
+    """取消线程池中尚未开始的任务，已开始的任务在下一次请求时因取消标记结束"""
+    for future in futures:
+        future.cancel()
+
+def _process_thread_results(future_to_record: dict) -> Set[int]:
+    """
+    处理线程执行结果，将点赞、收藏与字数写回对应的记录，返回成功完成的 tid
+
+    thread_spider 失败时返回 (0, 0, 0)，被推迟的任务返回 None，这些记录保持原样不计入完成；
+    遇到致命错误时取消其余尚未开始的任务
+    """
     logger = logging.getLogger(__name__)
+    completed = set()
     
-    for future in concurrent.futures.as_completed(future_to_index):
+    for future in concurrent.futures.as_completed(future_to_record):
+        if future.cancelled():
+            continue
         try:
             result = future.result()
-            index = future_to_index[future]  # 获取对应的索引
-            if result:
+            record = future_to_record[future]  # 获取对应的记录
+            if result and result != (0, 0, 0):
                 recommend_count, favorite_count, word_count = result
-                total_data.recommends[index] = recommend_count
-                total_data.favorites[index] = favorite_count
-                total_data.word_counts[index] = word_count
+                record.recommends = parse_count(recommend_count)
+                record.favorites = parse_count(favorite_count)
+                record.word_count = parse_count(word_count)
+                completed.add(record.tid)
+        except FatalError:
+            _cancel_pending(future_to_record)
         except Exception as e:
             logger.error(f"处理线程结果时出错: {e}")
+    return completed
 
-def threadWrapper(link, block_name, name, download_images):
-    # 创建线程并执行
+def threadWrapper(link, block_name, name, download_images, author=None):
+    # 创建线程并执行，致命错误转交调用方所在的线程
     result = None
+    error = None
     def thread_func():
-        nonlocal result
-        result = thread_spider(link, block_name, download_images)
+        nonlocal result, error
+        with profile_stage('thread'):
+            try:
+                result = thread_spider(link, block_name, download_images, author=author)
+            except FatalError as e:
+                error = e
     
     thread = threading.Thread(target=thread_func, name=name)
     thread.start()
     thread.join()
+    if error is not None:
+        raise error
     return result
 
 def parse_page_data(soup, page_data, page_num=1):
@@ -301,13 +423,13 @@ def parse_page_data(soup, page_data, page_num=1):
                 create_time = tag.find_all("span")[0].text
             if not create_time:
                 failed_indices.add(i)
-                temp_data['create_times'].append("1990-1-1 00:00")
+                temp_data['create_times'].append(DEFAULT_TIME)
             else:
                 temp_data['create_times'].append(create_time)
         except Exception:
             failed_indices.add(i)
             temp_data['authors'].append("未知作者")
-            temp_data['create_times'].append("1990-1-1 00:00")
+            temp_data['create_times'].append(DEFAULT_TIME)
 
     # 解析标题和更新时间
     for i, link in enumerate(links):
@@ -325,7 +447,7 @@ def parse_page_data(soup, page_data, page_num=1):
         except Exception:
             failed_indices.add(i)
             temp_data['titles'].append("解析失败")
-            temp_data['update_times'].append("1990-1-1 00:00")
+            temp_data['update_times'].append(DEFAULT_TIME)
             temp_data['tids'].append("0")
 
     # 解析uid
@@ -350,18 +472,20 @@ def parse_page_data(soup, page_data, page_num=1):
     
     # 只添加成功解析的数据到page_data
     for i in valid_indices:
-        url = f'https://www.jingjiniao.info/forum.php?mod=viewthread&tid={temp_data["tids"][i]}&page=1&authorid={temp_data["uids"][i]}'
-        page_data.add_thread(
-            tid=temp_data['tids'][i],
-            link=url,
-            comment=temp_data['comments'][i],
-            view=temp_data['views'][i],
-            author=temp_data['authors'][i],
-            uid=temp_data['uids'][i],
-            title=temp_data['titles'][i],
-            update_time=temp_data['update_times'][i],
-            create_time=temp_data['create_times'][i]
-        )
+        try:
+            record = ThreadRecord(
+                tid=int(temp_data['tids'][i]),
+                uid=int(temp_data['uids'][i]),
+                title=temp_data['titles'][i],
+                author=temp_data['authors'][i],
+                comments=parse_count(temp_data['comments'][i]),
+                views=parse_count(temp_data['views'][i]),
+                update_time=parse_time(temp_data['update_times'][i]),
+                create_time=parse_time(temp_data['create_times'][i])
+            )
+        except ValueError:
+            continue
+        page_data.add_thread(record)
 
     return page_data
 
@@ -370,7 +494,7 @@ def _parse_update_time(link):
     span_tag = link.find('span')
     if span_tag is None:
         match = re.search(r'\[(最后更新|Last update):\s*(\d{4}-\d{1,2}-\d{1,2}\s+\d{1,2}:\d{1,2})\]', link.text)
-        return match.group(2) if match else "1990-1-1 00:00"
+        return match.group(2) if match else DEFAULT_TIME
     return span_tag.get('title')
 
 def _parse_tid(link):
@@ -384,4 +508,5 @@ def _parse_tid(link):
     return None
 
 if __name__ == '__main__':
+    setup_logging(init_config())
     main_spider("中长篇", "https://www.jingjiniao.info/forum-85-1.html", False, {})
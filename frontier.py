@@ -0,0 +1,222 @@
+import calendar
+import json
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class BudgetExhausted(Exception):
+    """本次运行的请求、流量或时间预算已用尽"""
+    pass
+
+
+class Budget:
+    """
+    单次运行的请求预算，0 表示不限制
+
+    每次实际发出请求前检查（重试的每次尝试分别计入），用尽后所有请求抛出 BudgetExhausted 且不再重试；已开始的文章在下一次请求时停止
+    """
+
+    def __init__(self, max_requests: int = 0, max_bytes: int = 0, max_seconds: float = 0):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.requests = 0
+        self.bytes = 0
+        self.start_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.max_requests or self.max_bytes or self.max_seconds)
+
+    def exhausted(self) -> bool:
+        return ((self.max_requests and self.requests >= self.max_requests)
+                or (self.max_bytes and self.bytes >= self.max_bytes)
+                or (self.max_seconds and time.monotonic() - self.start_time >= self.max_seconds))
+
+    def check(self) -> None:
+        """请求前调用，预算已用尽时抛出异常，否则计入一次请求"""
+        with self._lock:
+            if self.exhausted():
+                raise BudgetExhausted(self.describe())
+            self.requests += 1
+
+    def charge(self, size: int) -> None:
+        with self._lock:
+            self.bytes += size
+
+    def describe(self) -> str:
+        return (f"已请求 {self.requests} 次，{self.bytes / 1024 / 1024:.1f} MB，"
+                f"耗时 {time.monotonic() - self.start_time:.0f} 秒")
+
+
+@dataclass(frozen=True)
+class PriorityWeights:
+    """主题爬取优先级的权重"""
+    # 更新时间的衰减天数，越新的更新价值越高
+    recency_days: float = 7.0
+    recency_weight: float = 3.0
+    # 浏览数、评论数相比上次爬取的增量，取对数
+    views_weight: float = 0.3
+    comments_weight: float = 0.5
+    # 估计每页字数，按页数折算爬取成本
+    words_per_page: int = 20000
+    # 成本的指数，0 表示不考虑文章长度
+    length_exponent: float = 0.5
+    # 上次因预算用尽而推迟的主题，每推迟一次增加的优先级
+    deferred_boost: float = 1.0
+
+
+@dataclass
+class PreviousCounts:
+    """上次爬取时的计数，来自 data.csv"""
+    views: int
+    comments: int
+    word_count: int
+
+
+def thread_priority(record, previous: Optional[PreviousCounts], deferred_runs: int = 0,
+                    weights: PriorityWeights = PriorityWeights(), now: Optional[int] = None) -> float:
+    """
+    估计爬取一个主题的价值与成本之比
+
+    record 需提供 update_time、views、comments；论坛时间按 UTC 解析，因此当前时间用本机当地时间的 timegm
+    """
+    now = now if now is not None else calendar.timegm(time.localtime())
+    age_days = max(now - record.update_time, 0) / 86400
+    recency = math.exp(-age_days / weights.recency_days)
+    view_delta = max(record.views - previous.views, 0) if previous else record.views
+    comment_delta = max(record.comments - previous.comments, 0) if previous else record.comments
+    value = (weights.recency_weight * recency
+             + weights.views_weight * math.log1p(view_delta)
+             + weights.comments_weight * math.log1p(comment_delta)
+             + weights.deferred_boost * deferred_runs)
+    pages = 1 + (previous.word_count if previous else 0) / weights.words_per_page
+    return value / pages ** weights.length_exponent
+
+
+class CrawlPlan:
+    """
+    一次爬取运行的任务计划：按优先级排列各板块的主题任务，执行前检查预算，
+    预算用尽后未执行的任务记录下来，下次运行时提高优先级；
+    未获取的列表页同样记录，下次运行时先于其他列表页获取
+    """
+
+    def __init__(self, budget: Budget, previous: Optional[Dict[int, PreviousCounts]] = None,
+                 weights: PriorityWeights = PriorityWeights(), pending_file: str = 'frontier/pending.json'):
+        self.budget = budget
+        self.previous = previous or {}
+        self.weights = weights
+        self.pending_file = Path(pending_file)
+        # tid -> 上次保存的待爬取记录；板块 -> 上次未获取的列表页
+        self.carried, self.carried_pages = self._load_pending()
+        self._lock = threading.Lock()
+        # tid -> (板块, 标题)
+        self.deferred: Dict[int, Tuple[str, str]] = {}
+        self.completed = set()
+        # 板块 -> 本次未获取的列表页，第 1 页表示整个板块的列表都未获取
+        self.deferred_pages: Dict[str, List[int]] = {}
+        self.listed_blocks = set()
+
+    @classmethod
+    def from_config(cls, config: dict, rows: Iterable[dict] = (), max_requests: Optional[int] = None,
+                    max_bytes: Optional[int] = None, max_seconds: Optional[float] = None) -> 'CrawlPlan':
+        """按配置创建计划，rows 为 data.csv 中的行，参数不为 None 时覆盖配置中的预算"""
+        from util import extract_tid_from_url, parse_count
+
+        frontier_config = config.get('frontier') or {}
+        budget = Budget(frontier_config.get('max_requests', 0) if max_requests is None else max_requests,
+                        frontier_config.get('max_bytes', 0) if max_bytes is None else max_bytes,
+                        frontier_config.get('max_seconds', 0) if max_seconds is None else max_seconds)
+        names = {field.name for field in fields(PriorityWeights)}
+        weights = PriorityWeights(**{key: value for key, value in (frontier_config.get('weights') or {}).items()
+                                     if key in names})
+        previous = {}
+        for row in rows:
+            tid = extract_tid_from_url(row['链接'])
+            if tid:
+                previous[int(tid)] = PreviousCounts(parse_count(row['浏览数']), parse_count(row['评论数']),
+                                                    parse_count(row['字数']))
+        return cls(budget, previous, weights, frontier_config.get('pending_file', 'frontier/pending.json'))
+
+    def _load_pending(self) -> Tuple[Dict[int, dict], Dict[str, List[int]]]:
+        """读取上次推迟的主题与列表页，主题记录中的 runs 为已推迟的次数；兼容只保存了主题的旧格式"""
+        if not self.pending_file.exists():
+            return {}, {}
+        try:
+            with open(self.pending_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if 'threads' not in data:
+                data = {'threads': data}
+            return ({int(tid): entry for tid, entry in data['threads'].items()},
+                    {block_name: [int(page) for page in pages] for block_name, pages in (data.get('pages') or {}).items()})
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"读取待爬取任务 {self.pending_file} 失败: {e}")
+            return {}, {}
+
+    def order(self, records: Iterable[Any]) -> List[Any]:
+        """按优先级从高到低排列主题记录"""
+        now = calendar.timegm(time.localtime())
+        return sorted(records, key=lambda record: -thread_priority(
+            record, self.previous.get(record.tid), self.carried.get(record.tid, {}).get('runs', 0), self.weights, now))
+
+    def page_order(self, block_name: str, pages: Iterable[int]) -> List[int]:
+        """列表页的获取顺序，上次未获取的页在前"""
+        with self._lock:
+            self.listed_blocks.add(block_name)
+            carried = set(self.carried_pages.get(block_name, ()))
+        return sorted(pages, key=lambda page: (page not in carried, page))
+
+    def defer_pages(self, block_name: str, pages: Iterable[int]) -> None:
+        """记录因预算用尽未获取的列表页"""
+        with self._lock:
+            self.listed_blocks.add(block_name)
+            self.deferred_pages[block_name] = sorted(set(self.deferred_pages.get(block_name, [])) | set(pages))
+
+    def run(self, block_name: str, record, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """预算未用尽时执行任务，否则推迟；预算在任务执行中途用尽导致失败时同样推迟"""
+        if self.budget.exhausted():
+            self._defer(block_name, record)
+            return None
+        result = func(*args, **kwargs)
+        if (not result or result == (0, 0, 0)) and self.budget.exhausted():
+            self._defer(block_name, record)
+            return None
+        with self._lock:
+            self.completed.add(record.tid)
+        return result
+
+    def _defer(self, block_name: str, record) -> None:
+        with self._lock:
+            self.deferred[record.tid] = (block_name, record.title)
+
+    def is_deferred(self, tid: int) -> bool:
+        with self._lock:
+            return tid in self.deferred and tid not in self.completed
+
+    def save_pending(self) -> None:
+        """保存本次推迟的任务；已完成的主题从中移除，本次未列出的沿用原有记录"""
+        pending = {tid: entry for tid, entry in self.carried.items() if tid not in self.completed}
+        for tid, (block_name, title) in self.deferred.items():
+            if tid in self.completed:
+                continue
+            pending[tid] = {'block': block_name, 'title': title, 'runs': self.carried.get(tid, {}).get('runs', 0) + 1}
+        # 本次获取过列表的板块以本次的结果为准
+        pages = {block_name: block_pages for block_name, block_pages in self.carried_pages.items()
+                 if block_name not in self.listed_blocks}
+        pages.update(self.deferred_pages)
+        self.pending_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.pending_file.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'threads': {str(tid): entry for tid, entry in pending.items()}, 'pages': pages},
+                      f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.pending_file)
+        if self.deferred_pages:
+            logging.info(f"预算用尽，{sum(map(len, self.deferred_pages.values()))} 个列表页留待下次运行")
+        deferred = len(set(self.deferred) - self.completed)
+        if deferred:
+            logging.warning(f"预算用尽（{self.budget.describe()}），{deferred} 个主题留待下次运行")
@@ -0,0 +1,382 @@
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 每个快照记录的互动指标，顺序即存储顺序
+METRICS = ('views', 'recommends', 'favorites', 'comments')
+# 段头：魔数 + 头部 JSON 长度
+SEGMENT_MAGIC = b'JJNH'
+SEGMENT_HEADER = struct.Struct('<4sI')
+# 列以小端 32 位整数保存
+ARRAY_TYPE = 'i'
+
+_stores: Dict[str, 'EngagementStore'] = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(directory: str = 'history', keyframe_interval: int = 30) -> 'EngagementStore':
+    """返回目录对应的共享存储实例，多个板块线程写入同一个实例"""
+    key = str(Path(directory).resolve())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = EngagementStore(directory, keyframe_interval)
+        return _stores[key]
+
+
+def _encode_column(values: Sequence[int]) -> bytes:
+    column = array(ARRAY_TYPE, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _decode_column(data: bytes) -> array:
+    column = array(ARRAY_TYPE)
+    column.frombytes(data)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+class EngagementStore:
+    """
+    追加写入的互动数据时间序列
+
+    每次爬取每个板块写入一个段，段内按列保存：tid 升序后做差分，各指标保存相对该 tid
+    上一次取值的增量，未变化的主题不写入。每个板块每隔 keyframe_interval 个段写入一个
+    关键帧保存全部主题的绝对值，读取时只需从最近的关键帧开始回放。
+
+    文件：
+        engagement.dat  段数据，只追加
+        engagement.idx  段索引，每行一个 JSON，丢失或不完整时可从段数据重建
+        meta.json       tid 到作者与板块的映射，用于按作者查询
+    """
+
+    def __init__(self, directory: str = 'history', keyframe_interval: int = 30):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.directory / 'engagement.dat'
+        self.index_path = self.directory / 'engagement.idx'
+        self.meta_path = self.directory / 'meta.json'
+        self.keyframe_interval = keyframe_interval
+        self._lock = threading.Lock()
+        # 各板块当前的完整状态，首次写入该板块时从最近的关键帧回放得到
+        self._states: Dict[str, Dict[int, List[int]]] = {}
+        self._index = self._load_index()
+        self._meta = self._load_meta()
+
+    # ---------- 写入 ----------
+
+    def append(self, block_name: str, snapshots: Iterable[Tuple], authors: Optional[Dict[int, str]] = None,
+               timestamp: Optional[int] = None) -> int:
+        """
+        写入一次爬取的快照
+
+        Args:
+            snapshots: (tid, 浏览数, 点赞数, 收藏数, 评论数)，本次未获取的指标传 None，沿用上次的值
+            authors: tid 到作者的映射
+
+        Returns:
+            写入的行数
+        """
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        with self._lock:
+            state = self._chain_state(block_name)
+            changed = {}
+            for tid, *values in snapshots:
+                old = state.get(tid)
+                new = [v if v is not None else (old[i] if old else 0) for i, v in enumerate(values)]
+                if new != old:
+                    changed[tid] = (old or [0] * len(METRICS), new)
+
+            chain = [entry for entry in self._index if entry['block'] == block_name]
+            since_keyframe = 0
+            for entry in reversed(chain):
+                if entry['keyframe']:
+                    break
+                since_keyframe += 1
+            keyframe = not chain or since_keyframe + 1 >= self.keyframe_interval
+
+            for tid, (_, new) in changed.items():
+                state[tid] = new
+            if keyframe:
+                rows = {tid: ([0] * len(METRICS), values) for tid, values in state.items()}
+            else:
+                rows = changed
+
+            if authors:
+                self._update_meta(authors, block_name)
+            if not rows:
+                return 0
+
+            self._write_segment(block_name, timestamp, keyframe, rows)
+            return len(rows)
+
+    def _write_segment(self, block_name: str, timestamp: int, keyframe: bool,
+                       rows: Dict[int, Tuple[List[int], List[int]]]) -> None:
+        tids = sorted(rows)
+        columns = [_encode_column([tids[0]] + [b - a for a, b in zip(tids, tids[1:])])]
+        for i in range(len(METRICS)):
+            columns.append(_encode_column([rows[tid][1][i] - rows[tid][0][i] for tid in tids]))
+        body = zlib.compress(b''.join(columns), 9)
+        header = json.dumps({'ts': timestamp, 'block': block_name, 'keyframe': keyframe,
+                             'rows': len(tids)}, ensure_ascii=False).encode('utf-8')
+        segment = SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(header)) + header + body
+
+        with open(self.data_path, 'ab') as f:
+            offset = f.tell()
+            f.write(segment)
+            f.flush()
+            os.fsync(f.fileno())
+
+        entry = {'seq': len(self._index), 'ts': timestamp, 'block': block_name, 'keyframe': keyframe,
+                 'rows': len(tids), 'offset': offset, 'length': len(segment)}
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._index.append(entry)
+
+    def _chain_state(self, block_name: str) -> Dict[int, List[int]]:
+        if block_name not in self._states:
+            state = {}
+            chain = [entry for entry in self._index if entry['block'] == block_name]
+            with self._open_data() as f:
+                for entry in chain[self._last_keyframe(chain, None):]:
+                    self._apply(self._read_segment(f, entry), entry, state)
+            self._states[block_name] = state
+        return self._states[block_name]
+
+    def _update_meta(self, authors: Dict[int, str], block_name: str) -> None:
+        changed = False
+        for tid, author in authors.items():
+            key = str(tid)
+            if self._meta.get(key) != [author, block_name]:
+                self._meta[key] = [author, block_name]
+                changed = True
+        if changed:
+            temp_path = self.meta_path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._meta, f, ensure_ascii=False)
+            os.replace(temp_path, self.meta_path)
+
+    # ---------- 读取 ----------
+
+    def query(self, tids: Optional[Iterable[int]] = None, author: Optional[str] = None,
+              block: Optional[str] = None, start: Optional[int] = None,
+              end: Optional[int] = None, seed: bool = True) -> List[Tuple]:
+        """
+        按 tid、作者或板块查询时间范围内的快照
+
+        段中只有发生变化的主题，窗口内只变化过一次的主题因此没有起点。seed 时每个主题额外返回
+        不晚于 start 的最近一次快照（该板块 start 之前最后一个段的时间与当时的取值），作为窗口的起点
+
+        Returns:
+            (时间戳, 板块, tid, 浏览数, 点赞数, 收藏数, 评论数) 列表，按时间排序
+        """
+        targets = set(int(tid) for tid in tids) if tids is not None else None
+        if author is not None:
+            author_tids = {int(tid) for tid, (name, _) in self._meta.items() if name == author}
+            targets = author_tids if targets is None else targets & author_tids
+        if targets is not None and not targets:
+            return []
+        sorted_targets = sorted(targets) if targets is not None else None
+
+        with self._lock:
+            index = list(self._index)
+        blocks = [block] if block else sorted({entry['block'] for entry in index})
+
+        results = {}
+        with self._open_data() as f:
+            for block_name in blocks:
+                chain = [entry for entry in index if entry['block'] == block_name]
+                state = {}
+                # 回放到 start 为止时，seed_ts 为不晚于 start 的最后一个段的时间
+                seeding, seed_ts = seed and start is not None, None
+                for entry in chain[self._last_keyframe(chain, start):]:
+                    if end is not None and entry['ts'] > end:
+                        break
+                    if seeding and entry['ts'] > start:
+                        self._seed(results, seed_ts, block_name, state)
+                        seeding = False
+                    touched = self._apply(self._read_segment(f, entry), entry, state, sorted_targets)
+                    if seeding:
+                        seed_ts = entry['ts']
+                    if start is not None and entry['ts'] < start:
+                        continue
+                    for tid in touched:
+                        # 同一主题出现在多个板块时只保留一条
+                        results.setdefault((entry['ts'], tid), (entry['ts'], block_name, tid, *state[tid]))
+                if seeding:
+                    self._seed(results, seed_ts, block_name, state)
+        return [results[key] for key in sorted(results)]
+
+    @staticmethod
+    def _seed(results: dict, ts: Optional[int], block_name: str, state: Dict[int, List[int]]) -> None:
+        """以回放到 start 的状态为各主题补上起点，start 之前没有段时不补"""
+        if ts is None:
+            return
+        for tid, values in state.items():
+            results.setdefault((ts, tid), (ts, block_name, tid, *values))
+
+    def to_frame(self, rows: List[Tuple]):
+        """将查询结果转换为 DataFrame"""
+        import pandas as pd
+        return pd.DataFrame(rows, columns=['ts', 'block', 'tid', *METRICS])
+
+    @staticmethod
+    def _last_keyframe(chain: List[dict], before: Optional[int]) -> int:
+        """返回不晚于 before 的最近关键帧在 chain 中的位置"""
+        position = 0
+        for i, entry in enumerate(chain):
+            if before is not None and entry['ts'] > before:
+                break
+            if entry['keyframe']:
+                position = i
+        return position
+
+    @staticmethod
+    def _apply(columns: List[array], entry: dict, state: Dict[int, List[int]],
+               targets: Optional[List[int]] = None) -> List[int]:
+        """将段应用到状态上，返回段中涉及的 tid"""
+        tids = list(accumulate(columns[0]))
+        if entry['keyframe']:
+            if targets is None:
+                state.clear()
+            else:
+                for tid in targets:
+                    state.pop(tid, None)
+        if targets is None:
+            positions = range(len(tids))
+        else:
+            positions = []
+            for tid in targets:
+                i = bisect_left(tids, tid)
+                if i < len(tids) and tids[i] == tid:
+                    positions.append(i)
+        touched = []
+        for i in positions:
+            tid = tids[i]
+            old = state.get(tid) or [0] * len(METRICS)
+            state[tid] = [old[m] + columns[m + 1][i] for m in range(len(METRICS))]
+            touched.append(tid)
+        return touched
+
+    def _read_segment(self, f, entry: dict) -> List[array]:
+        f.seek(entry['offset'])
+        data = f.read(entry['length'])
+        magic, header_length = SEGMENT_HEADER.unpack_from(data)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"互动历史段损坏: 偏移 {entry['offset']}")
+        body = zlib.decompress(data[SEGMENT_HEADER.size + header_length:])
+        width = len(body) // (len(METRICS) + 1)
+        return [_decode_column(body[i * width:(i + 1) * width]) for i in range(len(METRICS) + 1)]
+
+    def _open_data(self):
+        if not self.data_path.exists():
+            self.data_path.touch()
+        return open(self.data_path, 'rb')
+
+    # ---------- 索引 ----------
+
+    def _load_index(self) -> List[dict]:
+        index = []
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        index.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        data_size = self.data_path.stat().st_size if self.data_path.exists() else 0
+        indexed_size = index[-1]['offset'] + index[-1]['length'] if index else 0
+        if indexed_size != data_size:
+            index = self._rebuild_index(index, indexed_size, data_size)
+        return index
+
+    def _rebuild_index(self, index: List[dict], indexed_size: int, data_size: int) -> List[dict]:
+        """从段数据恢复索引，截断写入到一半的段"""
+        if indexed_size > data_size:
+            index, indexed_size = [], 0
+        logging.warning(f"互动历史索引不完整，从偏移 {indexed_size} 开始重建")
+        with open(self.data_path, 'rb') as f:
+            offset = indexed_size
+            while offset < data_size:
+                f.seek(offset)
+                head = f.read(SEGMENT_HEADER.size)
+                if len(head) < SEGMENT_HEADER.size:
+                    break
+                magic, header_length = SEGMENT_HEADER.unpack(head)
+                if magic != SEGMENT_MAGIC:
+                    break
+                try:
+                    header = json.loads(f.read(header_length).decode('utf-8'))
+                    # 逐块解压直到压缩流结束，以确定段的长度
+                    decompressor = zlib.decompressobj()
+                    consumed = 0
+                    while not decompressor.eof:
+                        chunk = f.read(65536)
+                        if not chunk:
+                            break
+                        decompressor.decompress(chunk)
+                        consumed += len(chunk)
+                except (ValueError, zlib.error):
+                    break
+                if not decompressor.eof:
+                    break
+                length = SEGMENT_HEADER.size + header_length + consumed - len(decompressor.unused_data)
+                index.append({'seq': len(index), 'ts': header['ts'], 'block': header['block'],
+                              'keyframe': header['keyframe'], 'rows': header['rows'],
+                              'offset': offset, 'length': length})
+                offset += length
+        if offset < data_size:
+            logging.warning(f"截断互动历史中不完整的段，偏移 {offset}")
+            with open(self.data_path, 'r+b') as f:
+                f.truncate(offset)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            for entry in index:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        return index
+
+    def _load_meta(self) -> Dict[str, list]:
+        if not self.meta_path.exists():
+            return {}
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def velocity_features(store: EngagementStore, window_days: int = 30, now: Optional[int] = None):
+    """
+    计算每个主题在最近 window_days 天内各互动指标的日均增量
+
+    起点为各主题不晚于窗口开始的最近一次快照，窗口内只变化过一次的主题同样可以计算
+
+    Returns:
+        以 tid 为索引的 DataFrame，列为 浏览增速、点赞增速、收藏增速、评论增速 与 快照数
+    """
+    import pandas as pd
+
+    now = int(now if now is not None else time.time())
+    df = store.to_frame(store.query(start=now - window_days * 86400, end=now))
+    columns = ['浏览增速', '点赞增速', '收藏增速', '评论增速', '快照数']
+    if df.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='tid'))
+
+    grouped = df.sort_values('ts').groupby('tid')
+    first, last = grouped.first(), grouped.last()
+    days = (last['ts'] - first['ts']) / 86400
+    # 只有一次快照或间隔太短的主题无法计算增速
+    valid = days >= 0.5
+    features = pd.DataFrame(index=first.index[valid])
+    for metric, column in zip(METRICS, columns):
+        features[column] = ((last[metric] - first[metric]) / days)[valid].round(2)
+    features['快照数'] = grouped.size()[valid]
+    return features
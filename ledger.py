@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 失败任务的类别：整个板块（第一页失败）、单个列表页、单篇文章
+BLOCK = 'block'
+PAGE = 'page'
+THREAD = 'thread'
+
+_ledgers: Dict[Tuple[str, int], 'FailureLedger'] = {}
+_ledgers_lock = threading.Lock()
+
+
+@dataclass
+class FailedTask:
+    """
+    一个失败的爬取任务
+
+    key 对板块为板块名，对列表页为 "<板块名>#<页码>"，对文章为 tid；
+    url 为板块链接、失败时实际请求的列表页链接或文章链接；row 为文章在 data.csv 中对应的行（JSON），用于重试成功后写入；
+    backend 为列表页的获取方式（listing.LISTINGS 中的名称），重试时用同一方式请求 url
+    """
+    kind: str
+    key: str
+    block: str
+    url: str
+    page: int
+    error_class: str
+    last_error: str
+    attempts: int
+    first_failed: int
+    last_failed: int
+    next_retry: int
+    row: Optional[str] = None
+    backend: str = ''
+
+
+class FailureLedger:
+    """
+    失败任务台账，记录失败的板块、列表页与文章，以及错误类别、失败次数与最后一次错误
+
+    再次失败时按指数退避推迟下次重试的时间，成功后从台账中移除。
+    台账中的键同时保存在内存中，成功的任务不在台账中时不访问数据库
+    """
+
+    def __init__(self, path: str = 'ledger/failures.db', backoff_minutes: float = 30,
+                 max_backoff_hours: float = 72):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.backoff = backoff_minutes * 60
+        self.max_backoff = max_backoff_hours * 3600
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS failures (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                block TEXT NOT NULL,
+                url TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                error_class TEXT NOT NULL,
+                last_error TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                first_failed INTEGER NOT NULL,
+                last_failed INTEGER NOT NULL,
+                next_retry INTEGER NOT NULL,
+                row TEXT,
+                backend TEXT NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        ''')
+        self._conn.commit()
+        self._columns = ', '.join(field.name for field in fields(FailedTask))
+        self._keys = set(self._conn.execute('SELECT kind, key FROM failures').fetchall())
+
+    def record(self, kind: str, key, block: str, url: str, error: BaseException, page: int = 0,
+               backend: str = '') -> int:
+        """记录一次失败，返回该任务累计的失败次数"""
+        key = str(key)
+        now = int(time.time())
+        with self._lock:
+            row = self._conn.execute('SELECT attempts, first_failed FROM failures WHERE kind = ? AND key = ?',
+                                     (kind, key)).fetchone()
+            attempts, first_failed = (row[0] + 1, row[1]) if row else (1, now)
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            self._conn.execute('''
+                INSERT INTO failures (kind, key, block, url, page, error_class, last_error, attempts,
+                                      first_failed, last_failed, next_retry, backend)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET
+                    block = excluded.block, url = excluded.url, backend = excluded.backend,
+                    error_class = excluded.error_class,
+                    last_error = excluded.last_error, attempts = excluded.attempts,
+                    last_failed = excluded.last_failed, next_retry = excluded.next_retry
+            ''', (kind, key, block, url, page, type(error).__name__, str(error)[:500], attempts, first_failed,
+                  now, now + int(delay), backend))
+            self._conn.commit()
+            self._keys.add((kind, key))
+        return attempts
+
+    def attach_rows(self, rows: Dict[int, dict]) -> None:
+        """为失败的文章保存 data.csv 中的行，tid 不在台账中的忽略"""
+        with self._lock:
+            updates = [(json.dumps(row, ensure_ascii=False), THREAD, str(tid)) for tid, row in rows.items()
+                       if (THREAD, str(tid)) in self._keys]
+            if updates:
+                self._conn.executemany('UPDATE failures SET row = ? WHERE kind = ? AND key = ?', updates)
+                self._conn.commit()
+
+    def resolve(self, kind: str, key) -> bool:
+        """任务成功后从台账中移除，返回该任务之前是否失败过"""
+        if not self.discard(kind, key):
+            return False
+        logging.info(f"失败任务 {kind} {key} 已重试成功")
+        return True
+
+    def discard(self, kind: str, key) -> bool:
+        """不重试而直接从台账中移除任务，返回任务是否在台账中"""
+        key = str(key)
+        with self._lock:
+            if (kind, key) not in self._keys:
+                return False
+            self._conn.execute('DELETE FROM failures WHERE kind = ? AND key = ?', (kind, key))
+            self._conn.commit()
+            self._keys.discard((kind, key))
+        return True
+
+    def tasks(self, due_only: bool = False, max_attempts: int = 0, now: Optional[int] = None) -> List[FailedTask]:
+        """
+        返回台账中的任务，按类别（板块、列表页、文章）与首次失败时间排列
+
+        due_only 时只返回已到重试时间、且失败次数未达到 max_attempts（0 表示不限制）的任务
+        """
+        query = f'SELECT {self._columns} FROM failures'
+        params: list = []
+        if due_only:
+            query += ' WHERE next_retry <= ?'
+            params.append(int(time.time()) if now is None else now)
+            if max_attempts:
+                query += ' AND attempts < ?'
+                params.append(max_attempts)
+        order = {BLOCK: 0, PAGE: 1, THREAD: 2}
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return sorted((FailedTask(*row) for row in rows), key=lambda task: (order.get(task.kind, 3), task.first_failed))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+
+def open_ledger(path: str = 'ledger/failures.db', backoff_minutes: float = 30,
+                max_backoff_hours: float = 72) -> FailureLedger:
+    """返回路径对应的共享台账实例，每个进程各自打开连接"""
+    key = (str(Path(path).resolve()), os.getpid())
+    with _ledgers_lock:
+        if key not in _ledgers:
+            _ledgers[key] = FailureLedger(path, backoff_minutes, max_backoff_hours)
+        return _ledgers[key]
+
+
+def get_ledger(config: Optional[dict] = None) -> Optional[FailureLedger]:
+    """按配置返回失败任务台账，未开启时返回 None"""
+    if config is None:
+        from util import CONFIG
+        config = CONFIG
+    ledger_config = config.get('ledger') or {}
+    if not ledger_config.get('enabled'):
+        return None
+    return open_ledger(ledger_config.get('path', 'ledger/failures.db'), ledger_config.get('backoff_minutes', 30),
+                       ledger_config.get('max_backoff_hours', 72))
+
+
+def record_failure(kind: str, key, block: str, url: str, error: BaseException, page: int = 0,
+                   backend: str = '') -> None:
+    """
+    按配置将失败的任务记入台账，台账写入失败不影响爬取
+
+    请求预算用尽导致的失败由 frontier 推迟，不记入台账
+    """
+    from frontier import BudgetExhausted
+
+    if isinstance(error, BudgetExhausted):
+        return
+    try:
+        ledger = get_ledger()
+        if ledger is not None:
+            ledger.record(kind, key, block, url, error, page, backend)
+    except Exception as e:
+        logging.error(f"记录失败任务 {kind} {key} 失败: {e}")
+
+
+def resolve_failure(kind: str, key) -> None:
+    """按配置将成功的任务从台账中移除"""
+    try:
+        ledger = get_ledger()
+        if ledger is not None:
+            ledger.resolve(kind, key)
+    except Exception as e:
+        logging.error(f"更新失败任务 {kind} {key} 失败: {e}")
+
+
+def block_name_of(block_url: str) -> str:
+    """由板块链接找到配置中的板块名，找不到时返回链接本身"""
+    from util import CONFIG
+
+    for name, url in (CONFIG.get('blocks') or {}).items():
+        if url == block_url:
+            return name
+    return block_url
+
+
+def print_tasks(tasks: Iterable[FailedTask]) -> None:
+    print('类别\t板块\t任务\t错误类别\t失败次数\t下次重试\t最后的错误')
+    for task in tasks:
+        next_retry = time.strftime('%Y-%m-%d %H:%M', time.localtime(task.next_retry))
+        print(f"{task.kind}\t{task.block}\t{task.key}\t{task.error_class}\t{task.attempts}\t{next_retry}\t"
+              f"{task.last_error}")
+
+
+if __name__ == '__main__':
+    from util import init_config
+
+    ledger = get_ledger(init_config())
+    if ledger is None:
+        print('未开启失败任务台账，请在配置中设置 ledger.enabled: true')
+    else:
+        print_tasks(ledger.tasks())
@@ -0,0 +1,218 @@
+import html
+import json
+import logging
+import math
+import re
+from typing import Optional, Tuple
+from urllib.parse import urlencode, urljoin
+
+from bs4 import BeautifulSoup
+
+from forum import ForumData, NetworkError, ThreadRecord, _get_last_page_number, _get_page_data, parse_page_data
+from frontier import BudgetExhausted
+from ledger import PAGE, block_name_of, record_failure, resolve_failure
+from profiling import profile_stage
+from util import *
+
+
+class ApiError(Exception):
+    """移动端接口返回错误或无法识别的数据"""
+    pass
+
+
+class ListingBackend:
+    """获取板块列表页的方式，页码从 1 开始"""
+    name = ''
+
+    def first_page(self, block_url: str) -> Tuple[Optional[ForumData], int]:
+        """获取第一页，返回第一页的数据与总页数"""
+        raise NotImplementedError
+
+    def page_url(self, block_url: str, page_num: int) -> str:
+        """指定页的链接"""
+        raise NotImplementedError
+
+    def get_url(self, url: str, page_num: int) -> ForumData:
+        """获取并解析 page_url 返回的列表页链接，失败时抛出异常"""
+        raise NotImplementedError
+
+    def active(self) -> 'ListingBackend':
+        """实际发出请求的获取方式，回退后为回退的方式"""
+        return self
+
+    def get_page(self, block_url: str, page_num: int) -> ForumData:
+        """获取指定页的数据，失败时抛出异常"""
+        listing = self.active()
+        return listing.get_url(listing.page_url(block_url, page_num), page_num)
+
+    def fetch_page(self, block_url: str, page_num: int) -> Optional[ForumData]:
+        """获取指定页的数据，失败时记入失败任务台账并返回 None"""
+        listing = self.active()
+        return listing.fetch_url(block_name_of(block_url), listing.page_url(block_url, page_num), page_num)
+
+    def fetch_url(self, block_name: str, url: str, page_num: int) -> Optional[ForumData]:
+        """
+        获取指定的列表页链接，失败时记入失败任务台账并返回 None
+
+        台账中保存实际请求的链接与获取方式，重试时请求同一个链接，不受之后更改配置或回退的影响；
+        请求预算用尽不是失败，抛出 BudgetExhausted 由调用方推迟
+        """
+        try:
+            page_data = self.get_url(url, page_num)
+        except (FatalError, BudgetExhausted):
+            raise
+        except Exception as e:
+            logging.error(f'获取 {block_name} 第 {page_num} 页数据失败: {e}')
+            record_failure(PAGE, f'{block_name}#{page_num}', block_name, url, e, page_num, self.name)
+            return None
+        resolve_failure(PAGE, f'{block_name}#{page_num}')
+        return page_data
+
+
+class HtmlListing(ListingBackend):
+    """解析列表页 HTML"""
+    name = 'html'
+
+    def first_page(self, block_url: str) -> Tuple[Optional[ForumData], int]:
+        with profile_stage('listing'):
+            response = make_request(block_url)
+            soup = BeautifulSoup(response.text, 'html.parser')
+
+        if len(soup.select("#messagetext")) > 0:
+            error_message = soup.select("#messagetext")[0].text + soup.select("#messagetext")[0].next_sibling.text
+            raise NetworkError(error_message)
+
+        last_page_num = int(_get_last_page_number(soup))
+        try:
+            with profile_stage('listing'):
+                page_data = parse_page_data(soup, ForumData(), 1)
+        except Exception as e:
+            logging.error(f'获取页面 {block_url} 数据失败: {e}')
+            page_data = None
+        return page_data, last_page_num
+
+    def page_url(self, block_url: str, page_num: int) -> str:
+        return html_page_url(block_url, page_num)
+
+    def get_url(self, url: str, page_num: int) -> ForumData:
+        return _get_page_data(url, page_num)
+
+
+class MobileApiListing(ListingBackend):
+    """
+    通过 Discuz 移动端接口 api/mobile/index.php?module=forumdisplay 获取 JSON 列表
+
+    字段直接对应主题记录，不依赖按位置对齐的选择器；每页主题数可设为远大于网页的值，减少请求次数。
+    第一页请求失败或返回的数据无法识别时，本板块回退到解析 HTML
+    """
+    name = 'mobile_api'
+
+    def __init__(self, page_size: int = 100, utc_offset_hours: float = 8):
+        self.page_size = page_size
+        self.utc_offset = int(utc_offset_hours * 3600)
+        self.fallback = HtmlListing()
+        self._use_fallback = False
+
+    def first_page(self, block_url: str) -> Tuple[Optional[ForumData], int]:
+        try:
+            page_data, total_pages = self._get(self.page_url(block_url, 1))
+        except (FatalError, BudgetExhausted):
+            raise
+        except Exception as e:
+            logging.warning(f"移动端接口获取 {block_url} 失败，回退到解析 HTML: {e}")
+            self._use_fallback = True
+            return self.fallback.first_page(block_url)
+        return page_data, total_pages
+
+    def active(self) -> ListingBackend:
+        return self.fallback if self._use_fallback else self
+
+    def page_url(self, block_url: str, page_num: int) -> str:
+        return api_page_url(block_url, page_num, self.page_size)
+
+    def get_url(self, url: str, page_num: int) -> ForumData:
+        return self._get(url)[0]
+
+    def _get(self, url: str) -> Tuple[ForumData, int]:
+        with profile_stage('listing'):
+            response = make_request(url)
+            return parse_forumdisplay(json.loads(response.text), self.page_size, self.utc_offset)
+
+
+def forum_id(block_url: str) -> str:
+    """从板块链接 forum-<fid>-<page>.html 或 forum.php?fid=<fid> 中取出 fid"""
+    match = re.search(r'forum-(\d+)-\d+\.html', block_url) or re.search(r'[?&]fid=(\d+)', block_url)
+    if not match:
+        raise ValueError(f"无法从 {block_url} 中识别板块 fid")
+    return match.group(1)
+
+
+def html_page_url(block_url: str, page_num: int) -> str:
+    return block_url if page_num == 1 else block_url.replace("-1.html", f"-{page_num}.html")
+
+
+def api_page_url(block_url: str, page_num: int, page_size: int) -> str:
+    params = {'version': 4, 'module': 'forumdisplay', 'fid': forum_id(block_url), 'page': page_num, 'tpp': page_size}
+    return urljoin(block_url, '/api/mobile/index.php?' + urlencode(params))
+
+
+def parse_forumdisplay(data: dict, page_size: int = 100, utc_offset: int = 8 * 3600) -> Tuple[ForumData, int]:
+    """
+    解析 forumdisplay 接口返回的 JSON，返回该页的数据与总页数
+
+    时间优先使用接口中的 UTC 时间戳，加上论坛时区偏移后与页面上的时间文本一致；
+    置顶主题只出现在第一页，由 ForumData 按 tid 去重，被隐藏的主题（displayorder < 0）跳过
+    """
+    variables = data.get('Variables')
+    if not isinstance(variables, dict) or 'forum_threadlist' not in variables:
+        message = data.get('Message') or {}
+        raise ApiError(message.get('messagestr') or message.get('messageval') or '接口返回的数据中没有主题列表')
+
+    page_data = ForumData()
+    for thread in variables['forum_threadlist']:
+        try:
+            if int(thread.get('displayorder') or 0) < 0:
+                continue
+            page_data.add_thread(ThreadRecord(
+                tid=int(thread['tid']),
+                uid=int(thread['authorid']),
+                title=html.unescape(thread['subject']),
+                author=thread['author'],
+                comments=parse_count(thread.get('replies', 0)),
+                views=parse_count(thread.get('views', 0)),
+                update_time=_api_time(thread, 'dblastpost', 'lastpost', utc_offset),
+                create_time=_api_time(thread, 'dbdateline', 'dateline', utc_offset)
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"跳过无法解析的主题 {thread.get('tid')}: {e}")
+
+    forum = variables.get('forum') or {}
+    per_page = parse_count(variables.get('tpp') or page_size) or page_size
+    total_pages = max(math.ceil(parse_count(forum.get('threads', 0)) / per_page), 1)
+    return page_data, total_pages
+
+
+def _api_time(thread: dict, timestamp_key: str, text_key: str, utc_offset: int) -> int:
+    """主题的时间戳，接口没有给出时解析时间文本，文本可能是带 title 的 <span>"""
+    if thread.get(timestamp_key):
+        return int(thread[timestamp_key]) + utc_offset
+    text = thread.get(text_key) or ''
+    match = re.search(r'title="([^"]+)"', text)
+    return parse_time(html.unescape(match.group(1) if match else re.sub(r'<[^>]+>', '', text)))
+
+
+LISTINGS = {listing.name: listing for listing in (HtmlListing, MobileApiListing)}
+
+
+def get_listing(name: Optional[str] = None) -> ListingBackend:
+    """
+    按名称或配置 listing.backend 返回列表页获取方式，默认解析 HTML；
+    每个板块使用各自的实例，回退状态不会影响其他板块
+    """
+    listing_config = CONFIG.get('listing') or {}
+    name = name or listing_config.get('backend', 'html')
+    if name not in LISTINGS:
+        raise ValueError(f"未知的列表获取方式: {name}，可选 {sorted(LISTINGS)}")
+    if name == MobileApiListing.name:
+        return MobileApiListing(listing_config.get('page_size', 100), listing_config.get('utc_offset_hours', 8))
+    return LISTINGS[name]()
@@ -0,0 +1,141 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# 通过 extra 传入的结构化字段，按此顺序附加在日志末尾
+STRUCTURED_FIELDS = ('tid', 'block', 'stage', 'duration')
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_lock = threading.Lock()
+
+
+def log_fields(tid=None, block: Optional[str] = None, stage: Optional[str] = None,
+               duration: Optional[float] = None) -> dict:
+    """
+    生成 logging 调用的 extra 参数，只包含提供了值的字段
+
+    用法：logging.info('...', extra=log_fields(tid=tid, stage='thread'))
+    """
+    fields = {'tid': tid, 'block': block, 'stage': stage,
+              'duration': round(duration, 3) if duration is not None else None}
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+class StructuredFormatter(logging.Formatter):
+    """在原有格式后以 key=value 附加结构化字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = ' '.join(f'{key}={getattr(record, key)}' for key in STRUCTURED_FIELDS if hasattr(record, key))
+        return f'{message} [{fields}]' if fields else message
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，便于日志文件的检索与统计"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'thread': record.threadName, 'message': record.getMessage()}
+        entry.update({key: getattr(record, key) for key in STRUCTURED_FIELDS if hasattr(record, key)})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    限制同一位置重复输出的警告与错误
+
+    同一代码位置在 interval 秒内最多输出 burst 条，其余丢弃，
+    窗口结束后的第一条日志附带被丢弃的条数。日志消息大多是已格式化的 f-string，
+    每次都带有不同的链接或 tid，因此只按代码位置计数，不区分消息内容
+    """
+
+    def __init__(self, burst: int = 10, interval: float = 60.0, level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.level = level
+        self._lock = threading.Lock()
+        # 代码位置 -> [窗口开始时间, 窗口内条数, 被丢弃条数]
+        self._windows: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f'{record.msg}（此前 {self.interval:g} 秒内同类日志被省略 {suppressed} 条）'
+        return True
+
+
+def setup_logging(config: Optional[dict] = None) -> None:
+    """
+    配置根日志器：工作线程只把日志放入队列，由后台线程写入控制台和滚动日志文件，
+    避免大量线程争用输出锁。可重复调用，后一次的配置覆盖前一次
+    """
+    global _listener
+    log_config = (config or {}).get('logging') or {}
+
+    handlers = []
+    console = logging.StreamHandler()
+    console.setFormatter(StructuredFormatter(LOG_FORMAT))
+    handlers.append(console)
+    if log_config.get('file'):
+        path = Path(log_config['file'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=log_config.get('max_bytes', 10 * 1024 * 1024),
+            backupCount=log_config.get('backup_count', 5), encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter() if log_config.get('json') else StructuredFormatter(LOG_FORMAT))
+        handlers.append(file_handler)
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    rate_limit = log_config.get('rate_limit') or {}
+    if rate_limit.get('enabled', True):
+        queue_handler.addFilter(RateLimitFilter(rate_limit.get('burst', 10), rate_limit.get('interval', 60)))
+
+    with _listener_lock:
+        shutdown_logging()
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(queue_handler)
+        root.setLevel(log_config.get('level', 'INFO'))
+        _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -1,66 +1,485 @@
+import argparse
 import concurrent.futures
+import csv
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
 
-import analyze_post_trends
-from analysis import analyze_post_quality
-from forum import main_spider
-from util import *
+# 各子命令实际需要导入的模块，重量级依赖只在对应子命令中导入
+COMMAND_IMPORTS = {
+    'crawl': ['forum'],
+    'recrawl': ['recrawl'],
+    'retry-failed': ['recrawl'],
+    'watch': ['watch'],
+    'analyze': ['pipeline'],
+    'export': ['util'],
+    'history': ['history'],
+    'reparse': ['reparse'],
+    'calibrate': ['calibrate'],
+    'search': ['search'],
+    'dedup': ['dedup'],
+    'store': ['store'],
+    'serve': ['query_service'],
+}
+# 冷启动测速时检查是否被意外导入的重量级模块
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn', 'docx', 'bs4']
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 
-def process_blocks(block_dict: Dict[str, str], download_images: bool = False) -> None:
-    """处理区块数据的主函数"""
+def process_blocks(block_dict: Dict[str, str], download_images: bool = False, analyze: bool = True,
+                   budget: Optional[dict] = None) -> None:
+    """
+    处理区块数据的主函数
+
+    budget 为 max_requests、max_bytes、max_seconds 中需要覆盖配置的预算。
+    开始前检查登录状态；遇到登录失效、被禁止或维护等致命错误时取消所有板块，
+    写入已完成的主题并保存推迟的任务后抛出 FatalError
+    """
+    from fatal import FatalError, cancel_token, preflight
+    from forum import _cancel_pending, main_spider
+    from frontier import CrawlPlan
+    from registry import TidRegistry
+    from util import CONFIG, extract_tid_from_url, parse_time, set_request_budget
+
     data_file = Path("./data.csv")
     last_crawled_data = {}
+    rows = []
 
     # 读取已爬取的数据
     if data_file.exists():
         with open(data_file, 'r', encoding='utf-8') as f:
             reader = csv.DictReader(f)
             for row in reader:
+                rows.append(row)
                 # 从链接中提取tid
                 tid = extract_tid_from_url(row['链接'])
                 if tid:
-                    last_crawled_data[tid] = row['更新时间']
+                    last_crawled_data[int(tid)] = parse_time(row['更新时间'])
 
+    # 按优先级提交主题任务，预算用尽时未执行的任务留待下次运行
+    plan = CrawlPlan.from_config(CONFIG, rows, **(budget or {}))
+    if block_dict:
+        preflight(next(iter(block_dict.values())))
+    if plan.budget:
+        set_request_budget(plan.budget)
     try:
+        # 所有板块共享同一个登记表，同一主题只下载一次，行归属配置中靠前的板块
+        registry = TidRegistry(list(block_dict))
         thread_pool_size = CONFIG['spider']['thread_pool_size']
         with concurrent.futures.ThreadPoolExecutor(max_workers=thread_pool_size) as executor:
             futures = {
-                executor.submit(main_spider, key, value, download_images, last_crawled_data): key
+                executor.submit(main_spider, key, value, download_images, last_crawled_data, registry, plan): key
                 for key, value in block_dict.items()
             }
 
             for future in concurrent.futures.as_completed(futures):
+                if future.cancelled():
+                    continue
                 block_key = futures[future]
                 try:
                     future.result()
+                except FatalError:
+                    _cancel_pending(futures)
                 except Exception as e:
                     logging.error(f"处理区块 {block_key} 时发生错误: {str(e)}")
 
+        set_request_budget(None)
+        plan.save_pending()
+        cancel_token.check()
         logging.info("所有区块处理完成")
-        # 依次执行所有分析函数
-        analyze_post_quality(data_file)
-        analyze_post_trends.analyze_post_trends(data_file)
+        from query_service import notify_refresh
+        notify_refresh(CONFIG)
+        if analyze:
+            # 数据集只加载一次，各分析报表按依赖关系并发执行
+            from pipeline import run_analysis
+            run_analysis(data_file)
 
+    except FatalError:
+        raise
     except Exception as e:
         logging.error(f"执行过程中发生错误: {str(e)}")
         raise
 
-def main():
+
+def cmd_crawl(args, config: dict) -> None:
+    """爬取所有板块"""
+    download_images = args.download_images or config['spider']['download_images']
+    if args.full:
+        config.setdefault('partial_update', {})['enabled'] = False
+    budget = {'max_requests': args.max_requests, 'max_bytes': args.max_mb and args.max_mb * 1024 * 1024,
+              'max_seconds': args.max_minutes and args.max_minutes * 60}
+    process_blocks(config['blocks'], download_images, analyze=args.analyze, budget=budget)
+
+
+def cmd_watch(args, config: dict) -> None:
+    """常驻运行，按各板块的更新频率轮询第一页，只爬取有变化的主题"""
+    from watch import watch
+
+    blocks = config['blocks']
+    if args.block:
+        unknown = set(args.block) - set(blocks)
+        if unknown:
+            raise ValueError(f"配置文件中没有板块: {sorted(unknown)}")
+        blocks = {name: url for name, url in blocks.items() if name in args.block}
+    download_images = args.download_images or config['spider']['download_images']
+    watch(blocks, download_images, once=args.once)
+
+
+def cmd_recrawl(args, config: dict) -> None:
+    """按 tid、作者 uid 或板块定向重爬"""
+    from recrawl import RecrawlTargets, parse_target_file, recrawl
+
+    targets = RecrawlTargets(set(args.tid or []), set(args.uid or []), list(args.block or []))
+    for file_path in args.file or []:
+        parse_target_file(file_path, targets)
+    if not targets:
+        raise ValueError("请通过 --tid、--uid、--block 或 --file 指定重爬目标")
+
+    download_images = args.download_images or config['spider']['download_images']
+    if args.full:
+        config.setdefault('partial_update', {})['enabled'] = False
+    recrawl(targets, download_images, force=args.force)
+
+
+def cmd_retry_failed(args, config: dict) -> None:
+    """只重试失败任务台账中的板块、列表页与文章"""
+    if args.list:
+        from ledger import get_ledger, print_tasks
+
+        ledger = get_ledger(config)
+        if ledger is None:
+            logging.error("未开启失败任务台账，请在配置中设置 ledger.enabled: true")
+            return
+        print_tasks(ledger.tasks())
+        return
+    from recrawl import retry_failed
+
+    download_images = args.download_images or config['spider']['download_images']
+    if args.full:
+        config.setdefault('partial_update', {})['enabled'] = False
+    retry_failed(download_images, include_all=args.all)
+
+
+def cmd_analyze(args, config: dict) -> None:
+    """对已爬取的数据执行全部分析"""
+    from pipeline import run_analysis
+    run_analysis(args.data, args.output_dir, args.workers, args.chunksize)
+
+
+def cmd_calibrate(args, config: dict) -> None:
+    """批量试验评分参数并评估排名质量"""
+    from calibrate import run_calibration
+    run_calibration(args.data, args.trials, args.space, args.sort, args.output, args.seed, args.workers)
+
+
+def cmd_export(args, config: dict) -> None:
+    """按板块或作者筛选导出已爬取的数据"""
+    with open(args.data, 'r', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.DictReader(f)
+                if (not args.block or row['板块'] in args.block)
+                and (not args.author or row['作者'] in args.author)]
+
+    output = open(args.output, 'w', newline='', encoding='utf-8-sig') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(rows, output, ensure_ascii=False, indent=2)
+        elif rows:
+            writer = csv.DictWriter(output, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    finally:
+        if args.output:
+            output.close()
+    logging.info(f"共导出 {len(rows)} 条数据")
+
+
+def cmd_history(args, config: dict) -> None:
+    """按 tid、作者或板块查询互动数据历史"""
+    from history import METRICS, open_store
+
+    history_config = config.get('history') or {}
+    store = open_store(history_config.get('dir', 'history'))
+    start = int(time.time()) - args.days * 86400 if args.days else None
+    rows = store.query(tids=args.tid, author=args.author, block=args.block, start=start)
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['时间', '板块', 'tid', *METRICS])
+    for timestamp, *values in rows:
+        writer.writerow([time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp)), *values])
+
+
+def cmd_reparse(args, config: dict) -> None:
+    """不联网，从页面归档重新解析数据"""
+    from reparse import reparse
+
+    before = int(time.mktime(time.strptime(args.before, '%Y-%m-%d %H:%M'))) if args.before else None
+    reparse(args.block, before, args.workers, args.data)
+
+
+def cmd_search(args, config: dict) -> None:
+    """在已爬取的小说正文中全文搜索"""
+    from search import build_from_docx, build_from_store, open_index
+
+    index = open_index((config.get('search') or {}).get('path', 'search/index.db'))
+    if args.rebuild:
+        if (config.get('output') or {}).get('store', 'docx') == 'packed':
+            from store import get_output_store
+            build_from_store(index, get_output_store(config))
+        else:
+            build_from_docx(index, args.output_dir, args.data)
+    if not args.query:
+        return
+    start_time = time.perf_counter()
+    results = index.search(' '.join(args.query), args.limit, args.block, args.author)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    for result in results:
+        print(f"{result['tid']}\t{result['title']}\t{result['author'] or ''}\t{result['snippet']}")
+    logging.info(f"共 {len(results)} 条结果，耗时 {elapsed:.1f} 毫秒")
+
+
+def cmd_dedup(args, config: dict) -> None:
+    """输出相似度超过阈值的重复文章簇"""
+    from dedup import open_index, write_report
+
+    index = open_index((config.get('dedup') or {}).get('path', 'dedup/index.db'))
+    write_report(index, args.output, args.threshold)
+
+
+def cmd_store(args, config: dict) -> None:
+    """导出、压缩打包存储或查看其统计信息"""
+    from store import PackedStore, export_docx, get_output_store
+
+    store = get_output_store(config)
+    if not isinstance(store, PackedStore):
+        logging.error("未使用打包存储，请在配置中设置 output.store: packed")
+        return
+    if args.action == 'export':
+        export_docx(store, args.output, args.tid, args.block)
+    elif args.action == 'compact':
+        ratio = args.ratio if args.ratio is not None else (config.get('output') or {}).get('compact_garbage_ratio', 0.3)
+        store.compact(ratio)
+    else:
+        for key, value in store.stats().items():
+            print(f"{key}\t{value}")
+
+
+def cmd_serve(args, config: dict) -> None:
+    """启动本地排名查询服务"""
+    from query_service import QueryService
+
+    service_config = config.get('query_service') or {}
+    service = QueryService(args.data or service_config.get('data', 'data.csv'),
+                           service_config.get('poll_interval', 10), service_config.get('settle_seconds', 30))
+    service.serve(args.host or service_config.get('host', '127.0.0.1'),
+                  args.port if args.port is not None else service_config.get('port', 8765))
+
+
+def cmd_bench(args, config: dict) -> None:
+    """测量各子命令的冷启动导入耗时，或执行热点函数的基准测试"""
+    if args.suite == 'micro':
+        run_micro_benchmarks(args)
+        return
+    probe = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        "heavy = [m for m in {heavy!r} if m in sys.modules]\n"
+        "print(elapsed, ','.join(heavy) or '无')\n"
+    )
+    print(f"{'子命令':<10}{'模块':<12}{'导入耗时(中位数)':<20}已导入的重量级模块")
+    for command, modules in COMMAND_IMPORTS.items():
+        for module in modules:
+            timings = []
+            for _ in range(args.repeat):
+                result = subprocess.run(
+                    [sys.executable, '-c', probe.format(module=module, heavy=HEAVY_MODULES)],
+                    capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+                )
+                elapsed, heavy = result.stdout.split()
+                timings.append(float(elapsed))
+            print(f"{command:<10}{module:<12}{statistics.median(timings) * 1000:>10.1f} 毫秒        {heavy}")
+
+
+def run_micro_benchmarks(args) -> None:
+    """执行基准测试并与保存的基准对比，出现性能回退时以非零状态退出"""
+    from benchmark import compare, load_results, print_report, run_benchmarks, save_results
+
+    results = run_benchmarks(args.only, args.repeat)
+    if args.output:
+        save_results(results, args.output)
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print_report(results)
+        logging.info(f"基准结果已保存到 {args.baseline}")
+        return
+    if not Path(args.baseline).exists():
+        print_report(results)
+        logging.info(f"没有找到基准结果 {args.baseline}，可使用 --save-baseline 保存")
+        return
+
+    comparison = compare(results, load_results(args.baseline), args.threshold)
+    print_report(results, comparison)
+    regressed = [row['name'] for row in comparison if row['regressed']]
+    if regressed:
+        logging.error(f"以下基准测试比基准慢超过 {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='荆棘鸟论坛爬虫与数据分析')
+    parser.add_argument('--config', default='config.yaml', help='配置文件路径')
+    parser.add_argument('--profile', action='store_true', help='开启性能分析（覆盖配置文件）')
+    parser.add_argument('--profile-mode', choices=['sampling', 'cprofile'], help='性能分析模式（覆盖配置文件）')
+    subparsers = parser.add_subparsers(dest='command')
+
+    crawl = subparsers.add_parser('crawl', help='爬取所有板块')
+    crawl.add_argument('--download-images', action='store_true', help='下载图片（覆盖配置文件）')
+    crawl.add_argument('--analyze', action='store_true', help='爬取完成后执行分析')
+    crawl.add_argument('--full', action='store_true', help='完整重新爬取有更新的文章，不做增量更新')
+    crawl.add_argument('--max-requests', type=int, help='本次最多发送的请求数（覆盖配置文件）')
+    crawl.add_argument('--max-mb', type=float, help='本次最多下载的流量，单位 MB（覆盖配置文件）')
+    crawl.add_argument('--max-minutes', type=float, help='本次爬取的最长时间，单位分钟（覆盖配置文件）')
+    crawl.set_defaults(func=cmd_crawl)
+
+    watch = subparsers.add_parser('watch', help='常驻运行，自适应轮询各板块并只爬取有变化的主题')
+    watch.add_argument('--block', nargs='*', help='只监视这些板块')
+    watch.add_argument('--once', action='store_true', help='每个板块只轮询一次后退出')
+    watch.add_argument('--download-images', action='store_true', help='下载图片（覆盖配置文件）')
+    watch.set_defaults(func=cmd_watch)
+
+    recrawl = subparsers.add_parser('recrawl', help='按 tid、作者 uid 或板块定向重爬')
+    recrawl.add_argument('--tid', nargs='*', help='要重爬的主题 tid')
+    recrawl.add_argument('--uid', nargs='*', help='重爬这些作者已存储的全部主题')
+    recrawl.add_argument('--block', nargs='*', help='只爬取这些板块')
+    recrawl.add_argument('--file', nargs='*', help='从文件读取重爬目标，每行 tid:123、uid:456 或 block:板块名')
+    recrawl.add_argument('--force', action='store_true', help='爬取板块时忽略已存储的更新时间')
+    recrawl.add_argument('--full', action='store_true', help='完整重新爬取文章，不做增量更新')
+    recrawl.add_argument('--download-images', action='store_true', help='下载图片（覆盖配置文件）')
+    recrawl.set_defaults(func=cmd_recrawl)
+
+    retry_failed = subparsers.add_parser('retry-failed', help='只重试失败任务台账中的列表页与文章')
+    retry_failed.add_argument('--all', action='store_true', help='忽略退避时间与最大失败次数，重试全部失败任务')
+    retry_failed.add_argument('--list', action='store_true', help='只列出台账中的失败任务')
+    retry_failed.add_argument('--full', action='store_true', help='完整重新爬取文章，不做增量更新')
+    retry_failed.add_argument('--download-images', action='store_true', help='下载图片（覆盖配置文件）')
+    retry_failed.set_defaults(func=cmd_retry_failed)
+
+    analyze = subparsers.add_parser('analyze', help='分析已爬取的数据')
+    analyze.add_argument('--data', default='data.csv', help='数据文件路径')
+    analyze.add_argument('--output-dir', default='分析报告', help='报告输出目录')
+    analyze.add_argument('--workers', type=int, default=None, help='并发执行的分析节点数')
+    analyze.add_argument('--chunksize', type=int, default=None, help='按块读取数据集，每块的行数')
+    analyze.set_defaults(func=cmd_analyze)
+
+    calibrate = subparsers.add_parser('calibrate', help='批量试验评分参数并评估排名质量')
+    calibrate.add_argument('--data', default='data.csv', help='数据文件路径')
+    calibrate.add_argument('--trials', type=int, default=1000, help='随机采样的参数组数')
+    calibrate.add_argument('--space', help='参数空间 YAML 文件，grid 为网格取值，random 为采样范围')
+    calibrate.add_argument('--sort', help='结果按该指标列降序排列，如 前10名30天内占比')
+    calibrate.add_argument('--seed', type=int, default=0, help='随机采样种子')
+    calibrate.add_argument('--workers', type=int, default=None, help='计算进程数')
+    calibrate.add_argument('-o', '--output', default='分析报告/权重校准.csv', help='结果文件')
+    calibrate.set_defaults(func=cmd_calibrate)
+
+    export = subparsers.add_parser('export', help='导出已爬取的数据')
+    export.add_argument('--data', default='data.csv', help='数据文件路径')
+    export.add_argument('--block', nargs='*', help='只导出指定板块')
+    export.add_argument('--author', nargs='*', help='只导出指定作者')
+    export.add_argument('--format', choices=['csv', 'json'], default='csv', help='导出格式')
+    export.add_argument('-o', '--output', help='输出文件，默认输出到标准输出')
+    export.set_defaults(func=cmd_export)
+
+    history = subparsers.add_parser('history', help='查询互动数据历史')
+    history.add_argument('--tid', nargs='*', type=int, help='按 tid 查询')
+    history.add_argument('--author', help='按作者查询')
+    history.add_argument('--block', help='按板块查询')
+    history.add_argument('--days', type=int, help='只查询最近若干天')
+    history.set_defaults(func=cmd_history)
+
+    reparse = subparsers.add_parser('reparse', help='不联网，从页面归档重新解析数据')
+    reparse.add_argument('--block', nargs='*', help='只重新解析这些板块')
+    reparse.add_argument('--before', help='只使用该时间之前抓取的页面，格式 "2024-01-01 00:00"')
+    reparse.add_argument('--workers', type=int, default=None, help='解析进程数')
+    reparse.add_argument('--data', default='data.csv', help='数据文件路径')
+    reparse.set_defaults(func=cmd_reparse)
+
+    search = subparsers.add_parser('search', help='在已爬取的小说正文中全文搜索')
+    search.add_argument('query', nargs='*', help='搜索词，多个词需同时出现')
+    search.add_argument('--block', help='只搜索指定板块')
+    search.add_argument('--author', help='只搜索指定作者')
+    search.add_argument('--limit', type=int, default=20, help='最多返回的结果数')
+    search.add_argument('--rebuild', action='store_true', help='先从已保存的文档或打包存储重建索引')
+    search.add_argument('--output-dir', default='小说输出', help='重建索引时读取的文档目录')
+    search.add_argument('--data', default='data.csv', help='重建索引时用于对应 tid 的数据文件')
+    search.set_defaults(func=cmd_search)
+
+    dedup = subparsers.add_parser('dedup', help='输出重复文章簇')
+    dedup.add_argument('--threshold', type=float, default=0.8, help='全文相似度阈值')
+    dedup.add_argument('-o', '--output', default='分析报告/重复文章.csv', help='结果文件')
+    dedup.set_defaults(func=cmd_dedup)
+
+    store = subparsers.add_parser('store', help='导出或压缩打包存储的文章正文')
+    store.add_argument('action', choices=['export', 'compact', 'stats'],
+                       help='export 导出为 docx，compact 压缩分段，stats 查看统计信息')
+    store.add_argument('--tid', nargs='*', type=int, help='只导出这些主题')
+    store.add_argument('--block', nargs='*', help='只导出这些板块')
+    store.add_argument('--ratio', type=float, help='压缩失效数据占比不低于该值的分段（覆盖配置文件）')
+    store.add_argument('-o', '--output', default='导出', help='导出目录')
+    store.set_defaults(func=cmd_store)
+
+    serve = subparsers.add_parser('serve', help='启动本地排名查询服务，以 JSON 应答排名查询')
+    serve.add_argument('--host', help='监听地址（覆盖配置文件）')
+    serve.add_argument('--port', type=int, help='监听端口（覆盖配置文件）')
+    serve.add_argument('--data', help='数据文件路径（覆盖配置文件）')
+    serve.set_defaults(func=cmd_serve)
+
+    bench = subparsers.add_parser('bench', help='测量各子命令的冷启动耗时或执行基准测试')
+    bench.add_argument('--suite', choices=['startup', 'micro'], default='startup',
+                       help='startup 测量冷启动导入耗时，micro 执行热点函数的基准测试')
+    bench.add_argument('--repeat', type=int, default=5, help='每项的测量次数')
+    bench.add_argument('--only', nargs='*', help='只执行指定的基准测试')
+    bench.add_argument('--baseline', default='benchmarks/baseline.json', help='基准结果文件')
+    bench.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基准')
+    bench.add_argument('--threshold', type=float, default=0.2, help='中位数比基准慢超过该比例视为回退')
+    bench.add_argument('-o', '--output', help='本次结果保存为 JSON 文件')
+    bench.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    from fatal import FatalError
+    from logsetup import setup_logging
+    from profiling import start_profiling, stop_profiling
+    from util import init_config
+
+    args = build_parser().parse_args(argv)
+    setup_logging()
     try:
-        config = CONFIG['spider']
-        blocks = CONFIG['blocks']
-        process_blocks(blocks, config['download_images'])
+        config = init_config(args.config)
+        setup_logging(config)
+        if args.profile or args.profile_mode or (config.get('profiling') or {}).get('enabled'):
+            start_profiling(config, args.profile_mode)
+        if args.command is None:
+            # 未指定子命令时保持原有行为：爬取全部板块后执行分析
+            process_blocks(config['blocks'], config['spider']['download_images'])
+        else:
+            args.func(args, config)
+    except FatalError as e:
+        # 登录失效、被禁止与维护分别以不同的状态退出，便于定时任务区分处理
+        logging.critical(f"{e.description}，已完成的数据已写入，程序以状态 {e.exit_code} 退出: {e}")
+        sys.exit(e.exit_code)
     except Exception as e:
         logging.error(f"程序执行失败: {str(e)}")
         raise
+    finally:
+        stop_profiling()
+
 
 if __name__ == '__main__':
     main()
-
-
-
@@ -1,16 +1,14 @@
-import os.path
 import re
-from bs4 import BeautifulSoup
-from decode import decode_base64_in_js
+from fetchers import fetch_thread_page, get_fetcher, parse_thread_page
+from frontier import BudgetExhausted
+from ledger import THREAD, record_failure, resolve_failure
+from logsetup import log_fields, setup_logging
+from profiling import record_thread_timing
+from search import index_thread
+from store import ThreadContent, get_output_store
+from text_extract import iter_paragraphs
+from thread_state import ThreadState, fingerprint, open_state_store
 from util import *
-from docx import Document
-from docx.shared import Inches, RGBColor
-from docx.oxml.ns import qn
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 
 
 
@@ -35,138 +33,230 @@ def get_last_page_num(soup):
     return int(last_page_tag.text.replace(" ", "").replace("/", "").replace("页", "")) if last_page_tag else 1
 
 
-def process_tags(t_f, document, download_images):
+def process_tags(t_f, content, download_images, texts=None):
     """
-    处理标签并按顺序添加文本和图片到文档
+    处理标签并按顺序添加文本和图片到正文，传入 texts 时同时收集段落文本
+    """
+    return process_items(iter_paragraphs(t_f), content, download_images, texts)
+
+
+def process_items(items, content, download_images, texts=None):
+    """
+    按顺序将 iter_paragraphs 返回的 (节点, 文本) 添加到正文，返回字数
     """
     word_count = 0  # 添加字数计数器
-    for tags in t_f:
-        temp_text = ''
-        for tag in tags:
-            if tag.name == 'script':
-                continue
-
-            # 清理文本中的多余换行符和空白字符
-            current_text = tag.text.strip()
-            current_text = re.sub(r'\s+', ' ', current_text)  # 将多个空白字符替换为单个空格
-
-            # 添加处理后的文本
-            temp_text += current_text
-
-            # 如果累积了文本，先添加到文档中
-            if temp_text.strip():
-                # 移除不合法的XML字符
-                clean_text = ''.join(char for char in temp_text.strip() if ord(char) >= 32 or char in '\n\r\t')
-                document.add_paragraph(clean_text)
-                word_count += len(clean_text)  # 统计字数
-                temp_text = ''
-
-            # 处理图片
-            if download_images:
-                if hasattr(tag, 'find_all'):
-                    for img in tag.find_all('img'):
-                        try:
-                            img_url = 'https://www.jingjiniao.info/' + img['file']
-                            image_stream = download_image(img_url)
-                            if image_stream:
-                                pic = document.add_picture(image_stream)
-                                # 获取图片原始宽高比
-                                aspect_ratio = pic.height / pic.width
-                                # 设置最大宽度为页面宽度的80%
-                                max_width = Inches(6)  # A4纸宽度约为8.27英寸
-                                if pic.width > max_width:
-                                    pic.width = max_width
-                                    pic.height = int(pic.width * aspect_ratio)
-                        except:
-                            pass
+    for tag, clean_text in items:
+        # 添加已清理空白与控制字符的文本
+        if clean_text:
+            content.add_paragraph(clean_text)
+            word_count += len(clean_text)  # 统计字数
+            if texts is not None:
+                texts.append(clean_text)
+
+        # 处理图片
+        if download_images:
+            if hasattr(tag, 'find_all'):
+                for img in tag.find_all('img'):
+                    try:
+                        img_url = 'https://www.jingjiniao.info/' + img['file']
+                        image_stream = download_image(img_url)
+                        if image_stream:
+                            content.add_image(image_stream)
+                    except:
+                        pass
 
     return word_count  # 返回该部分的字数统计
 
 
-def thread_spider(thread_url, block_name, download_images):
+def page_url(thread_url, page_num):
+    """将帖子链接中的页码替换为指定页，链接中没有页码时返回 None"""
+    return re.sub(r'page=\d+', f'page={page_num}', thread_url) if re.search(r'page=\d+', thread_url) else None
+
+
+def _state_store():
+    """按配置返回文章状态库，未开启增量更新时返回 None"""
+    partial_config = CONFIG.get('partial_update') or {}
+    if not partial_config.get('enabled'):
+        return None
+    return open_state_store(partial_config.get('path', 'thread_state/state.db'))
+
+
+def _save_state(store, tid, pages, first_texts, last_texts, words, path):
+    if store is None or tid is None:
+        return
+    try:
+        store.put(ThreadState(int(tid), pages, len(first_texts), fingerprint(first_texts),
+                              len(last_texts), fingerprint(last_texts), words, path))
+    except Exception as e:
+        logging.error(f"保存文章 {tid} 的增量更新状态失败: {e}")
+
+
+def _update_thread(thread_url, block_name, download_images, state, store, author=None):
     """
-    爬取具体的文章并存入文档中
+    增量更新已完整保存过的文章：只获取第一页、上次的最后一页与新增的页面，将新增段落追加到已保存的正文
+
+    第一页或上次最后一页原有的段落发生变化、页数减少、标题改变时返回 None，由调用方完整重新爬取；
+    中间页面的修改无法发现，需要时使用完整爬取
+
+    Returns:
+        ((推荐数, 收藏数, 总字数), 获取的页数) 或 None
     """
+    from dedup import record_thread
+
+    tid = extract_tid_from_url(thread_url)
+    if page_url(thread_url, 1) is None:
+        return None
+    soup = fetch_thread_page(make_request, thread_url)
+    title, recommend_num, favorite_num = extract_title_and_counts(soup)
+    title = clean_title(title)
+    pages = get_last_page_num(soup)
+    output = get_output_store()
+    path = output.location(tid, block_name, title)
+    if pages < state.pages or path != state.path or not output.exists(tid, block_name, title):
+        return None
+
+    first_texts = [text for _, text in parse_thread_page(soup)]
+    if fingerprint(first_texts[:state.first_items]) != state.first_fingerprint or len(first_texts) < state.first_items:
+        return None
+    fetched = 1
+
+    # 上次只有一页时，第一页就是上次的最后一页
+    if state.pages == 1:
+        last_items = parse_thread_page(soup)
+    else:
+        last_items = parse_thread_page(fetch_thread_page(make_request, page_url(thread_url, state.pages)))
+        fetched += 1
+    last_texts = [text for _, text in last_items]
+    if fingerprint(last_texts[:state.last_items]) != state.last_fingerprint or len(last_texts) < state.last_items:
+        return None
+
+    new_items = last_items[state.last_items:]
+    for page_num in range(state.pages + 1, pages + 1):
+        last_items = parse_thread_page(fetch_thread_page(make_request, page_url(thread_url, page_num)))
+        last_texts = [text for _, text in last_items]
+        new_items.extend(last_items)
+        fetched += 1
+
+    words = state.words
+    if new_items:
+        old_texts = output.texts(tid, block_name, title)
+        content = ThreadContent()
+        new_texts = []
+        words += process_items(new_items, content, download_images, new_texts)
+        output.append(tid, block_name, title, author, content)
+        text = '\n'.join(old_texts + new_texts)
+        index_thread(tid, title, text, block_name, author)
+        record_thread(tid, text, '\n'.join(text for text in first_texts if text), title, author, block_name)
+        logging.info(f'文章《{title}》增量更新，新增 {len(new_texts)} 段，获取 {fetched} 页',
+                     extra=log_fields(tid=tid, block=block_name, stage='partial_update'))
+    _save_state(store, tid, pages, first_texts, last_texts, words, path)
+    return (recommend_num, favorite_num, words), fetched
+
+
+def thread_spider(thread_url, block_name, download_images, fetch=None, author=None):
+    """
+    爬取具体的文章并存入文档中，并按配置写入全文索引与重复检测签名
+
+    fetch 为获取页面的函数，默认联网请求；重新解析时传入从页面归档读取的函数。
+    联网爬取失败时记入失败任务台账并返回 (0, 0, 0)，成功后从台账中移除。
+    正文按配置 output.store 保存为 docx 或写入打包存储；
+    开启增量更新时，已完整保存过的文章只下载新增的页面并追加到已保存的正文
+    """
+    # 重复检测依赖 numpy，只在爬取文章时导入，不影响其他子命令的启动
+    from dedup import find_duplicate, record_thread
+
+    # 重新解析时从归档读取页面，归档中的页面不一定比上次保存的新，总是完整解析
+    store = _state_store() if fetch is None else None
+    online = fetch is None
+    fetch = fetch or make_request
+    tid = extract_tid_from_url(thread_url)
+    texts = []
+    head_text = None
     start_time = time.time()
-    document = Document()
-    
-    # 设置默认字体为宋体
-    document.styles['Normal'].font.name = '宋体'
-    document.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+    content = ThreadContent()
     
     page_num = 1
     total_word_count = 0
     
     try:
-        while True:
-            response = make_request(thread_url)
-            if response is None:
-                raise Exception('请求超时')
-            soup = BeautifulSoup(response.text, 'html.parser')
+        state = store.get(int(tid)) if store is not None and tid is not None else None
+        if state is not None:
+            updated = _update_thread(thread_url, block_name, download_images, state, store, author)
+            if updated is not None:
+                result, page_num = updated
+                if online:
+                    resolve_failure(THREAD, tid)
+                return result
+            logging.info(f'文章 {tid} 的已有内容发生变化，完整重新爬取',
+                         extra=log_fields(tid=tid, block=block_name, stage='partial_update'))
 
-            if len(soup.select("#messagetext")) > 0:
-                error_message = soup.select("#messagetext")[0].text + soup.select("#messagetext")[0].next_sibling.text
-                raise Exception(error_message)
-
-            if page_num == 1:
+        for page in get_fetcher().iter_pages(thread_url, fetch):
+            soup, items = page.soup, page.items
+            if page.page_num == 1:
                 title, recommend_num, favorite_num = extract_title_and_counts(soup)
                 title = clean_title(title)
 
-            t_f = soup.select(".t_f div")
-            if len(soup.select(".t_f script")) == 2:
-                base64_js_str = soup.select(".t_f script")[1].text
-                wmsj_enmessage_str = decode_base64_in_js(base64_js_str)
-                wmsj_enmessageTag = BeautifulSoup(wmsj_enmessage_str, 'html.parser')
-                t_f.insert(0, wmsj_enmessageTag)
-            soup.find('div', class_='typeoption')
-            for tags in t_f:
-                for tag in tags.find_all(style='display:none') + tags.find_all(class_='jammer') \
-                           + tags.find_all(['br', 'a', 'i']) + tags.find_all('div', class_='quote'):
-                    tag.decompose()
             # 下载封面图片
-            if download_images:
+            if download_images and soup is not None:
                 img_tags = soup.select(".typeoption img")
                 for img in img_tags:
                     try:
                         img_url = 'https://www.jingjiniao.info/' + img['src']
                         image_stream = download_image(img_url)
                         if image_stream:
-                            pic = document.add_picture(image_stream)
-                            # 获取图片原始宽高比
-                            aspect_ratio = pic.height / pic.width
-                            # 设置最大宽度为页面宽度的80%
-                            max_width = Inches(6)  # A4纸宽度约为8.27英寸
-                            if pic.width > max_width:
-                                pic.width = max_width
-                                pic.height = int(pic.width * aspect_ratio)
+                            content.add_image(image_stream)
                     except:
                         pass
             # 获取文章内容
-            page_word_count = process_tags(t_f, document, download_images)  # 获取每页的字数
+            page_word_count = process_items(items, content, download_images, texts)  # 获取每页的字数
             total_word_count += page_word_count  # 累加总字数
-            nextLinkTag = soup.select('.nxt')
-            if nextLinkTag:
-                thread_url = nextLinkTag[0].attrs['href']
-                page_num += 1
-            else:
-                break
-
-        # 在保存文档前创建目录
-        save_dir = os.path.join("./小说输出/", block_name)
-        os.makedirs(save_dir, exist_ok=True)
+            # 记录首末页的段落，用于下次增量更新；打印视图没有分页，不记录
+            last_texts = [text for _, text in items] if page.page_num is not None else None
+            if page.page_num == 1:
+                first_texts = last_texts
+                head_text = '\n'.join(texts)
+                # 多页文章的首页与已完整爬取的文章重复时，不再下载后续页面
+                duplicate = find_duplicate(tid, head_text, title, author, block_name) if page.has_more else None
+                if duplicate:
+                    logging.info(f'文章《{title}》与 tid {duplicate["tid"]}《{duplicate["title"]}》重复，跳过后续页面')
+                    if online:
+                        resolve_failure(THREAD, tid)
+                    return recommend_num, favorite_num, duplicate['words']
+            page_num = page.page_num or page_num + 1
 
-        document.save(os.path.join(save_dir, clean_title(title) + ".docx"))
+        path = get_output_store().save(tid, block_name, title, author, content)
+        text = '\n'.join(texts)
+        index_thread(tid, title, text, block_name, author)
+        record_thread(tid, text, head_text, title, author, block_name)
+        if last_texts is not None:
+            _save_state(store, tid, page_num, first_texts, last_texts, total_word_count, path)
+        elif store is not None and tid is not None:
+            store.remove(int(tid))
 
+        if online:
+            resolve_failure(THREAD, tid)
         end_time = time.time()
-        logging.info(f'文章《{title}》爬取完成，总字数：{total_word_count}，总耗时: {end_time - start_time:.2f}秒')
+        logging.info(f'文章《{title}》爬取完成，总字数：{total_word_count}，总耗时: {end_time - start_time:.2f}秒',
+                     extra=log_fields(tid=tid, block=block_name, stage='thread', duration=end_time - start_time))
 
+    except FatalError:
+        raise
+    except BudgetExhausted:
+        # 由 frontier 推迟到下次运行，不是失败
+        logging.info(f'请求预算用尽，{thread_url} 留待下次运行', extra=log_fields(tid=tid, block=block_name, stage='thread'))
+        return 0, 0, 0
     except Exception as e:
-        logging.error(f'爬取 {thread_url}失败。原因： {e}')
+        logging.error(f'爬取 {thread_url}失败。原因： {e}', extra=log_fields(tid=tid, block=block_name, stage='thread'))
+        if online and tid is not None:
+            record_failure(THREAD, tid, block_name, thread_url, e)
         return 0, 0, 0  # 添加total_word_count的返回值
+    finally:
+        record_thread_timing(tid, page_num, time.time() - start_time)
 
     return recommend_num, favorite_num, total_word_count
 
 
 if __name__ == '__main__':
+    setup_logging(init_config())
     recommend_num, favorite_num, total_word_count = thread_spider('https://www.jingjiniao.info/forum.php?mod=viewthread&tid=54677&page=1&authorid=18199', 'test', False)
     print(f'点赞数: {recommend_num}, 收藏数: {favorite_num}, 总字数: {total_word_count}')
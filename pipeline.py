@@ -0,0 +1,116 @@
+import concurrent.futures
+import logging
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from analysis import write_post_ranking, evaluate_ranking_quality, analyze_engagement_velocity
+from analysis_backend import AnalysisBackend, get_backend
+from analyze_author import analyze_author
+from analyze_post_trends import analyze_post_trends
+from dataset import load_dataset
+from logsetup import log_fields
+from profiling import profile_stage
+from util import CONFIG
+
+
+@dataclass
+class AnalysisNode:
+    """分析节点：func 按 inputs 的顺序接收上游节点的结果，返回值以 name 保存"""
+    name: str
+    func: Callable[..., Any]
+    inputs: List[str] = field(default_factory=list)
+
+
+def build_analysis_nodes(output_dir: Path, backend: Optional[AnalysisBackend] = None) -> List[AnalysisNode]:
+    """声明默认的分析报表及其依赖关系，评分、作者汇总与趋势统计由 backend 计算，默认按配置选择"""
+    backend = backend or get_backend()
+    nodes = [
+        AnalysisNode('scored', backend.score_posts, ['dataset']),
+        AnalysisNode('ranking', lambda scored: write_post_ranking(scored, output_dir), ['scored']),
+        AnalysisNode('author', lambda scored: analyze_author(scored, output_dir, backend), ['scored']),
+        AnalysisNode('trends', lambda dataset: analyze_post_trends(dataset, output_dir, backend), ['dataset']),
+        AnalysisNode('ranking_quality', evaluate_ranking_quality, ['ranking']),
+    ]
+
+    # 有互动数据历史时计算增速
+    history_dir = (CONFIG.get('history') or {}).get('dir', 'history')
+    if (Path(history_dir) / 'engagement.idx').exists():
+        nodes.append(AnalysisNode(
+            'velocity', lambda dataset: analyze_engagement_velocity(dataset, output_dir, history_dir), ['dataset']
+        ))
+    return nodes
+
+
+def run_pipeline(nodes: List[AnalysisNode], initial: Optional[Dict[str, Any]] = None,
+                 max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    按依赖关系执行分析节点，互不依赖的节点并发执行
+
+    某个节点失败时只记录错误并跳过依赖它的节点，其余节点照常执行
+    """
+    logger = logging.getLogger(__name__)
+    results = dict(initial or {})
+    pending = {node.name: node for node in nodes}
+    failed = set()
+
+    known = set(results) | set(pending)
+    for node in nodes:
+        missing = [name for name in node.inputs if name not in known]
+        if missing:
+            raise ValueError(f"分析节点 {node.name} 依赖未定义的输入: {missing}")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while pending or running:
+            # 跳过上游失败的节点
+            for name, node in list(pending.items()):
+                if any(i in failed for i in node.inputs):
+                    logger.error(f"分析节点 {name} 的上游失败，已跳过")
+                    failed.add(name)
+                    del pending[name]
+
+            # 提交所有输入已就绪的节点
+            for name, node in list(pending.items()):
+                if all(i in results for i in node.inputs):
+                    del pending[name]
+                    args = [results[i] for i in node.inputs]
+                    running[executor.submit(_run_node, node, args)] = node
+
+            if not running:
+                if pending:
+                    raise ValueError(f"分析节点存在循环依赖: {sorted(pending)}")
+                break
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    results[node.name] = future.result()
+                except Exception as e:
+                    logger.error(f"分析节点 {node.name} 执行失败: {e}", exc_info=True)
+                    failed.add(node.name)
+
+    return results
+
+
+def _run_node(node: AnalysisNode, args: list) -> Any:
+    start_time = time.time()
+    with profile_stage(f'analysis:{node.name}'):
+        result = node.func(*args)
+    duration = time.time() - start_time
+    logging.info(f"分析节点 {node.name} 完成，耗时: {duration:.2f}秒",
+                 extra=log_fields(stage=f'analysis:{node.name}', duration=duration))
+    return result
+
+
+def run_analysis(csv_path: str = "data.csv", output_dir: str = '分析报告',
+                 max_workers: Optional[int] = None, chunksize: Optional[int] = None) -> Dict[str, Any]:
+    """加载一次数据集并执行全部分析报表，chunksize 指定时按块读取数据集"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(exist_ok=True)
+
+    with profile_stage('analysis:load_dataset'):
+        dataset = load_dataset(csv_path, chunksize=chunksize)
+    return run_pipeline(build_analysis_nodes(output_dir), {'dataset': dataset}, max_workers)
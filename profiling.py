@@ -0,0 +1,176 @@
+import contextlib
+import csv
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 未开启性能分析时 profile_stage 返回的空上下文，几乎没有开销
+_NULL_STAGE = contextlib.nullcontext()
+# 当前的性能分析器，由 start_profiling 设置
+_profiler: Optional['Profiler'] = None
+
+
+class Profiler:
+    """
+    按阶段统计耗时的性能分析器
+
+    - sampling 模式：后台线程定时采样各线程的调用栈，按所在阶段生成火焰图使用的折叠栈
+    - cprofile 模式：每个线程最外层的阶段用 cProfile 记录，按阶段汇总为 .prof 文件
+    两种模式都会记录各阶段的耗时和最慢的主题
+    """
+
+    def __init__(self, output_dir: str = 'profile', mode: str = 'sampling', interval: float = 0.005,
+                 top_n: int = 20):
+        if mode not in ('sampling', 'cprofile'):
+            raise ValueError(f"未知的性能分析模式: {mode}")
+        self.output_dir = Path(output_dir) / time.strftime('%Y%m%d-%H%M%S')
+        self.mode = mode
+        self.interval = interval
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._stages: Dict[int, List[str]] = {}
+        self._durations: Dict[str, List[float]] = {}
+        self._threads: List[tuple] = []
+        self._stacks: Counter = Counter()
+        self._profiles: Dict[str, pstats.Stats] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample_loop, name='profiler-sampler', daemon=True)
+            self._sampler.start()
+
+    def stop(self) -> Path:
+        """停止采样并写出全部结果，返回结果目录"""
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._write_stages()
+        self._write_threads()
+        if self.mode == 'sampling':
+            self._write_folded()
+        else:
+            for name, stats in self._profiles.items():
+                stats.dump_stats(str(self.output_dir / f"{name.replace(':', '_')}.prof"))
+        return self.output_dir
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        ident = threading.get_ident()
+        with self._lock:
+            stack = self._stages.setdefault(ident, [])
+            stack.append(name)
+            outermost = len(stack) == 1
+        profile = self._enable_profile() if self.mode == 'cprofile' and outermost else None
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if profile is not None:
+                profile.disable()
+            with self._lock:
+                stack.pop()
+                if not stack:
+                    del self._stages[ident]
+                self._durations.setdefault(name, []).append(elapsed)
+                if profile is not None:
+                    if name in self._profiles:
+                        self._profiles[name].add(profile)
+                    else:
+                        self._profiles[name] = pstats.Stats(profile)
+
+    def _enable_profile(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # 同一时间只能有一个 cProfile 生效的解释器版本上跳过本阶段
+            logging.debug(f"无法启用 cProfile: {e}")
+            return None
+        return profile
+
+    def record_thread(self, tid, pages: int, seconds: float) -> None:
+        with self._lock:
+            self._threads.append((seconds, tid, pages))
+
+    def _sample_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = {ident: list(stack) for ident, stack in self._stages.items()}
+            for ident, stack in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                calls = []
+                while frame is not None and len(calls) < 128:
+                    code = frame.f_code
+                    calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self._stacks[';'.join(stack + calls[::-1])] += 1
+
+    def _write_stages(self) -> None:
+        with open(self.output_dir / 'stages.csv', 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['阶段', '次数', '总耗时(秒)', '平均耗时(秒)', '最长耗时(秒)'])
+            for name, durations in sorted(self._durations.items(), key=lambda item: -sum(item[1])):
+                writer.writerow([name, len(durations), f"{sum(durations):.3f}",
+                                 f"{sum(durations) / len(durations):.3f}", f"{max(durations):.3f}"])
+
+    def _write_threads(self) -> None:
+        with open(self.output_dir / 'slowest_threads.csv', 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['tid', '页数', '耗时(秒)'])
+            for seconds, tid, pages in sorted(self._threads, key=lambda item: -item[0])[:self.top_n]:
+                writer.writerow([tid, pages, f"{seconds:.3f}"])
+
+    def _write_folded(self) -> None:
+        """每行一个折叠栈及其采样次数，可直接用 flamegraph.pl 或 speedscope 打开"""
+        with open(self.output_dir / 'stacks.folded', 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_stage(name: str):
+    """标记一个阶段，未开启性能分析时不做任何事"""
+    profiler = _profiler
+    return profiler.stage(name) if profiler is not None else _NULL_STAGE
+
+
+def record_thread_timing(tid, pages: int, seconds: float) -> None:
+    """记录一篇文章的页数与耗时，用于输出最慢的主题"""
+    profiler = _profiler
+    if profiler is not None:
+        profiler.record_thread(tid, pages, seconds)
+
+
+def start_profiling(config: dict, mode: Optional[str] = None) -> Profiler:
+    """按配置开启性能分析，mode 可覆盖配置中的模式"""
+    global _profiler
+    profiling_config = config.get('profiling') or {}
+    _profiler = Profiler(profiling_config.get('output_dir', 'profile'), mode or profiling_config.get('mode', 'sampling'),
+                         profiling_config.get('interval', 0.005), profiling_config.get('top_n', 20))
+    _profiler.start()
+    logging.info(f"已开启性能分析，模式: {_profiler.mode}")
+    return _profiler
+
+
+def stop_profiling() -> Optional[Path]:
+    """停止性能分析并写出结果"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    output_dir = profiler.stop()
+    logging.info(f"性能分析结果已保存到 {output_dir}")
+    return output_dir
@@ -0,0 +1,254 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+# 返回的文章字段，计数以整数、时间以论坛时间文本输出
+POST_FIELDS = ['标题', '作者', '板块', '字数', '浏览数', '点赞数', '收藏数', '评论数', '发表时间', '更新时间', '链接']
+AUTHOR_FIELDS = ['文章数量', '平均文章评分', '总字数', '总浏览数', '总点赞数', '总收藏数', '质量稳定性', '作者评分']
+
+
+@dataclass
+class RankingViews:
+    """
+    一次加载得到的排名视图，构建后只读，刷新时整体替换
+
+    posts 按综合评分从高到低排列，各视图保存 posts 中的下标，同样按评分排列
+    """
+    posts: List[dict] = field(default_factory=list)
+    by_tid: Dict[int, int] = field(default_factory=dict)
+    by_block: Dict[str, List[int]] = field(default_factory=dict)
+    by_author: Dict[str, List[int]] = field(default_factory=dict)
+    by_month: Dict[str, List[int]] = field(default_factory=dict)
+    by_block_month: Dict[Tuple[str, str], List[int]] = field(default_factory=dict)
+    # 按作者评分从高到低排列的作者汇总
+    authors: List[dict] = field(default_factory=list)
+    author_index: Dict[str, int] = field(default_factory=dict)
+    source_mtime: float = 0.0
+    source_size: int = 0
+    loaded_at: float = 0.0
+
+    def top(self, k: int = 20, block: Optional[str] = None, author: Optional[str] = None,
+            month: Optional[str] = None) -> List[dict]:
+        """按条件筛选评分最高的 k 篇文章，从最窄的视图开始扫描，其余条件逐条过滤"""
+        if author is not None:
+            candidates = self.by_author.get(author, [])
+        elif block is not None and month is not None:
+            candidates = self.by_block_month.get((block, month), [])
+        elif block is not None:
+            candidates = self.by_block.get(block, [])
+        elif month is not None:
+            candidates = self.by_month.get(month, [])
+        else:
+            candidates = range(len(self.posts))
+        results = []
+        for index in candidates:
+            post = self.posts[index]
+            if (block is not None and post['板块'] != block) or (month is not None and post['月份'] != month):
+                continue
+            results.append(post)
+            if len(results) >= k:
+                break
+        return results
+
+
+def build_views(csv_path: str = 'data.csv') -> RankingViews:
+    """读取数据集并按分析报表的方式评分，构建按板块、作者、月份的排名视图"""
+    from analysis_backend import get_backend
+    from dataset import load_dataset
+    from util import extract_tid_from_url
+
+    stat = os.stat(csv_path)
+    backend = get_backend()
+    scored = backend.score_posts(load_dataset(csv_path)).sort_values('综合评分', ascending=False)
+    views = RankingViews(source_mtime=stat.st_mtime, source_size=stat.st_size, loaded_at=time.time())
+
+    months = scored['发表时间'].dt.strftime('%Y-%m')
+    published = scored['发表时间'].dt.strftime('%Y-%m-%d %H:%M')
+    updated = scored['更新时间'].dt.strftime('%Y-%m-%d %H:%M')
+    for rank, (row, month, published_at, updated_at) in enumerate(
+            zip(scored[POST_FIELDS + ['综合评分']].itertuples(index=False), months, published, updated), 1):
+        post = dict(zip(POST_FIELDS + ['综合评分'], row))
+        for column in ('字数', '浏览数', '点赞数', '收藏数', '评论数'):
+            post[column] = int(post[column])
+        tid = extract_tid_from_url(post['链接'])
+        post.update(tid=int(tid) if tid else None, 排名=rank, 月份=month, 发表时间=published_at, 更新时间=updated_at,
+                    综合评分=round(float(post['综合评分']), 3))
+        index = len(views.posts)
+        views.posts.append(post)
+        if post['tid'] is not None:
+            views.by_tid[post['tid']] = index
+        views.by_block.setdefault(post['板块'], []).append(index)
+        views.by_author.setdefault(post['作者'], []).append(index)
+        views.by_month.setdefault(month, []).append(index)
+        views.by_block_month.setdefault((post['板块'], month), []).append(index)
+
+    if len(scored):
+        ranking = backend.author_scores(scored).sort_values('作者评分', ascending=False).round(2)
+        for rank, (name, row) in enumerate(ranking[AUTHOR_FIELDS].iterrows(), 1):
+            author = {'作者': name, '排名': rank, **{column: row[column].item() for column in AUTHOR_FIELDS}}
+            author['文章数量'] = int(author['文章数量'])
+            views.author_index[name] = len(views.authors)
+            views.authors.append(author)
+    logging.info(f"排名视图加载完成：{len(views.posts)} 篇文章，{len(views.authors)} 位作者，"
+                 f"耗时 {time.time() - views.loaded_at:.2f}秒")
+    return views
+
+
+class QueryService:
+    """
+    本地排名查询服务，查询只读取内存中的视图
+
+    后台线程定期检查 data.csv，文件变化并稳定 settle_seconds 后在后台重新构建视图再整体替换，
+    构建期间仍使用旧视图应答；爬取结束时也可通过 POST /refresh 立即刷新
+    """
+
+    def __init__(self, csv_path: str = 'data.csv', poll_interval: float = 10, settle_seconds: float = 30):
+        self.csv_path = csv_path
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.views = RankingViews()
+        self.stop_event = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def refresh(self, force: bool = False) -> bool:
+        """数据文件变化时重新构建视图，返回是否替换了视图"""
+        with self._refresh_lock:
+            try:
+                stat = os.stat(self.csv_path)
+            except OSError as e:
+                logging.warning(f"读取数据文件 {self.csv_path} 失败: {e}")
+                return False
+            if not force and (stat.st_mtime, stat.st_size) == (self.views.source_mtime, self.views.source_size):
+                return False
+            try:
+                self.views = build_views(self.csv_path)
+            except Exception as e:
+                logging.error(f"构建排名视图失败，继续使用旧视图: {e}", exc_info=True)
+                return False
+            return True
+
+    def request_refresh(self) -> None:
+        """唤醒后台线程立即刷新，不等待数据文件稳定"""
+        self._wake.set()
+
+    def _refresh_loop(self) -> None:
+        while not self.stop_event.is_set():
+            woken = self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self.stop_event.is_set():
+                return
+            try:
+                # 爬取中途 data.csv 会被多次改写，修改时间稳定后再刷新
+                if woken or time.time() - os.stat(self.csv_path).st_mtime >= self.settle_seconds:
+                    self.refresh()
+            except OSError:
+                continue
+
+    def handle(self, path: str, params: Dict[str, str]) -> Tuple[int, object]:
+        """应答一次查询，返回 HTTP 状态码与 JSON 对象"""
+        views = self.views
+        if path == '/top':
+            k = min(int(params.get('k', 20)), 1000)
+            return 200, views.top(k, params.get('block'), params.get('author'), params.get('month'))
+        if path == '/thread':
+            index = views.by_tid.get(int(params['tid']))
+            return (200, views.posts[index]) if index is not None else (404, {'error': '没有该主题'})
+        if path == '/author':
+            name = params['name']
+            if name not in views.by_author:
+                return 404, {'error': '没有该作者'}
+            index = views.author_index.get(name)
+            return 200, {'author': views.authors[index] if index is not None else None,
+                         'works': [views.posts[i] for i in views.by_author[name]]}
+        if path == '/authors':
+            k = min(int(params.get('k', 20)), 1000)
+            min_articles = int(params.get('min_articles', 3))
+            return 200, [author for author in views.authors if author['文章数量'] >= min_articles][:k]
+        if path == '/blocks':
+            return 200, {block: len(indices) for block, indices in views.by_block.items()}
+        if path == '/months':
+            return 200, {month: len(indices) for month, indices in sorted(views.by_month.items())}
+        if path == '/status':
+            return 200, {'posts': len(views.posts), 'authors': len(views.authors),
+                         'loaded_at': views.loaded_at, 'source_mtime': views.source_mtime}
+        return 404, {'error': f'未知的查询 {path}'}
+
+    def serve(self, host: str = '127.0.0.1', port: int = 8765) -> None:
+        """加载视图后开始应答，直到收到中断"""
+        self.refresh(force=True)
+        server = ThreadingHTTPServer((host, port), _make_handler(self))
+        refresher = threading.Thread(target=self._refresh_loop, name='query-refresh', daemon=True)
+        refresher.start()
+        logging.info(f"排名查询服务已启动：http://{host}:{server.server_port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_event.set()
+            self._wake.set()
+            server.server_close()
+
+
+def _make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                status, body = service.handle(url.path, params)
+            except (KeyError, ValueError) as e:
+                status, body = 400, {'error': f'参数错误: {e}'}
+            self._send(status, body)
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/refresh':
+                self._send(404, {'error': f'未知的操作 {self.path}'})
+                return
+            service.request_refresh()
+            self._send(202, {'status': 'refreshing'})
+
+        def _send(self, status: int, body) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.debug(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+
+def notify_refresh(config: dict) -> None:
+    """爬取结束后通知本地查询服务刷新，服务未运行时只记录日志"""
+    import urllib.request
+
+    service_config = config.get('query_service') or {}
+    if not service_config.get('notify'):
+        return
+    url = f"http://{service_config.get('host', '127.0.0.1')}:{service_config.get('port', 8765)}/refresh"
+    try:
+        urllib.request.urlopen(urllib.request.Request(url, method='POST'), timeout=5).close()
+    except OSError as e:
+        logging.warning(f"通知查询服务 {url} 刷新失败: {e}")
+
+
+if __name__ == '__main__':
+    from logsetup import setup_logging
+    from util import init_config
+
+    config = init_config()
+    setup_logging(config)
+    service_config = config.get('query_service') or {}
+    QueryService(service_config.get('data', 'data.csv')).serve(service_config.get('host', '127.0.0.1'),
+                                                              service_config.get('port', 8765))
@@ -0,0 +1,230 @@
+import concurrent.futures
+import csv
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Set
+
+from fatal import FatalError, preflight
+from forum import ThreadRecord, _attach_failed_rows, _cancel_pending, main_spider, threadWrapper
+from ledger import BLOCK, PAGE, THREAD, get_ledger
+from util import *
+
+
+@dataclass
+class RecrawlTargets:
+    """定向重爬的目标"""
+    tids: Set[str] = field(default_factory=set)
+    uids: Set[str] = field(default_factory=set)
+    blocks: List[str] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.tids or self.uids or self.blocks)
+
+
+def parse_target_file(file_path: str, targets: RecrawlTargets) -> RecrawlTargets:
+    """
+    从文件读取重爬目标，每行一个：
+    纯数字或 tid:123 表示主题，uid:456 表示作者，block:重度区 表示板块，# 开头为注释
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            kind, _, value = line.partition(':') if ':' in line else ('tid', '', line)
+            kind, value = kind.strip().lower(), value.strip()
+            if kind == 'tid':
+                targets.tids.add(value)
+            elif kind == 'uid':
+                targets.uids.add(value)
+            elif kind == 'block':
+                targets.blocks.append(value)
+            else:
+                raise ValueError(f"无法识别的重爬目标: {line}")
+    return targets
+
+
+def load_stored_rows(filename: str = "data.csv") -> Dict[str, dict]:
+    """读取已爬取的数据，返回 tid 到行数据的映射"""
+    rows = {}
+    if not Path(filename).exists():
+        return rows
+    with open(filename, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            tid = extract_tid_from_url(row['链接'])
+            if tid:
+                rows[tid] = row
+    return rows
+
+
+def resolve_targets(targets: RecrawlTargets, stored_rows: Dict[str, dict]) -> Dict[str, dict]:
+    """将 tid 和 uid 解析为已存储的主题行，uid 通过链接中的 authorid 匹配"""
+    resolved = {}
+    for tid in targets.tids:
+        if tid in stored_rows:
+            resolved[tid] = stored_rows[tid]
+        else:
+            logging.warning(f"主题 {tid} 不在已爬取的数据中，请先爬取其所在板块")
+
+    if targets.uids:
+        found_uids = set()
+        for tid, row in stored_rows.items():
+            uid_match = re.search(r'authorid=(\d+)', row['链接'])
+            if uid_match and uid_match.group(1) in targets.uids:
+                resolved[tid] = row
+                found_uids.add(uid_match.group(1))
+        for uid in targets.uids - found_uids:
+            logging.warning(f"已爬取的数据中没有作者 {uid} 的主题")
+
+    return resolved
+
+
+def recrawl_threads(rows: Dict[str, dict], download_images: bool, filename: str = "data.csv") -> int:
+    """
+    直接爬取指定主题并只更新这些行，列表页上的评论数和浏览数沿用已存储的值
+
+    Returns:
+        成功更新的主题数
+    """
+    by_block: Dict[str, List[ThreadRecord]] = {}
+    for row in rows.values():
+        by_block.setdefault(row['板块'], []).append(ThreadRecord.from_row(row))
+
+    updated = 0
+    fatal_error = None
+    thread_pool_size = CONFIG['spider']['page_thread_pool_size']
+    for block_name, records in by_block.items():
+        logging.info(f"定向重爬 {block_name} 的 {len(records)} 个主题")
+        succeeded = []
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=thread_pool_size) as executor:
+            future_to_record = {
+                executor.submit(threadWrapper, record.link, block_name, record.title, download_images,
+                                record.author): record
+                for record in records
+            }
+            for future in concurrent.futures.as_completed(future_to_record):
+                if future.cancelled():
+                    continue
+                record = future_to_record[future]
+                try:
+                    result = future.result()
+                except FatalError as e:
+                    fatal_error = fatal_error or e
+                    _cancel_pending(future_to_record)
+                    continue
+                except Exception as e:
+                    logging.error(f"重爬 {record.link} 失败: {e}")
+                    failed.append(record)
+                    continue
+                # thread_spider 失败时返回 (0, 0, 0)，此时保留原有数据
+                if not result or result == (0, 0, 0):
+                    logging.error(f"重爬 {record.link} 失败，保留原有数据")
+                    failed.append(record)
+                    continue
+                recommend_count, favorite_count, word_count = result
+                record.recommends = parse_count(recommend_count)
+                record.favorites = parse_count(favorite_count)
+                record.word_count = parse_count(word_count)
+                succeeded.append(record)
+
+        if succeeded:
+            write_to_csv(succeeded, block_name, filename)
+            updated += len(succeeded)
+        if failed:
+            _attach_failed_rows(block_name, failed)
+        if fatal_error is not None:
+            # 已完成的主题已写入，其余板块不再重爬
+            raise fatal_error
+
+    return updated
+
+
+def recrawl(targets: RecrawlTargets, download_images: bool, force: bool = False,
+            filename: str = "data.csv") -> None:
+    """
+    定向重爬：tid 与 uid 直接爬取对应主题，板块则只爬取指定板块
+
+    Args:
+        force: 爬取板块时忽略已存储的更新时间，重新爬取板块内所有主题
+    """
+    stored_rows = load_stored_rows(filename)
+    preflight(next(iter(CONFIG['blocks'].values())))
+
+    rows = resolve_targets(targets, stored_rows)
+    if rows:
+        updated = recrawl_threads(rows, download_images, filename)
+        logging.info(f"定向重爬完成，共更新 {updated}/{len(rows)} 个主题")
+
+    for block_name in targets.blocks:
+        block_url = CONFIG['blocks'].get(block_name)
+        if not block_url:
+            logging.error(f"配置文件中没有板块 {block_name}")
+            continue
+        last_crawled_data = {} if force else {
+            int(tid): parse_time(row['更新时间']) for tid, row in stored_rows.items()
+        }
+        main_spider(block_name, block_url, download_images, last_crawled_data)
+
+
+def retry_failed(download_images: bool, include_all: bool = False, filename: str = "data.csv") -> None:
+    """
+    只重试失败任务台账中已到重试时间的任务，不重新爬取整个板块
+
+    失败的板块重新爬取整个板块；失败的列表页以失败时的获取方式重新请求同一个链接，只爬取其中有更新的主题；
+    失败的文章直接重爬，使用失败时列表页上的数据，没有时沿用已存储的行。
+    成功的任务从台账中移除，再次失败的按指数退避推迟到之后的运行
+
+    Args:
+        include_all: 忽略退避时间与最大失败次数，重试台账中的全部任务
+    """
+    from listing import LISTINGS, get_listing
+
+    ledger = get_ledger()
+    if ledger is None:
+        logging.error("未开启失败任务台账，请在配置中设置 ledger.enabled: true")
+        return
+    max_attempts = 0 if include_all else (CONFIG.get('ledger') or {}).get('max_attempts', 0)
+    tasks = ledger.tasks(due_only=not include_all, max_attempts=max_attempts)
+    if not tasks:
+        logging.info(f"没有到重试时间的失败任务，台账中共 {len(ledger)} 个任务")
+        return
+    preflight(next(iter(CONFIG['blocks'].values())))
+
+    stored_rows = load_stored_rows(filename)
+    last_crawled_data = {int(tid): parse_time(row['更新时间']) for tid, row in stored_rows.items()}
+
+    # 重新爬取整个板块时，其中失败的列表页与文章一并重试
+    blocks = {task.block: task.url for task in tasks if task.kind == BLOCK}
+    for block_name, block_url in blocks.items():
+        logging.info(f"重试板块 {block_name}")
+        main_spider(block_name, block_url, download_images, last_crawled_data)
+
+    rows: Dict[str, dict] = {}
+    for task in tasks:
+        if task.block in blocks:
+            continue
+        if task.kind == PAGE:
+            if task.backend not in LISTINGS:
+                # 没有记录获取方式时无法确定 url 是哪种列表页，由下次爬取板块重新获取
+                logging.warning(f"列表页任务 {task.key} 没有记录获取方式，从台账中移除")
+                ledger.discard(PAGE, task.key)
+                continue
+            page_data = get_listing(task.backend).fetch_url(task.block, task.url, task.page)
+            for record in page_data or ():
+                last_update = last_crawled_data.get(record.tid)
+                if last_update is None or record.update_time > last_update:
+                    rows[str(record.tid)] = dict(zip(CSV_HEADER, record.to_row(task.block)))
+        elif task.kind == THREAD:
+            row = json.loads(task.row) if task.row else stored_rows.get(task.key)
+            if row is None:
+                logging.warning(f"台账中没有主题 {task.key} 的列表数据，等待下次爬取板块 {task.block} 时重试")
+                continue
+            rows.setdefault(task.key, row)
+
+    if rows:
+        updated = recrawl_threads(rows, download_images, filename)
+        logging.info(f"重试失败任务完成，共更新 {updated}/{len(rows)} 个主题")
+    logging.info(f"台账中剩余 {len(ledger)} 个失败任务")
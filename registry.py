@@ -0,0 +1,85 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+class TidRegistry:
+    """
+    进程内所有板块共享的主题登记表
+
+    - 同一 tid 只爬取一次：第一个请求者负责执行，之后的请求等待并复用它的结果
+    - 行归属：本次运行中列出该 tid 的板块里，在配置文件中排在最前的板块拥有这一行与保存的正文
+    """
+
+    def __init__(self, block_order: List[str]):
+        self._lock = threading.Lock()
+        self._futures: Dict[int, Future] = {}
+        self._claims: Dict[int, Set[str]] = {}
+        # tid -> 正文保存在哪个板块下
+        self._saved: Dict[int, str] = {}
+        self._priority = {block_name: i for i, block_name in enumerate(block_order)}
+
+    def claim(self, tid: int, block_name: str) -> None:
+        """登记某个板块列出了该 tid"""
+        with self._lock:
+            self._claims.setdefault(tid, set()).add(block_name)
+
+    def fetch(self, tid: int, block_name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        单飞执行：该 tid 尚未被爬取时在当前线程执行 func(*args, block_name=<归属板块>, **kwargs)，否则等待已有的结果
+
+        正文保存在开始执行时的归属板块下；之后才列出该 tid 且排在更前的板块成为归属板块，
+        由它在写入时按 saved_block 移动已保存的正文
+        """
+        with self._lock:
+            self._claims.setdefault(tid, set()).add(block_name)
+            future = self._futures.get(tid)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._futures[tid] = future
+
+        if is_owner:
+            owner = self.owner(tid)
+            with self._lock:
+                self._saved[tid] = owner
+            try:
+                future.set_result(func(*args, block_name=owner, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        return future.result()
+
+    def owner(self, tid: int) -> Optional[str]:
+        """返回拥有该 tid 对应行的板块"""
+        with self._lock:
+            claims = self._claims.get(tid)
+            if not claims:
+                return None
+            return min(claims, key=lambda name: (self._priority.get(name, len(self._priority)), name))
+
+    def owns(self, tid: int, block_name: str) -> bool:
+        owner = self.owner(tid)
+        return owner is None or owner == block_name
+
+    def saved_block(self, tid: int) -> Optional[str]:
+        """正文保存在哪个板块下，本次运行未爬取时返回 None"""
+        with self._lock:
+            return self._saved.get(tid)
+
+    def mark_saved(self, tid: int, block_name: str) -> None:
+        """记录正文已移动到该板块下"""
+        with self._lock:
+            self._saved[tid] = block_name
+
+    def release(self, tid: int) -> None:
+        """丢弃已完成的结果，该 tid 再次更新时重新爬取；登记的板块保留，用于判断归属"""
+        with self._lock:
+            future = self._futures.get(tid)
+            if future is not None and future.done():
+                del self._futures[tid]
+
+    def is_done(self, tid: int) -> bool:
+        with self._lock:
+            future = self._futures.get(tid)
+            return future is not None and future.done()
@@ -0,0 +1,173 @@
+import concurrent.futures
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from archive import PageArchive, open_archive
+from forum import ThreadRecord, _fetch_page_data
+from myThread import thread_spider
+from util import *
+
+# 移动端接口的路径，用于在归档中识别 mobile_api 方式抓取的列表页
+API_LIST_PATH = 'api/mobile/index.php'
+# 工作进程内的归档读取函数，由 _init_worker 设置
+_worker_fetch = None
+
+
+def _init_worker(archive_dir: str, before: Optional[int], config: dict) -> None:
+    """
+    工作进程初始化：载入父进程的配置，以只读方式打开页面归档，不复用父进程的数据库连接
+
+    以 spawn 方式启动的工作进程（Windows、macOS）不会继承父进程已加载的 CONFIG
+    """
+    global _worker_fetch
+    CONFIG.clear()
+    CONFIG.update(config)
+    _worker_fetch = PageArchive(archive_dir, readonly=True).fetcher(before)
+
+
+def _reparse_list_page(url: str, page_num: int) -> List[ThreadRecord]:
+    if API_LIST_PATH in url:
+        return _reparse_api_page(url)
+    page_data = _fetch_page_data(url, page_num, _worker_fetch)
+    return list(page_data) if page_data else []
+
+
+def _reparse_api_page(url: str) -> List[ThreadRecord]:
+    """解析归档中移动端接口返回的列表 JSON"""
+    from listing import parse_forumdisplay
+
+    listing_config = CONFIG.get('listing') or {}
+    try:
+        page_size = int(parse_qs(urlparse(url).query).get('tpp', [listing_config.get('page_size', 100)])[0])
+        page_data, _ = parse_forumdisplay(json.loads(_worker_fetch(url).text), page_size,
+                                          int(listing_config.get('utc_offset_hours', 8) * 3600))
+    except Exception as e:
+        logging.error(f'解析归档中的列表 {url} 失败: {e}')
+        return []
+    return list(page_data)
+
+
+def _reparse_thread(link: str, block_name: str, author: str) -> Tuple[str, str, str]:
+    return thread_spider(link, block_name, False, _worker_fetch, author)
+
+
+def _list_page_urls(archive, block_url: str, before: Optional[int]) -> List[Tuple[str, int]]:
+    """
+    返回归档中该板块的全部列表页及其页码
+
+    包括 html 方式抓取的 forum-<fid>-<页码>.html 与 mobile_api 方式抓取的 forumdisplay 接口，
+    切换过列表获取方式的板块两种页面都会解析，主题按 tid 合并
+    """
+    from listing import forum_id
+
+    pages = []
+    for url in archive.urls(block_url.replace('-1.html', '-%.html'), before):
+        page_match = re.search(r'-(\d+)\.html$', url)
+        if page_match:
+            pages.append((url, int(page_match.group(1))))
+    try:
+        fid = forum_id(block_url)
+    except ValueError:
+        fid = None
+    if fid is not None:
+        for url in archive.urls(f'%{API_LIST_PATH}?%module=forumdisplay&fid={fid}&page=%', before):
+            page_match = re.search(r'[?&]page=(\d+)', url)
+            if page_match:
+                pages.append((url, int(page_match.group(1))))
+    return sorted(pages, key=lambda page: page[1])
+
+
+def reparse(blocks: Optional[List[str]] = None, before: Optional[int] = None,
+            max_workers: Optional[int] = None, filename: str = "data.csv") -> int:
+    """
+    不联网，从页面归档重新解析列表页和帖子页，重建数据行与文档
+
+    同一主题出现在多个板块时归属配置中靠前的板块；归档中没有帖子页的主题保留原有数据
+
+    Args:
+        blocks: 只重新解析这些板块，默认全部板块
+        before: 只使用该时间戳之前抓取的页面，用于重现某一时刻的数据
+
+    Returns:
+        更新的主题数
+    """
+    archive_dir = (CONFIG.get('archive') or {}).get('dir', 'archive')
+    archive = open_archive(archive_dir, readonly=True)
+    block_names = blocks or list(CONFIG['blocks'])
+    start_time = time.time()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                initargs=(archive_dir, before, dict(CONFIG))) as executor:
+        # 解析各板块的列表页
+        by_block: Dict[str, Dict[int, ThreadRecord]] = {}
+        for block_name in block_names:
+            block_url = CONFIG['blocks'].get(block_name)
+            if not block_url:
+                logging.error(f"配置文件中没有板块 {block_name}")
+                continue
+            pages = _list_page_urls(archive, block_url, before)
+            if not pages:
+                logging.warning(f"归档中没有 {block_name} 的列表页，跳过该板块")
+                continue
+            records = {}
+            urls = [url for url, _ in pages]
+            page_nums = [page_num for _, page_num in pages]
+            for page_records in executor.map(_reparse_list_page, urls, page_nums):
+                for record in page_records:
+                    records.setdefault(record.tid, record)
+            logging.info(f"{block_name} 从归档解析 {len(pages)} 个列表页，{len(records)} 个主题")
+            by_block[block_name] = records
+
+        # 按配置顺序确定主题归属
+        seen = set()
+        for block_name in [name for name in CONFIG['blocks'] if name in by_block]:
+            records = by_block[block_name]
+            for tid in [tid for tid in records if tid in seen]:
+                del records[tid]
+            seen.update(records)
+
+        # 只解析归档中存在帖子页的主题
+        archived = set(archive.urls('%mod=viewthread%', before))
+        future_to_record = {}
+        for block_name, records in by_block.items():
+            missing = [record for record in records.values() if record.link not in archived]
+            if missing:
+                logging.warning(f"{block_name} 有 {len(missing)} 个主题不在归档中，保留原有数据")
+            for record in records.values():
+                if record.link in archived:
+                    future = executor.submit(_reparse_thread, record.link, block_name, record.author)
+                    future_to_record[future] = (block_name, record)
+
+        succeeded: Dict[str, List[ThreadRecord]] = {}
+        for future in concurrent.futures.as_completed(future_to_record):
+            block_name, record = future_to_record[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"重新解析 {record.link} 失败: {e}")
+                continue
+            if not result or result == (0, 0, 0):
+                continue
+            recommend_count, favorite_count, word_count = result
+            record.recommends = parse_count(recommend_count)
+            record.favorites = parse_count(favorite_count)
+            record.word_count = parse_count(word_count)
+            succeeded.setdefault(block_name, []).append(record)
+
+    updated = 0
+    for block_name, records in succeeded.items():
+        write_to_csv(records, block_name, filename)
+        updated += len(records)
+    logging.info(f"重新解析完成，共更新 {updated} 个主题，耗时: {time.time() - start_time:.2f}秒")
+    return updated
+
+
+if __name__ == '__main__':
+    from logsetup import setup_logging
+    setup_logging(init_config())
+    print(open_archive(CONFIG.get('archive', {}).get('dir', 'archive'), readonly=True).stats())
+    reparse()
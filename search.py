@@ -0,0 +1,214 @@
+import csv
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 中日韩统一表意文字，按相邻两字切分；其余字母数字按词切分
+CJK_RANGES = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+TOKEN_PATTERN = re.compile(f'[{CJK_RANGES}]+|[^\\W{CJK_RANGES}]+')
+CJK_PATTERN = re.compile(f'[{CJK_RANGES}]')
+# 搜索结果摘要中关键词前后保留的字数
+SNIPPET_CONTEXT = 30
+
+_indexes: Dict[Tuple[str, int], 'SearchIndex'] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(path: str = 'search/index.db') -> 'SearchIndex':
+    """返回路径对应的共享索引实例，每个进程各自打开连接"""
+    key = (str(Path(path).resolve()), os.getpid())
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = SearchIndex(path)
+        return _indexes[key]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    切分为索引词：汉字连续片段切为相邻两字，片段末尾的单字也单独保留，便于单字前缀查询；
+    其余连续的字母数字作为一个词并转为小写
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(text):
+        if CJK_PATTERN.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def build_query(query: str) -> str:
+    """
+    将用户输入转换为 FTS5 查询：空格分隔的每个词都需出现，
+    多字词按相邻两字组成短语匹配连续出现的原文，单字按前缀匹配
+    """
+    terms = []
+    for run in TOKEN_PATTERN.findall(query):
+        if CJK_PATTERN.match(run) and len(run) == 1:
+            terms.append(f'"{run}"*')
+        elif CJK_PATTERN.match(run):
+            terms.append('"' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        else:
+            terms.append(f'"{run.lower()}"')
+    if not terms:
+        raise ValueError(f"搜索词中没有可检索的文字: {query}")
+    return ' AND '.join(terms)
+
+
+class SearchIndex:
+    """
+    小说正文的全文索引
+
+    倒排索引使用 SQLite FTS5，汉字在写入前切分为相邻两字；
+    正文以 zlib 压缩另存一份，用于删除旧索引和生成搜索结果摘要
+    """
+
+    def __init__(self, path: str = 'search/index.db'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # 重新解析时多个进程同时写入，等待锁而不是立即失败
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS docs (
+                tid INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                author TEXT,
+                block TEXT,
+                indexed_at INTEGER NOT NULL,
+                body BLOB NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS fts USING fts5(title, body, content='', tokenize='unicode61');
+        ''')
+        self._conn.commit()
+
+    def add(self, tid: int, title: str, text: str, block: Optional[str] = None,
+            author: Optional[str] = None) -> None:
+        """写入或替换一篇文章，未提供作者时沿用已有的作者"""
+        with self._lock:
+            self._delete(tid)
+            self._conn.execute('INSERT INTO fts (rowid, title, body) VALUES (?, ?, ?)',
+                               (tid, ' '.join(tokenize(title)), ' '.join(tokenize(text))))
+            self._conn.execute(
+                'INSERT INTO docs (tid, title, author, block, indexed_at, body) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(tid) DO UPDATE SET title = excluded.title, '
+                'author = COALESCE(excluded.author, docs.author), block = COALESCE(excluded.block, docs.block), '
+                'indexed_at = excluded.indexed_at, body = excluded.body',
+                (tid, title, author, block, int(time.time()), zlib.compress(text.encode('utf-8')))
+            )
+            self._conn.commit()
+
+    def remove(self, tid: int) -> None:
+        with self._lock:
+            self._delete(tid)
+            self._conn.execute('DELETE FROM docs WHERE tid = ?', (tid,))
+            self._conn.commit()
+
+    def _delete(self, tid: int) -> None:
+        """无内容的 FTS5 表删除时需要提供原先写入的索引词"""
+        row = self._conn.execute('SELECT title, body FROM docs WHERE tid = ?', (tid,)).fetchone()
+        if row is not None:
+            title, body = row
+            self._conn.execute(
+                "INSERT INTO fts (fts, rowid, title, body) VALUES ('delete', ?, ?, ?)",
+                (tid, ' '.join(tokenize(title)), ' '.join(tokenize(zlib.decompress(body).decode('utf-8'))))
+            )
+
+    def search(self, query: str, limit: int = 20, block: Optional[str] = None,
+               author: Optional[str] = None) -> List[dict]:
+        """按相关度返回匹配的文章，标题中的匹配权重更高"""
+        sql = ('SELECT d.tid, d.title, d.author, d.block, d.body FROM fts JOIN docs d ON d.tid = fts.rowid '
+               'WHERE fts MATCH ?')
+        params = [build_query(query)]
+        if block:
+            sql += ' AND d.block = ?'
+            params.append(block)
+        if author:
+            sql += ' AND d.author = ?'
+            params.append(author)
+        sql += ' ORDER BY bm25(fts, 5.0, 1.0) LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{'tid': tid, 'title': title, 'author': author, 'block': block,
+                 'snippet': make_snippet(zlib.decompress(body).decode('utf-8'), query)}
+                for tid, title, author, block, body in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+
+def make_snippet(text: str, query: str) -> str:
+    """截取正文中第一个关键词附近的片段"""
+    for term in query.split():
+        position = text.lower().find(term.lower())
+        if position >= 0:
+            start = max(0, position - SNIPPET_CONTEXT)
+            end = position + len(term) + SNIPPET_CONTEXT
+            return ('…' if start > 0 else '') + text[start:end] + ('…' if end < len(text) else '')
+    return text[:SNIPPET_CONTEXT * 2]
+
+
+def index_thread(tid, title: str, text: str, block: Optional[str] = None, author: Optional[str] = None) -> None:
+    """按配置将爬取到的文章写入全文索引，失败只记录日志"""
+    from util import CONFIG
+
+    search_config = CONFIG.get('search') or {}
+    if not search_config.get('enabled') or tid is None:
+        return
+    try:
+        open_index(search_config.get('path', 'search/index.db')).add(int(tid), title, text, block, author)
+    except Exception as e:
+        logging.error(f"写入全文索引 {tid} 失败: {e}")
+
+
+def build_from_docx(index: SearchIndex, output_dir: str = '小说输出', data_file: str = 'data.csv') -> int:
+    """
+    从已保存的文档重建索引，文档名为清理后的标题，通过 data.csv 对应 tid 与作者
+    """
+    from docx import Document
+    from util import clean_title, extract_tid_from_url
+
+    rows = {}
+    with open(data_file, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            rows[(row['板块'], clean_title(row['标题']))] = row
+
+    indexed = 0
+    for path in Path(output_dir).glob('*/*.docx'):
+        row = rows.get((path.parent.name, path.stem))
+        tid = extract_tid_from_url(row['链接']) if row else None
+        if tid is None:
+            logging.warning(f"{path} 在 {data_file} 中找不到对应的主题，已跳过")
+            continue
+        text = '\n'.join(paragraph.text for paragraph in Document(path).paragraphs)
+        index.add(int(tid), row['标题'], text, row['板块'], row['作者'])
+        indexed += 1
+    logging.info(f"从 {output_dir} 索引了 {indexed} 篇文章")
+    return indexed
+
+
+
+def build_from_store(index: SearchIndex, store) -> int:
+    """从打包存储重建索引，存储中已记录 tid、标题、板块与作者"""
+    indexed = 0
+    for stored in store:
+        index.add(stored.tid, stored.title, '\n'.join(stored.content.texts()), stored.block, stored.author)
+        indexed += 1
+    logging.info(f"从打包存储索引了 {indexed} 篇文章")
+    return indexed
+
+if __name__ == '__main__':
+    index = SearchIndex('/tmp/search_demo.db')
+    index.add(1, '荆棘鸟', '这是一个关于荆棘鸟的故事，它一生只唱一次歌。', '测试', '作者')
+    for result in index.search('唱一次'):
+        print(result)
@@ -0,0 +1,477 @@
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 分段文件中每条记录的头部：魔数、元数据长度、压缩内容长度、压缩内容的 crc32
+RECORD_MAGIC = b'JJNR'
+RECORD_HEADER = struct.Struct('<4sIII')
+# 内容中每一项的头部：类型（P 段落、I 图片）与长度
+ITEM_HEADER = struct.Struct('<cI')
+SEGMENT_PATTERN = 'segment-*.pack'
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_stores: Dict[Tuple[str, int], 'PackedStore'] = {}
+_stores_lock = threading.Lock()
+
+
+@dataclass
+class ThreadContent:
+    """一篇文章的正文，按顺序保存段落文本（str）与图片数据（bytes）"""
+    items: List[Union[str, bytes]] = field(default_factory=list)
+
+    def add_paragraph(self, text: str) -> None:
+        self.items.append(text)
+
+    def add_image(self, stream: BytesIO) -> None:
+        self.items.append(stream.getvalue())
+
+    def texts(self) -> List[str]:
+        return [item for item in self.items if isinstance(item, str) and item]
+
+    def encode(self) -> bytes:
+        parts = []
+        for item in self.items:
+            data = item.encode('utf-8') if isinstance(item, str) else item
+            parts.append(ITEM_HEADER.pack(b'P' if isinstance(item, str) else b'I', len(data)))
+            parts.append(data)
+        return b''.join(parts)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'ThreadContent':
+        items = []
+        offset = 0
+        while offset < len(data):
+            kind, length = ITEM_HEADER.unpack_from(data, offset)
+            offset += ITEM_HEADER.size
+            chunk = data[offset:offset + length]
+            items.append(chunk.decode('utf-8') if kind == b'P' else chunk)
+            offset += length
+        return cls(items)
+
+
+@dataclass
+class StoredThread:
+    tid: int
+    block: str
+    title: str
+    author: Optional[str]
+    content: ThreadContent
+
+
+def new_document():
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    document = Document()
+    # 设置默认字体为宋体
+    document.styles['Normal'].font.name = '宋体'
+    document.styles['Normal']._element.rPr.rFonts.set(qn('w:eastAsia'), '宋体')
+    return document
+
+
+def render_docx(content: ThreadContent, document=None):
+    """将正文按顺序写入文档，未传入文档时新建，无法识别的图片跳过"""
+    from docx.shared import Inches
+
+    document = document if document is not None else new_document()
+    for item in content.items:
+        if isinstance(item, str):
+            document.add_paragraph(item)
+            continue
+        try:
+            pic = document.add_picture(BytesIO(item))
+            # 获取图片原始宽高比
+            aspect_ratio = pic.height / pic.width
+            # 设置最大宽度为页面宽度的80%
+            max_width = Inches(6)  # A4纸宽度约为8.27英寸
+            if pic.width > max_width:
+                pic.width = max_width
+                pic.height = int(pic.width * aspect_ratio)
+        except Exception:
+            pass
+    return document
+
+
+def save_document(document, path) -> None:
+    """先写入临时文件再替换，保存中断时不会损坏原文档"""
+    from profiling import profile_stage
+
+    tmp_path = str(path) + '.tmp'
+    with profile_stage('docx_save'):
+        document.save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class OutputStore:
+    """
+    文章正文的存储方式
+
+    location 为文章在存储中的位置，包含板块与标题，标题改变后位置随之改变，用于增量更新时判断能否追加
+    """
+    name = ''
+
+    def location(self, tid, block_name: str, title: str) -> str:
+        raise NotImplementedError
+
+    def exists(self, tid, block_name: str, title: str) -> bool:
+        raise NotImplementedError
+
+    def save(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> str:
+        """保存整篇文章，覆盖原有内容，返回位置"""
+        raise NotImplementedError
+
+    def append(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> None:
+        """在已保存的文章末尾追加内容"""
+        raise NotImplementedError
+
+    def texts(self, tid, block_name: str, title: str) -> List[str]:
+        """已保存的全部非空段落文本"""
+        raise NotImplementedError
+
+    def move(self, tid, from_block: str, to_block: str, title: str) -> bool:
+        """将已保存的文章移到另一个板块下，没有找到文章时返回 False"""
+        raise NotImplementedError
+
+
+class DocxStore(OutputStore):
+    """每篇文章保存为 小说输出/<板块>/<标题>.docx，标题相同的文章会互相覆盖"""
+    name = 'docx'
+
+    def __init__(self, output_dir: str = './小说输出/'):
+        self.output_dir = output_dir
+
+    def location(self, tid, block_name: str, title: str) -> str:
+        return os.path.join(self.output_dir, block_name, title + ".docx")
+
+    def exists(self, tid, block_name: str, title: str) -> bool:
+        return os.path.exists(self.location(tid, block_name, title))
+
+    def save(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> str:
+        # 在保存文档前创建目录
+        os.makedirs(os.path.join(self.output_dir, block_name), exist_ok=True)
+        path = self.location(tid, block_name, title)
+        save_document(render_docx(content), path)
+        return path
+
+    def append(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> None:
+        from docx import Document
+
+        path = self.location(tid, block_name, title)
+        save_document(render_docx(content, Document(path)), path)
+
+    def texts(self, tid, block_name: str, title: str) -> List[str]:
+        from docx import Document
+
+        return [paragraph.text for paragraph in Document(self.location(tid, block_name, title)).paragraphs
+                if paragraph.text]
+
+    def move(self, tid, from_block: str, to_block: str, title: str) -> bool:
+        source = self.location(tid, from_block, title)
+        if not os.path.exists(source):
+            return False
+        os.makedirs(os.path.join(self.output_dir, to_block), exist_ok=True)
+        os.replace(source, self.location(tid, to_block, title))
+        return True
+
+
+class PackedStore(OutputStore):
+    """
+    打包存储：文章正文压缩后追加写入分段文件，按 tid 在 SQLite 索引中记录每段内容的位置
+
+    保存整篇文章写入一条完整记录，增量更新只追加一条记录，读取时按顺序拼接。
+    记录先写入分段文件并落盘，再提交索引，中途中断只会在分段末尾留下未被索引的数据；
+    被覆盖的旧记录与未索引的数据在压缩时清理。
+    多个进程（如 reparse 的工作进程）可以写入同一目录：选择分段、追加记录与提交索引在目录的文件锁下进行，
+    记录偏移在持有锁时取自文件末尾，各进程的当前分段也在锁内按磁盘上的分段重新确定
+    """
+    name = 'packed'
+
+    def __init__(self, directory: str = 'packed', segment_bytes: int = 256 * 1024 * 1024, compress_level: int = 6):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.directory / 'index.db', timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS threads (
+                tid INTEGER PRIMARY KEY,
+                block TEXT NOT NULL,
+                title TEXT NOT NULL,
+                author TEXT,
+                updated_at INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                tid INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (tid, seq)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_segment ON chunks (segment);
+        ''')
+        self._conn.commit()
+        segments = self._segments()
+        self._active = segments[-1] if segments else 1
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f'segment-{segment:06d}.pack'
+
+    def _segments(self) -> List[int]:
+        return sorted(int(path.stem.split('-')[1]) for path in self.directory.glob(SEGMENT_PATTERN))
+
+    def _write_record(self, segment: int, meta: dict, content: ThreadContent) -> Tuple[int, int]:
+        """追加一条记录并落盘，返回记录的偏移与长度"""
+        header = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        payload = zlib.compress(content.encode(), self.compress_level)
+        record = RECORD_HEADER.pack(RECORD_MAGIC, len(header), len(payload), zlib.crc32(payload)) + header + payload
+        with open(self._segment_path(segment), 'ab') as f:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        return offset, len(record)
+
+    def _read_record(self, segment: int, offset: int, length: int) -> ThreadContent:
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            record = f.read(length)
+        magic, header_len, payload_len, crc = RECORD_HEADER.unpack_from(record)
+        payload = record[RECORD_HEADER.size + header_len:RECORD_HEADER.size + header_len + payload_len]
+        if magic != RECORD_MAGIC or len(payload) != payload_len or zlib.crc32(payload) != crc:
+            raise ValueError(f"{self._segment_path(segment)} 偏移 {offset} 处的记录已损坏")
+        return ThreadContent.decode(zlib.decompress(payload))
+
+    @contextmanager
+    def _write_lock(self):
+        """进程内与跨进程的写入锁"""
+        with self._lock, open(self.directory / 'write.lock', 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _writable_segment(self) -> int:
+        """持有写入锁时调用，其他进程可能已经写入了更新的分段"""
+        segments = self._segments()
+        if segments and segments[-1] > self._active:
+            self._active = segments[-1]
+        path = self._segment_path(self._active)
+        if path.exists() and path.stat().st_size >= self.segment_bytes:
+            self._active += 1
+        return self._active
+
+    def location(self, tid, block_name: str, title: str) -> str:
+        return f'{self.name}:{block_name}/{title}'
+
+    def exists(self, tid, block_name: str, title: str) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM threads WHERE tid = ?', (int(tid),)).fetchone() is not None
+
+    def save(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> str:
+        self._put(int(tid), block_name, title, author, content, replace=True)
+        return self.location(tid, block_name, title)
+
+    def append(self, tid, block_name: str, title: str, author: Optional[str], content: ThreadContent) -> None:
+        self._put(int(tid), block_name, title, author, content, replace=False)
+
+    def _put(self, tid: int, block_name: str, title: str, author: Optional[str], content: ThreadContent,
+             replace: bool) -> None:
+        now = int(time.time())
+        meta = {'tid': tid, 'block': block_name, 'title': title, 'author': author, 'time': now,
+                'kind': 'full' if replace else 'append'}
+        with self._write_lock():
+            segment = self._writable_segment()
+            offset, length = self._write_record(segment, meta, content)
+            if replace:
+                self._conn.execute('DELETE FROM chunks WHERE tid = ?', (tid,))
+                seq = 0
+            else:
+                seq = self._conn.execute('SELECT COALESCE(MAX(seq) + 1, 0) FROM chunks WHERE tid = ?',
+                                         (tid,)).fetchone()[0]
+            self._conn.execute('INSERT INTO chunks (tid, seq, segment, offset, length) VALUES (?, ?, ?, ?, ?)',
+                               (tid, seq, segment, offset, length))
+            self._conn.execute('INSERT OR REPLACE INTO threads (tid, block, title, author, updated_at) '
+                               'VALUES (?, ?, ?, ?, ?)', (tid, block_name, title, author, now))
+            self._conn.commit()
+
+    def get(self, tid) -> Optional[StoredThread]:
+        """按 tid 读取整篇文章，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute('SELECT block, title, author FROM threads WHERE tid = ?', (int(tid),)).fetchone()
+            if row is None:
+                return None
+            chunks = self._conn.execute('SELECT segment, offset, length FROM chunks WHERE tid = ? ORDER BY seq',
+                                        (int(tid),)).fetchall()
+            content = ThreadContent()
+            for segment, offset, length in chunks:
+                content.items.extend(self._read_record(segment, offset, length).items)
+        return StoredThread(int(tid), *row, content)
+
+    def texts(self, tid, block_name: str, title: str) -> List[str]:
+        stored = self.get(tid)
+        return stored.content.texts() if stored else []
+
+    def move(self, tid, from_block: str, to_block: str, title: str) -> bool:
+        with self._write_lock():
+            cursor = self._conn.execute('UPDATE threads SET block = ? WHERE tid = ? AND block = ?',
+                                        (to_block, int(tid), from_block))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def tids(self, blocks: Optional[Iterable[str]] = None) -> List[int]:
+        query = 'SELECT tid FROM threads'
+        params: list = []
+        if blocks:
+            blocks = list(blocks)
+            query += f' WHERE block IN ({", ".join("?" * len(blocks))})'
+            params = blocks
+        with self._lock:
+            return [row[0] for row in self._conn.execute(query + ' ORDER BY tid', params)]
+
+    def __iter__(self) -> Iterator[StoredThread]:
+        for tid in self.tids():
+            stored = self.get(tid)
+            if stored is not None:
+                yield stored
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads = self._conn.execute('SELECT COUNT(*) FROM threads').fetchone()[0]
+            chunks, live = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks').fetchone()
+        segments = self._segments()
+        total = sum(self._segment_path(segment).stat().st_size for segment in segments)
+        return {'threads': threads, 'chunks': chunks, 'segments': len(segments),
+                'bytes': total, 'live_bytes': live, 'garbage_bytes': total - live}
+
+    def compact(self, min_garbage_ratio: float = 0.3) -> dict:
+        """
+        重写失效数据占比不低于 min_garbage_ratio 的分段：其中仍有效的文章合并为一条完整记录写入新分段，
+        提交索引后删除旧分段。返回重写的分段数、文章数与回收的字节数
+        """
+        with self._write_lock():
+            live = dict(self._conn.execute('SELECT segment, SUM(length) FROM chunks GROUP BY segment').fetchall())
+            candidates = []
+            for segment in self._segments():
+                size = self._segment_path(segment).stat().st_size
+                if size and (size - live.get(segment, 0)) / size >= min_garbage_ratio:
+                    candidates.append(segment)
+            if not candidates:
+                return {'segments': 0, 'threads': 0, 'reclaimed_bytes': 0}
+
+            before = sum(self._segment_path(segment).stat().st_size for segment in self._segments())
+            placeholders = ', '.join('?' * len(candidates))
+            tids = [row[0] for row in self._conn.execute(
+                f'SELECT DISTINCT tid FROM chunks WHERE segment IN ({placeholders})', candidates)]
+            # 压缩结果写入新的分段，之后的写入也使用该分段
+            self._active = max(self._segments()) + 1
+            moved = []
+            for tid in tids:
+                block_name, title, author = self._conn.execute(
+                    'SELECT block, title, author FROM threads WHERE tid = ?', (tid,)).fetchone()
+                content = ThreadContent()
+                for segment, offset, length in self._conn.execute(
+                        'SELECT segment, offset, length FROM chunks WHERE tid = ? ORDER BY seq', (tid,)).fetchall():
+                    content.items.extend(self._read_record(segment, offset, length).items)
+                meta = {'tid': tid, 'block': block_name, 'title': title, 'author': author,
+                        'time': int(time.time()), 'kind': 'full'}
+                segment = self._writable_segment()
+                moved.append((tid, segment, *self._write_record(segment, meta, content)))
+            for tid, segment, offset, length in moved:
+                self._conn.execute('DELETE FROM chunks WHERE tid = ?', (tid,))
+                self._conn.execute('INSERT INTO chunks (tid, seq, segment, offset, length) VALUES (?, 0, ?, ?, ?)',
+                                   (tid, segment, offset, length))
+            self._conn.commit()
+            for segment in candidates:
+                self._segment_path(segment).unlink()
+            after = sum(self._segment_path(segment).stat().st_size for segment in self._segments())
+        logging.info(f"压缩了 {len(candidates)} 个分段，移动 {len(moved)} 篇文章，回收 {(before - after) / 1024 / 1024:.1f} MB")
+        return {'segments': len(candidates), 'threads': len(moved), 'reclaimed_bytes': before - after}
+
+
+def open_packed_store(directory: str = 'packed', segment_bytes: int = 256 * 1024 * 1024,
+                      compress_level: int = 6) -> PackedStore:
+    """返回目录对应的共享打包存储实例，每个进程各自打开连接"""
+    key = (str(Path(directory).resolve()), os.getpid())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = PackedStore(directory, segment_bytes, compress_level)
+        return _stores[key]
+
+
+def get_output_store(config: Optional[dict] = None) -> OutputStore:
+    """按配置 output.store 返回文章正文的存储方式，默认每篇文章一个 docx"""
+    if config is None:
+        from util import CONFIG
+        config = CONFIG
+    output_config = config.get('output') or {}
+    name = output_config.get('store', 'docx')
+    if name == DocxStore.name:
+        return DocxStore()
+    if name == PackedStore.name:
+        return open_packed_store(output_config.get('packed_dir', 'packed'),
+                                 int(output_config.get('segment_mb', 256) * 1024 * 1024),
+                                 output_config.get('compress_level', 6))
+    raise ValueError(f"未知的正文存储方式: {name}，可选 ['docx', 'packed']")
+
+
+def export_docx(store: PackedStore, output_dir: str = '导出', tids: Optional[Iterable[int]] = None,
+                blocks: Optional[Iterable[str]] = None) -> int:
+    """
+    将打包存储中的文章导出为 <output_dir>/<板块>/<标题>.docx，同一板块中标题重复时文件名加上 tid，
+    返回导出的篇数
+    """
+    exported = 0
+    used = set()
+    for tid in (list(tids) if tids else store.tids(blocks)):
+        stored = store.get(tid)
+        if stored is None:
+            logging.warning(f"打包存储中没有 tid {tid}")
+            continue
+        directory = Path(output_dir) / stored.block
+        directory.mkdir(parents=True, exist_ok=True)
+        name = stored.title if (stored.block, stored.title) not in used else f'{stored.title}_{tid}'
+        used.add((stored.block, stored.title))
+        save_document(render_docx(stored.content), directory / f'{name}.docx')
+        exported += 1
+    logging.info(f"导出了 {exported} 篇文章到 {output_dir}")
+    return exported
+
+
+if __name__ == '__main__':
+    demo = PackedStore('/tmp/packed_demo', segment_bytes=1024)
+    for i in range(20):
+        demo.save(i, '测试', f'标题{i}', '作者', ThreadContent([f'第{i}篇第{j}段' * 20 for j in range(10)]))
+    demo.append(3, '测试', '标题3', '作者', ThreadContent(['追加的段落']))
+    for i in range(10):
+        demo.save(i, '测试', f'标题{i}', '作者', ThreadContent([f'第{i}篇重写']))
+    print(demo.stats())
+    print(demo.compact())
+    print(demo.stats(), demo.get(3).content.texts()[-1])
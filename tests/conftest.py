@@ -0,0 +1,86 @@
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / 'fixtures'
+# 项目为平铺的模块，测试从仓库根目录导入
+sys.path.insert(0, str(ROOT))
+
+
+class StandInServer:
+    """
+    本地替身论坛：route(path) 返回 (状态码, Content-Type, 内容)，收到的请求路径按顺序记录在 requests 中
+    """
+
+    def __init__(self, route: Callable[[str], Tuple[int, str, bytes]]):
+        self.route = route
+        self.requests: List[str] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                status, content_type, body = server.route(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self._httpd.server_port}/'
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def stand_in():
+    """启动替身论坛的工厂，测试结束时关闭"""
+    servers = []
+
+    def start(route: Callable[[str], Tuple[int, str, bytes]]) -> StandInServer:
+        server = StandInServer(route)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def read_fixture(name: str) -> bytes:
+    return (FIXTURES / name).read_bytes()
+
+
+@pytest.fixture
+def forum_config(monkeypatch):
+    """
+    最小配置：请求直接发往替身论坛，不归档、不记台账；测试可继续修改返回的配置
+    """
+    import requests
+    import util
+
+    saved = dict(util.CONFIG)
+    util.CONFIG.clear()
+    util.CONFIG.update({
+        'request': {'timeout': 5},
+        'archive': {'enabled': False},
+        'ledger': {'enabled': False},
+        'listing': {'backend': 'html', 'page_size': 100, 'utc_offset_hours': 8},
+        'blocks': {},
+    })
+    monkeypatch.setattr(util, '_retrying_get', lambda url: requests.get(url, timeout=5))
+    yield util.CONFIG
+    util.CONFIG.clear()
+    util.CONFIG.update(saved)
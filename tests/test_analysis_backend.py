@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_backend import AUTHOR_COLUMNS, PandasBackend, PolarsBackend
+from benchmark import build_dataset
+
+pytest.importorskip('polars')
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def dataset():
+    df = build_dataset(rows=400, seed=7)
+    # 边界情况：管理员的帖子与零字数的帖子被过滤，缺失的浏览数，只有一篇文章的作者
+    df['作者'] = df['作者'].cat.add_categories(['Admin_荆棘鸟', '独苗'])
+    df.loc[0, '作者'] = 'Admin_荆棘鸟'
+    df.loc[1, '字数'] = 0
+    df.loc[2, '作者'] = '独苗'
+    df['浏览数'] = df['浏览数'].astype('float64')
+    df.loc[3:5, '浏览数'] = np.nan
+    return df
+
+
+def assert_close(expected: pd.DataFrame, actual: pd.DataFrame):
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False, rtol=1e-9, atol=1e-12)
+
+
+def test_score_posts_parity(dataset):
+    expected = PandasBackend().score_posts(dataset, now=NOW)
+    actual = PolarsBackend().score_posts(dataset, now=NOW)
+
+    assert len(actual) == len(expected) == len(dataset) - 2
+    assert_close(expected[actual.columns], actual)
+
+
+def test_author_scores_parity(dataset):
+    pandas_backend, polars_backend = PandasBackend(), PolarsBackend()
+    expected = pandas_backend.author_scores(pandas_backend.score_posts(dataset, now=NOW))[AUTHOR_COLUMNS]
+    actual = polars_backend.author_scores(polars_backend.score_posts(dataset, now=NOW))
+
+    assert list(actual.index.astype(str)) == list(expected.index.astype(str))
+    assert '独苗' in actual.index and 'Admin_荆棘鸟' not in actual.index
+    assert_close(expected, actual)
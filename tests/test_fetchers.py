@@ -0,0 +1,81 @@
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from conftest import read_fixture
+from fetchers import PrintableFetcher, parse_printable, printable_url
+
+HTML = 'text/html; charset=utf-8'
+FIRST_PAGE_TEXTS = ['第一章 开端', '清晨的雾还没有散。']
+ALL_TEXTS = FIRST_PAGE_TEXTS + ['第二章 相遇', '她在桥头等了很久。', '第三章 尾声', '故事到这里结束。']
+
+
+def thread_route(printable: bytes):
+    """三页的帖子（只看作者），打印视图返回 printable"""
+    def route(path):
+        query = parse_qs(urlparse(path).query)
+        if query.get('action') == ['printable']:
+            return 200, HTML, printable
+        return 200, HTML, read_fixture(f"thread_page{query.get('page', ['1'])[0]}.html")
+    return route
+
+
+def fetch_all(server):
+    thread_url = server.base_url + 'forum.php?mod=viewthread&tid=7&authorid=1'
+    return list(PrintableFetcher().iter_pages(thread_url, lambda url: requests.get(url, timeout=5)))
+
+
+def request_kinds(server):
+    kinds = []
+    for path in server.requests:
+        query = parse_qs(urlparse(path).query)
+        kinds.append('printable' if query.get('action') == ['printable'] else f"page{query.get('page', ['1'])[0]}")
+    return kinds
+
+
+def texts_of(pages):
+    return [text for page in pages for _, text in page.items]
+
+
+def test_printable_view_used(stand_in):
+    server = stand_in(thread_route(read_fixture('printable.html')))
+    pages = fetch_all(server)
+
+    assert request_kinds(server) == ['page1', 'printable']
+    assert [page.page_num for page in pages] == [1, None]
+    assert pages[0].soup is not None and pages[1].soup is None
+    assert not pages[-1].has_more
+    assert texts_of(pages) == ALL_TEXTS
+
+
+@pytest.mark.parametrize('fixture', ['printable_obfuscated.html', 'printable_empty.html'])
+def test_falls_back_to_paginated(stand_in, fixture):
+    server = stand_in(thread_route(read_fixture(fixture)))
+    pages = fetch_all(server)
+
+    # 打印视图不可用时从第二页开始逐页获取，第一页不重复请求
+    assert request_kinds(server) == ['page1', 'printable', 'page2', 'page3']
+    assert [page.page_num for page in pages] == [1, 2, 3]
+    assert all(page.soup is not None for page in pages)
+    assert texts_of(pages) == ALL_TEXTS
+
+
+def test_mismatched_printable_falls_back(stand_in):
+    # 打印视图的开头与第一页不一致（例如缺少第一楼）时不能使用
+    html = read_fixture('printable.html').decode('utf-8').replace('清晨的雾还没有散。', '清晨的雾散了。')
+    server = stand_in(thread_route(html.encode('utf-8')))
+
+    assert [page.page_num for page in fetch_all(server)] == [1, 2, 3]
+
+
+def test_parse_printable():
+    items = parse_printable(read_fixture('printable.html').decode('utf-8'))
+    assert [text for _, text in items] == ALL_TEXTS
+    assert parse_printable(read_fixture('printable_obfuscated.html').decode('utf-8')) is None
+    assert parse_printable(read_fixture('printable_empty.html').decode('utf-8')) is None
+
+
+def test_printable_url_keeps_author_filter():
+    url = printable_url('https://example.com/forum.php?mod=viewthread&tid=7&page=2&authorid=1')
+    assert url == 'https://example.com/forum.php?mod=viewthread&action=printable&tid=7&authorid=1'
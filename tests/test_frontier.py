@@ -0,0 +1,27 @@
+import json
+
+from frontier import Budget, CrawlPlan
+
+
+def test_deferred_pages_saved_and_fetched_first(tmp_path):
+    pending_file = tmp_path / 'pending.json'
+    plan = CrawlPlan(Budget(max_requests=1), pending_file=str(pending_file))
+    plan.defer_pages('中长篇', [5, 3])
+    plan.defer_pages('短篇新区', [1])
+    plan.save_pending()
+
+    assert json.loads(pending_file.read_text(encoding='utf-8'))['pages'] == {'中长篇': [3, 5], '短篇新区': [1]}
+    plan = CrawlPlan(Budget(), pending_file=str(pending_file))
+    assert plan.page_order('中长篇', range(2, 7)) == [3, 5, 2, 4, 6]
+
+    # 本次获取过列表的板块以本次为准，未获取的板块沿用上次的记录
+    plan.save_pending()
+    assert json.loads(pending_file.read_text(encoding='utf-8'))['pages'] == {'短篇新区': [1]}
+
+
+def test_old_pending_format(tmp_path):
+    pending_file = tmp_path / 'pending.json'
+    pending_file.write_text(json.dumps({'7': {'block': '中长篇', 'title': '标题', 'runs': 2}}), encoding='utf-8')
+    plan = CrawlPlan(Budget(), pending_file=str(pending_file))
+    assert plan.carried == {7: {'block': '中长篇', 'title': '标题', 'runs': 2}}
+    assert plan.carried_pages == {}
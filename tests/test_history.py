@@ -0,0 +1,42 @@
+from history import EngagementStore, velocity_features
+
+DAY = 86400
+NOW = 100 * DAY
+
+
+def build_store(path):
+    store = EngagementStore(str(path), keyframe_interval=30)
+    # 7 与 8 在窗口开始前就有快照，窗口内 7 只变化一次，8 没有变化；9 在窗口内才出现
+    store.append('中长篇', [(7, 100, 1, 1, 0), (8, 50, 0, 0, 0)], timestamp=NOW - 40 * DAY)
+    store.append('中长篇', [(7, 200, 2, 1, 1), (8, 50, 0, 0, 0)], timestamp=NOW - 35 * DAY)
+    store.append('中长篇', [(7, 500, 2, 1, 1), (8, 50, 0, 0, 0), (9, 10, 0, 0, 0)], timestamp=NOW - 10 * DAY)
+    store.append('中长篇', [(9, 30, 0, 0, 0)], timestamp=NOW - 5 * DAY)
+    return store
+
+
+def test_query_seeds_window_start(tmp_path):
+    rows = build_store(tmp_path).query(start=NOW - 30 * DAY, end=NOW)
+
+    assert [(ts, tid, views) for ts, _, tid, views, *_ in rows] == [
+        (NOW - 35 * DAY, 7, 200), (NOW - 35 * DAY, 8, 50),
+        (NOW - 10 * DAY, 7, 500), (NOW - 10 * DAY, 9, 10),
+        (NOW - 5 * DAY, 9, 30),
+    ]
+    # 不补起点时只有窗口内的变化
+    assert len(build_store(tmp_path / 'plain').query(start=NOW - 30 * DAY, end=NOW, seed=False)) == 3
+
+
+def test_query_seed_for_selected_tids(tmp_path):
+    rows = build_store(tmp_path).query(tids=[7], start=NOW - 30 * DAY, end=NOW)
+    assert [(ts, views) for ts, _, _, views, *_ in rows] == [(NOW - 35 * DAY, 200), (NOW - 10 * DAY, 500)]
+
+
+def test_velocity_uses_seed(tmp_path):
+    features = velocity_features(build_store(tmp_path), window_days=30, now=NOW)
+
+    # 7 在窗口内只变化一次，以窗口开始前的快照为起点：(500 - 200) / 25 天
+    assert features.loc[7, '浏览增速'] == 12.0
+    assert features.loc[7, '快照数'] == 2
+    assert features.loc[9, '浏览增速'] == 4.0
+    # 8 没有变化，只有起点，无法计算
+    assert 8 not in features.index
@@ -0,0 +1,19 @@
+from ledger import PAGE, FailureLedger
+
+
+def test_record_and_resolve(tmp_path):
+    ledger = FailureLedger(str(tmp_path / 'failures.db'), backoff_minutes=1)
+    assert ledger.record(PAGE, '中长篇#2', '中长篇', 'https://example.com/forum-85-2.html', ValueError('x'), 2,
+                         'html') == 1
+    assert ledger.record(PAGE, '中长篇#2', '中长篇', 'https://example.com/forum-85-2.html', ValueError('y'), 2,
+                         'html') == 2
+    task, = ledger.tasks()
+    assert (task.backend, task.attempts, task.last_error) == ('html', 2, 'y')
+    # 第二次失败后推迟两倍的退避时间
+    assert task.next_retry - task.last_failed == 120
+    assert ledger.tasks(due_only=True) == []
+
+    assert ledger.resolve(PAGE, '中长篇#2')
+    assert not ledger.resolve(PAGE, '中长篇#2')
+    assert len(ledger) == 0
+
@@ -0,0 +1,140 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conftest import read_fixture
+from ledger import PAGE, get_ledger
+from listing import LISTINGS, MobileApiListing, api_page_url, get_listing, parse_forumdisplay
+from util import parse_time
+
+JSON = 'application/json; charset=utf-8'
+HTML = 'text/html; charset=utf-8'
+
+
+def forum_route(api_pages):
+    """api_pages 为 页码 -> 接口返回的内容，列表页 HTML 总是返回同一个录制页面"""
+    def route(path):
+        url = urlparse(path)
+        if url.path == '/api/mobile/index.php':
+            page = int(parse_qs(url.query)['page'][0])
+            return 200, JSON, api_pages[page]
+        if url.path.startswith('/forum-85-'):
+            return 200, HTML, read_fixture('forum_list_page.html')
+        return 404, HTML, b''
+    return route
+
+
+@pytest.fixture
+def api_forum(stand_in, forum_config):
+    server = stand_in(forum_route({1: read_fixture('forumdisplay_page1.json'),
+                                   2: read_fixture('forumdisplay_page2.json')}))
+    forum_config['blocks'] = {'中长篇': server.base_url + 'forum-85-1.html'}
+    return server
+
+
+def test_first_page_records(api_forum):
+    listing = MobileApiListing(page_size=100)
+    page_data, total_pages = listing.first_page(api_forum.base_url + 'forum-85-1.html')
+
+    # 230 个主题、每页 100 个
+    assert total_pages == 3
+    query = parse_qs(urlparse(api_forum.requests[0]).query)
+    assert query['module'] == ['forumdisplay'] and query['fid'] == ['85'] and query['tpp'] == ['100']
+
+    # 被隐藏的 5003 跳过
+    assert sorted(page_data.records) == [5001, 5002, 5004]
+    sticky = page_data.records[5001]
+    assert (sticky.uid, sticky.author, sticky.title) == (11, '置顶作者', '公告 & 说明')
+    assert (sticky.comments, sticky.views) == (12, 3456)
+    # 时间戳加上论坛时区后与页面上的时间文本一致
+    assert sticky.create_time == parse_time('2023-1-2 08:05')
+    assert sticky.update_time == parse_time('2024-10-5 17:11')
+
+    # 没有 dbdateline 时使用 <span title> 中的时间
+    serial = page_data.records[5002]
+    assert (serial.uid, serial.comments, serial.views) == (22, 40, 12000)
+    assert serial.create_time == parse_time('2023-3-4 09:30')
+    assert page_data.records[5004].title == '"引号"标题'
+
+
+def test_later_page(api_forum):
+    listing = MobileApiListing(page_size=100)
+    block_url = api_forum.base_url + 'forum-85-1.html'
+    listing.first_page(block_url)
+    page_data = listing.fetch_page(block_url, 2)
+
+    assert sorted(page_data.records) == [5001, 5101]
+    assert page_data.records[5101].update_time == parse_time('2024-9-1 10:00')
+    assert 'page=2' in api_forum.requests[-1]
+
+
+@pytest.mark.parametrize('threads, tpp, expected', [
+    ('230', '100', 3),
+    ('200', '100', 2),
+    ('0', '100', 1),
+    ('230', '20', 12),
+    # 接口没有返回 tpp 时按请求的每页主题数计算
+    ('230', None, 3),
+])
+def test_page_count(threads, tpp, expected):
+    data = json.loads(read_fixture('forumdisplay_page1.json'))
+    data['Variables']['forum']['threads'] = threads
+    if tpp is None:
+        del data['Variables']['tpp']
+    else:
+        data['Variables']['tpp'] = tpp
+    assert parse_forumdisplay(data, page_size=100)[1] == expected
+
+
+def test_api_page_url():
+    url = api_page_url('https://example.com/forum-85-1.html', 3, 100)
+    assert url == 'https://example.com/api/mobile/index.php?version=4&module=forumdisplay&fid=85&page=3&tpp=100'
+
+
+@pytest.mark.parametrize('body', [
+    b'{"Version": "4", "Variables": {"forum_threadlist": [',
+    b'{}',
+    b'',
+    json.dumps({'Message': {'messageval': 'forum_nonexistence', 'messagestr': '抱歉，指定的版块不存在'}}).encode(),
+])
+def test_falls_back_to_html(stand_in, forum_config, body):
+    server = stand_in(forum_route({1: body, 2: body}))
+    block_url = server.base_url + 'forum-85-1.html'
+    listing = MobileApiListing(page_size=100)
+
+    page_data, total_pages = listing.first_page(block_url)
+    assert total_pages == 4
+    assert sorted(page_data.records) == [6001, 6002]
+    record = page_data.records[6001]
+    assert (record.uid, record.author, record.comments, record.views) == (61, '网页作者甲', 7, 70)
+
+    # 回退后本板块之后的页直接请求 HTML 列表页
+    assert sorted(listing.fetch_page(block_url, 2).records) == [6001, 6002]
+    assert [urlparse(path).path for path in server.requests] == [
+        '/api/mobile/index.php', '/forum-85-1.html', '/forum-85-2.html']
+
+
+def test_failed_page_retries_same_url(stand_in, forum_config, tmp_path):
+    pages = {1: read_fixture('forumdisplay_page1.json'), 2: b'<html>502 Bad Gateway</html>'}
+    server = stand_in(forum_route(pages))
+    block_url = server.base_url + 'forum-85-1.html'
+    forum_config['blocks'] = {'中长篇': block_url}
+    forum_config['ledger'] = {'enabled': True, 'path': str(tmp_path / 'failures.db')}
+    listing = MobileApiListing(page_size=100)
+    listing.first_page(block_url)
+    assert listing.fetch_page(block_url, 2) is None
+
+    # 台账记录实际请求的接口链接与获取方式
+    task, = get_ledger().tasks()
+    assert (task.kind, task.key, task.backend) == (PAGE, '中长篇#2', 'mobile_api')
+    assert task.url == server.base_url.rstrip('/') + server.requests[-1]
+
+    # 之后改回解析 HTML，重试仍请求失败时的接口链接
+    forum_config['listing']['backend'] = 'html'
+    pages[2] = read_fixture('forumdisplay_page2.json')
+    page_data = get_listing(task.backend).fetch_url(task.block, task.url, task.page)
+    assert isinstance(get_listing(task.backend), LISTINGS['mobile_api'])
+    assert sorted(page_data.records) == [5001, 5101]
+    assert server.requests[-1] == server.requests[-2]
+    assert len(get_ledger()) == 0
@@ -0,0 +1,44 @@
+import logging
+import time
+
+from logsetup import RateLimitFilter
+
+
+def make_record(msg, lineno=10, level=logging.ERROR, pathname='/src/forum.py'):
+    return logging.LogRecord('test', level, pathname, lineno, msg, None, None)
+
+
+def test_same_message_is_limited():
+    limiter = RateLimitFilter(burst=2, interval=60)
+    assert [limiter.filter(make_record('获取列表失败')) for _ in range(4)] == [True, True, False, False]
+
+
+def test_different_urls_from_same_line_are_limited():
+    # 日志消息是已格式化的 f-string，每条都带有不同的链接，仍按同一位置计数
+    limiter = RateLimitFilter(burst=20, interval=60)
+    passed = [limiter.filter(make_record(f'已达到最大重试次数，放弃请求: https://example.com/t{i}', lineno=126))
+              for i in range(500)]
+    assert sum(passed) == 20 and all(passed[:20])
+
+
+def test_call_sites_are_counted_separately():
+    limiter = RateLimitFilter(burst=1, interval=60)
+    assert limiter.filter(make_record('登录失效'))
+    assert not limiter.filter(make_record('登录失效'))
+    assert limiter.filter(make_record('登录失效', lineno=11))
+    assert limiter.filter(make_record('登录失效', pathname='/src/util.py'))
+
+
+def test_suppressed_count_reported_after_window():
+    limiter = RateLimitFilter(burst=1, interval=0.05)
+    limiter.filter(make_record('重试失败'))
+    assert not limiter.filter(make_record('重试失败'))
+    time.sleep(0.06)
+    record = make_record('重试失败')
+    assert limiter.filter(record)
+    assert '被省略 1 条' in record.msg
+
+
+def test_info_not_limited():
+    limiter = RateLimitFilter(burst=1, interval=60)
+    assert all(limiter.filter(make_record('进度', level=logging.INFO)) for _ in range(5))
@@ -0,0 +1,168 @@
+import re
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from conftest import read_fixture
+from myThread import thread_spider
+from store import get_output_store
+from thread_state import fingerprint, open_state_store
+
+HTML = 'text/html; charset=utf-8'
+BLOCK = '中长篇'
+TITLE = '测试长篇'
+
+
+def thread_route(posts):
+    """
+    posts 为 页码 -> 该页的段落，按录制的帖子页生成页面并加上"共 N 页"的分页栏；
+    测试修改 posts 模拟作者追加内容或新增页面，第 3 页之后沿用第 3 页的录制页面
+    """
+    def route(path):
+        page = int(parse_qs(urlparse(path).query)['page'][0])
+        if page not in posts:
+            return 404, HTML, b''
+        html = read_fixture(f'thread_page{min(page, 3)}.html').decode('utf-8')
+        body = '<br />\n'.join(posts[page])
+        html = re.sub(r'(<td class="t_f"[^>]*><div>).*?(</div>)', lambda m: m.group(1) + body + m.group(2),
+                      html, flags=re.DOTALL)
+        pager = f'<strong>{page}</strong><span title="共 {len(posts)} 页"> / {len(posts)} 页</span>'
+        if page < len(posts):
+            pager += (f'<a href="forum.php?mod=viewthread&amp;tid=7&amp;page={page + 1}&amp;authorid=1" '
+                      f'class="nxt">下一页</a>')
+        html = re.sub(r'<div class="pg">.*?</div>', f'<div class="pg">{pager}</div>', html, flags=re.DOTALL)
+        return 200, HTML, html.encode('utf-8')
+    return route
+
+
+def requested_pages(server, since=0):
+    return [int(parse_qs(urlparse(path).query)['page'][0]) for path in server.requests[since:]]
+
+
+def all_texts(posts):
+    return [text for page in sorted(posts) for text in posts[page]]
+
+
+@pytest.fixture(params=['docx', 'packed'])
+def partial_forum(request, stand_in, forum_config, tmp_path, monkeypatch):
+    """开启增量更新的替身论坛，正文分别保存为 docx 与打包存储"""
+    # docx 固定保存在当前目录的 小说输出/ 下
+    monkeypatch.chdir(tmp_path)
+    forum_config['partial_update'] = {'enabled': True, 'path': str(tmp_path / 'state.db')}
+    forum_config['output'] = {'store': request.param, 'packed_dir': str(tmp_path / 'packed')}
+    posts = {1: ['第一章 开端', '清晨的雾还没有散。'],
+             2: ['第二章 相遇', '她在桥头等了很久。'],
+             3: ['第三章 尾声', '故事到这里结束。']}
+    server = stand_in(thread_route(posts))
+    thread_url = server.base_url + 'forum.php?mod=viewthread&tid=7&page=1&authorid=1'
+    return server, posts, thread_url
+
+
+def crawl(thread_url):
+    return thread_spider(thread_url, BLOCK, False, author='作者')
+
+
+def saved_texts():
+    return get_output_store().texts(7, BLOCK, TITLE)
+
+
+def saved_state():
+    from util import CONFIG
+    return open_state_store(CONFIG['partial_update']['path']).get(7)
+
+
+def test_full_crawl_saves_state(partial_forum):
+    server, posts, thread_url = partial_forum
+    assert crawl(thread_url) == ('12', '3', sum(map(len, all_texts(posts))))
+    assert requested_pages(server) == [1, 2, 3]
+
+    state = saved_state()
+    assert (state.pages, state.first_items, state.last_items) == (3, 2, 2)
+    assert state.first_fingerprint == fingerprint(posts[1])
+    assert state.last_fingerprint == fingerprint(posts[3])
+    assert state.path == get_output_store().location(7, BLOCK, TITLE)
+
+
+def test_unchanged_thread_fetches_first_and_last_page(partial_forum):
+    server, posts, thread_url = partial_forum
+    crawl(thread_url)
+    before = len(server.requests)
+
+    crawl(thread_url)
+    assert requested_pages(server, before) == [1, 3]
+    assert saved_texts() == all_texts(posts)
+
+
+def test_posts_appended_to_last_page(partial_forum):
+    server, posts, thread_url = partial_forum
+    crawl(thread_url)
+    before = len(server.requests)
+
+    posts[3] += ['番外 后记', '多年以后他们又见面了。']
+    _, _, words = crawl(thread_url)
+    assert requested_pages(server, before) == [1, 3]
+    assert saved_texts() == all_texts(posts)
+    assert words == sum(map(len, all_texts(posts)))
+
+    state = saved_state()
+    assert (state.pages, state.last_items, state.words) == (3, 4, words)
+    assert state.last_fingerprint == fingerprint(posts[3])
+    assert state.first_fingerprint == fingerprint(posts[1])
+
+
+def test_new_pages_appended(partial_forum):
+    server, posts, thread_url = partial_forum
+    crawl(thread_url)
+    before = len(server.requests)
+
+    posts[3].append('未完待续。')
+    posts[4] = ['第四章 重逢', '雨停了。']
+    posts[5] = ['第五章 归途']
+    _, _, words = crawl(thread_url)
+    assert requested_pages(server, before) == [1, 3, 4, 5]
+    assert saved_texts() == all_texts(posts)
+
+    state = saved_state()
+    assert (state.pages, state.last_items, state.words) == (5, 1, words)
+    assert state.last_fingerprint == fingerprint(posts[5])
+
+    # 之后的更新从新的最后一页开始比对
+    posts[5].append('全文完。')
+    before = len(server.requests)
+    crawl(thread_url)
+    assert requested_pages(server, before) == [1, 5]
+    assert saved_texts() == all_texts(posts)
+
+
+def test_changed_last_page_recrawls(partial_forum):
+    server, posts, thread_url = partial_forum
+    crawl(thread_url)
+    before = len(server.requests)
+
+    posts[3] = ['第三章 尾声（修订）', '故事到这里结束。', '修订后新增的一段。']
+    crawl(thread_url)
+    # 比对最后一页不一致后完整重新爬取，正文被整篇覆盖而不是追加
+    assert requested_pages(server, before) == [1, 3, 1, 2, 3]
+    assert saved_texts() == all_texts(posts)
+
+    state = saved_state()
+    assert (state.pages, state.last_items) == (3, 3)
+    assert state.last_fingerprint == fingerprint(posts[3])
+
+
+def test_single_page_thread(partial_forum):
+    server, posts, thread_url = partial_forum
+    del posts[2], posts[3]
+    crawl(thread_url)
+    assert saved_state().pages == 1
+    before = len(server.requests)
+
+    # 上次只有一页时第一页就是最后一页，只请求一次
+    posts[1].append('第一章 续')
+    _, _, words = crawl(thread_url)
+    assert requested_pages(server, before) == [1]
+    assert saved_texts() == posts[1]
+
+    state = saved_state()
+    assert (state.pages, state.first_items, state.last_items, state.words) == (1, 3, 3, words)
+    assert state.first_fingerprint == state.last_fingerprint == fingerprint(posts[1])
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from forum import ThreadRecord, _relocate_saved
+from registry import TidRegistry
+from store import ThreadContent, get_output_store
+
+
+def crawl(link, block_name, calls):
+    calls.append((link, block_name))
+    return 1, 2, 3
+
+
+def record(tid, title):
+    return ThreadRecord(tid=tid, uid=1, title=title, author='作者', comments=0, views=0, update_time=0, create_time=0)
+
+
+def test_fetch_saves_under_owner_known_at_start():
+    registry = TidRegistry(['中长篇', '短篇新区'])
+    registry.claim(7, '中长篇')
+    calls = []
+
+    # 后面的板块先开始爬取，正文仍保存在归属板块下
+    assert registry.fetch(7, '短篇新区', crawl, 'link', calls=calls) == (1, 2, 3)
+    assert registry.fetch(7, '中长篇', crawl, 'link', calls=calls) == (1, 2, 3)
+    assert calls == [('link', '中长篇')]
+    assert registry.saved_block(7) == '中长篇'
+
+
+def test_concurrent_fetch_runs_once():
+    registry = TidRegistry(['中长篇', '短篇新区'])
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow(link, block_name):
+        calls.append(block_name)
+        started.set()
+        release.wait(5)
+        return 1, 1, 1
+
+    first = threading.Thread(target=registry.fetch, args=(7, '短篇新区', slow, 'link'))
+    first.start()
+    started.wait(5)
+    results = []
+    second = threading.Thread(target=lambda: results.append(registry.fetch(7, '中长篇', slow, 'link')))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+    assert calls == ['短篇新区'] and results == [(1, 1, 1)]
+    # 开始爬取后才列出的更靠前的板块成为归属板块，正文需要移动
+    assert registry.owner(7) == '中长篇' and registry.saved_block(7) == '短篇新区'
+
+
+def test_release_crawls_again():
+    registry = TidRegistry(['中长篇'])
+    calls = []
+    registry.fetch(7, '中长篇', crawl, 'link', calls=calls)
+    registry.release(7)
+    registry.fetch(7, '中长篇', crawl, 'link', calls=calls)
+    assert len(calls) == 2 and registry.owns(7, '中长篇')
+
+
+@pytest.mark.parametrize('store', ['docx', 'packed'])
+def test_relocate_saved(forum_config, tmp_path, monkeypatch, store):
+    monkeypatch.chdir(tmp_path)
+    forum_config['output'] = {'store': store, 'packed_dir': str(tmp_path / 'packed')}
+    output = get_output_store()
+    content = ThreadContent()
+    content.add_paragraph('正文')
+    output.save(7, '短篇新区', '标题', '作者', content)
+
+    registry = TidRegistry(['中长篇', '短篇新区'])
+    registry.fetch(7, '短篇新区', lambda block_name: None)
+    registry.claim(7, '中长篇')
+    _relocate_saved(registry, '中长篇', [record(7, '标题')])
+
+    assert registry.saved_block(7) == '中长篇'
+    assert output.texts(7, '中长篇', '标题') == ['正文']
+    if store == 'docx':
+        assert not output.exists(7, '短篇新区', '标题')
+    else:
+        assert output.get(7).block == '中长篇'
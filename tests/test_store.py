@@ -0,0 +1,91 @@
+import pytest
+
+from store import RECORD_HEADER, RECORD_MAGIC, PackedStore, ThreadContent
+
+
+def content_of(*items):
+    return ThreadContent(list(items))
+
+
+@pytest.fixture
+def packed(tmp_path):
+    # 分段很小，每条记录之后即换新分段
+    return PackedStore(str(tmp_path / 'packed'), segment_bytes=64)
+
+
+def test_content_round_trip():
+    content = content_of('第一段', b'\x89PNG\r\n', '', '第二段')
+    assert ThreadContent.decode(content.encode()) == content
+    assert content.texts() == ['第一段', '第二段']
+
+
+def test_record_framing(packed):
+    packed.save(1, '中长篇', '标题', '作者', content_of('正文'))
+    segment, = packed._segments()
+    data = packed._segment_path(segment).read_bytes()
+
+    magic, header_len, payload_len, _ = RECORD_HEADER.unpack_from(data)
+    assert magic == RECORD_MAGIC
+    assert len(data) == RECORD_HEADER.size + header_len + payload_len
+    meta = data[RECORD_HEADER.size:RECORD_HEADER.size + header_len].decode('utf-8')
+    assert '"kind": "full"' in meta and '"title": "标题"' in meta
+
+
+def test_append_keeps_order(packed):
+    packed.save(1, '中长篇', '标题', '作者', content_of('一', '二'))
+    packed.save(2, '中长篇', '另一篇', None, content_of('其他'))
+    packed.append(1, '中长篇', '标题', '作者', content_of('三'))
+    packed.append(1, '中长篇', '标题', '作者', content_of(b'img', '四'))
+
+    stored = packed.get(1)
+    assert (stored.block, stored.title, stored.author) == ('中长篇', '标题', '作者')
+    assert stored.content.items == ['一', '二', '三', b'img', '四']
+    assert packed.texts(2, '中长篇', '另一篇') == ['其他']
+    # 记录分散在多个分段中
+    assert len(packed._segments()) == 4
+    assert packed.stats()['chunks'] == 4
+
+
+def test_save_overwrites_appended_records(packed):
+    packed.save(1, '中长篇', '标题', '作者', content_of('旧'))
+    packed.append(1, '中长篇', '标题', '作者', content_of('旧的追加'))
+    packed.save(1, '中长篇', '新标题', '作者', content_of('新'))
+
+    assert packed.get(1).content.items == ['新']
+    assert packed.get(1).title == '新标题'
+    stats = packed.stats()
+    assert stats['chunks'] == 1 and stats['garbage_bytes'] > 0
+
+
+def test_corrupted_record_detected(packed):
+    packed.save(1, '中长篇', '标题', '作者', content_of('正文' * 10))
+    path = packed._segment_path(packed._segments()[0])
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match='已损坏'):
+        packed.get(1)
+
+
+def test_compact_keeps_content(packed):
+    packed.save(1, '中长篇', '标题', '作者', content_of('旧'))
+    packed.save(2, '短篇', '第二篇', None, content_of('二'))
+    packed.append(2, '短篇', '第二篇', None, content_of(b'img', '二续'))
+    packed.save(1, '中长篇', '标题', '作者', content_of('新', '新的第二段'))
+    packed.append(1, '中长篇', '标题', '作者', content_of('追加'))
+    expected = {tid: packed.get(tid) for tid in packed.tids()}
+    garbage_segment = packed._segment_path(packed._segments()[0])
+
+    result = packed.compact(min_garbage_ratio=0.3)
+    assert result['segments'] == 1 and result['reclaimed_bytes'] > 0
+    assert not garbage_segment.exists()
+    assert {tid: packed.get(tid) for tid in packed.tids()} == expected
+    assert packed.stats()['garbage_bytes'] == 0
+
+    # 压缩全部分段后每篇文章只剩一条记录，之后仍可追加
+    packed.compact(min_garbage_ratio=0)
+    assert packed.stats()['chunks'] == 2
+    assert {tid: packed.get(tid) for tid in packed.tids()} == expected
+    packed.append(2, '短篇', '第二篇', None, content_of('再续'))
+    assert packed.texts(2, '短篇', '第二篇') == ['二', '二续', '再续']
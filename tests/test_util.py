@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+import util
+from frontier import Budget, BudgetExhausted
+
+
+@pytest.fixture
+def live_requests(forum_config, tmp_path, monkeypatch):
+    """按配置的重试策略真实请求，请求头从临时目录的 headers.json 读取"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'headers.json').write_text(json.dumps({'User-Agent': 'test'}), encoding='utf-8')
+    monkeypatch.setattr(util, '_retrying_get', util.retry_with_logging(retry_times=3, wait_multiplier=1,
+                                                                      wait_max=1)(util._get))
+    monkeypatch.setattr(util, '_session', None)
+    yield
+    util.set_request_budget(None)
+
+
+def test_budget_counts_each_retry(stand_in, live_requests):
+    server = stand_in(lambda path: (500, 'text/html', b'x' * 10000))
+    budget = Budget(max_requests=2)
+    util.set_request_budget(budget)
+
+    # 第三次尝试前预算已用尽，不再发出请求，也不再重试
+    with pytest.raises(BudgetExhausted):
+        util.make_request(server.base_url + 'forum-85-1.html')
+    assert len(server.requests) == 2
+    # 失败的尝试同样计入流量
+    assert budget.requests == 2 and budget.bytes == 20000
+
+
+def test_budget_exhausted_is_not_retried(stand_in, live_requests):
+    server = stand_in(lambda path: (200, 'text/html', b'<html>' + b'x' * 10000 + b'</html>'))
+    util.set_request_budget(Budget(max_bytes=5000))
+
+    util.make_request(server.base_url + 'forum-85-1.html')
+    with pytest.raises(BudgetExhausted):
+        util.make_request(server.base_url + 'forum-85-2.html')
+    assert len(server.requests) == 1
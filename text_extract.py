@@ -0,0 +1,65 @@
+from typing import Iterable, Iterator, Tuple
+
+# 需要整个移除的标签
+UNWANTED_TAG_NAMES = frozenset(['br', 'a', 'i'])
+# 删除不合法的 XML 控制字符，\t \n \r 保留下来作为空白参与折叠
+CONTROL_CHAR_TABLE = str.maketrans({chr(i): None for i in range(32) if chr(i) not in '\t\n\r'})
+
+
+def _is_unwanted(tag) -> bool:
+    """隐藏内容、干扰码、换行/链接/斜体标签以及引用块都不属于正文"""
+    if tag.name in UNWANTED_TAG_NAMES:
+        return True
+    if tag.get('style') == 'display:none':
+        return True
+    classes = tag.get('class') or ()
+    return 'jammer' in classes or (tag.name == 'div' and 'quote' in classes)
+
+
+def strip_unwanted(container) -> None:
+    """
+    一次遍历移除容器内所有不需要的节点，被移除节点的子孙不再访问
+    """
+    stack = [child for child in container.children if child.name]
+    while stack:
+        tag = stack.pop()
+        if _is_unwanted(tag):
+            tag.decompose()
+        else:
+            stack.extend(child for child in tag.children if child.name)
+
+
+def clean_text(text: str) -> str:
+    """移除控制字符，并将连续空白折叠为单个空格"""
+    text = ' '.join(text.split())
+    # 控制字符很少出现，先用 C 实现的 isprintable 判断，只在需要时查表删除
+    if not text.isprintable():
+        text = ' '.join(text.translate(CONTROL_CHAR_TABLE).split())
+    return text
+
+
+def iter_paragraphs(t_f: Iterable) -> Iterator[Tuple[object, str]]:
+    """
+    依次返回正文容器中每个子节点及其清理后的文本，文本可能为空
+
+    调用前需先对容器执行 strip_unwanted
+    """
+    for tags in t_f:
+        for tag in tags:
+            if tag.name == 'script':
+                continue
+            yield tag, clean_text(tag.text)
+
+
+def extract_text(t_f: Iterable) -> Tuple[list, int]:
+    """移除无关节点并提取正文段落，返回段落列表和总字数"""
+    paragraphs = []
+    word_count = 0
+    for tags in t_f:
+        strip_unwanted(tags)
+    for _, text in iter_paragraphs(t_f):
+        if text:
+            paragraphs.append(text)
+            word_count += len(text)
+    return paragraphs, word_count
+
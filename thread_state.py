@@ -0,0 +1,87 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import astuple, dataclass, fields
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_stores: Dict[Tuple[str, int], 'ThreadStateStore'] = {}
+_stores_lock = threading.Lock()
+
+
+def open_state_store(path: str = 'thread_state/state.db') -> 'ThreadStateStore':
+    """返回路径对应的共享状态库实例，每个进程各自打开连接"""
+    key = (str(Path(path).resolve()), os.getpid())
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ThreadStateStore(path)
+        return _stores[key]
+
+
+def fingerprint(texts: List[str]) -> str:
+    """一组段落文本的指纹，图片等无文字的段落以空字符串参与计算"""
+    return hashlib.blake2b('\n'.join(texts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+@dataclass
+class ThreadState:
+    """
+    上次完整保存一篇文章时的状态
+
+    first_* 与 last_* 为第一页与最后一页当时的段落数及其指纹，
+    再次爬取时两页的前若干段落不变即可只追加新的内容
+    """
+    tid: int
+    pages: int
+    first_items: int
+    first_fingerprint: str
+    last_items: int
+    last_fingerprint: str
+    words: int
+    path: str
+    updated_at: int = 0
+
+
+class ThreadStateStore:
+    """每篇文章的页数、首末页指纹与文档路径，用于只下载新增页面的增量更新"""
+
+    def __init__(self, path: str = 'thread_state/state.db'):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS threads (
+                tid INTEGER PRIMARY KEY,
+                pages INTEGER NOT NULL,
+                first_items INTEGER NOT NULL,
+                first_fingerprint TEXT NOT NULL,
+                last_items INTEGER NOT NULL,
+                last_fingerprint TEXT NOT NULL,
+                words INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+        self._conn.commit()
+        self._columns = ', '.join(field.name for field in fields(ThreadState))
+
+    def get(self, tid: int) -> Optional[ThreadState]:
+        with self._lock:
+            row = self._conn.execute(f'SELECT {self._columns} FROM threads WHERE tid = ?', (tid,)).fetchone()
+        return ThreadState(*row) if row else None
+
+    def put(self, state: ThreadState) -> None:
+        state.updated_at = int(time.time())
+        with self._lock:
+            self._conn.execute(f'INSERT OR REPLACE INTO threads ({self._columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               astuple(state))
+            self._conn.commit()
+
+    def remove(self, tid: int) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM threads WHERE tid = ?', (tid,))
+            self._conn.commit()
@@ -1,3 +1,4 @@
+import calendar
 import csv
 import logging
 import re
@@ -11,6 +12,10 @@ import threading
 from retrying import retry
 import requests
 import yaml
+from fatal import FatalError, cancel_token, classify_response
+from frontier import BudgetExhausted
+from logsetup import log_fields
+from profiling import profile_stage
 import os
 
 
@@ -20,8 +25,33 @@ def load_config(config_path: str = "config.yaml") -> dict:
         return yaml.safe_load(f)
 
 
-# 加载全局配置
-CONFIG = load_config()
+# 全局配置，由入口程序调用 init_config 显式加载
+CONFIG: Dict[str, Any] = {}
+# 按配置构造的带重试请求函数
+_retrying_get = None
+# 本次运行的请求预算，由 set_request_budget 设置，需提供 check 与 charge 方法
+_request_budget = None
+# 所有请求共用的会话，复用到论坛的连接
+_session = None
+_session_lock = threading.Lock()
+
+
+def init_config(config_path: str = "config.yaml") -> dict:
+    """
+    加载配置文件到全局 CONFIG，并按配置构造请求重试策略
+
+    原地更新 CONFIG，使通过 from util import * 导入的模块也能看到最新配置
+    """
+    global _retrying_get
+    config = load_config(config_path)
+    CONFIG.clear()
+    CONFIG.update(config)
+    _retrying_get = retry_with_logging(
+        retry_times=CONFIG['request']['retry_times'],
+        wait_multiplier=CONFIG['request']['wait_multiplier'],
+        wait_max=CONFIG['request']['wait_max']
+    )(_get)
+    return CONFIG
 
 
 class FileHandler:
@@ -66,7 +96,8 @@ def retry_with_logging(retry_times=3, wait_multiplier=1000, wait_max=10000):
             stop_max_attempt_number=retry_times,
             wait_exponential_multiplier=wait_multiplier,
             wait_exponential_max=wait_max,
-            retry_on_exception=lambda e: isinstance(e, (
+            # 致命错误与预算用尽不重试
+            retry_on_exception=lambda e: not isinstance(e, (FatalError, BudgetExhausted)) and isinstance(e, (
             requests.Timeout, requests.ConnectionError, requests.RequestException))
         )
         def wrapper(*args, **kwargs):
@@ -88,9 +119,13 @@ def retry_with_logging(retry_times=3, wait_multiplier=1000, wait_max=10000):
                 # print(f'第 {current_attempt} 次请求成功，耗时: {time.time() - startTime:.2f}秒。')
                 wrapper._retry_count[thread_id] = 0
                 return result
+            except (FatalError, BudgetExhausted):
+                # 致命错误与预算用尽不重试
+                wrapper._retry_count[thread_id] = 0
+                raise
             except Exception as e:
                 if current_attempt >= retry_times:
-                    print(f"已达到最大重试次数，放弃请求: {url}")
+                    logging.error(f"已达到最大重试次数，放弃请求: {url}", extra=log_fields(stage='request'))
                     wrapper._retry_count[thread_id] = 0
                 raise
 
@@ -99,15 +134,66 @@ def retry_with_logging(retry_times=3, wait_multiplier=1000, wait_max=10000):
     return decorator
 
 
-@retry_with_logging(
-    retry_times=CONFIG['request']['retry_times'],
-    wait_multiplier=CONFIG['request']['wait_multiplier'],
-    wait_max=CONFIG['request']['wait_max']
-)
+def set_request_budget(budget) -> None:
+    """设置请求预算，预算用尽后 make_request 抛出 frontier.BudgetExhausted，传入 None 取消限制"""
+    global _request_budget
+    _request_budget = budget
+
+
 def make_request(url: str) -> requests.Response:
+    if _retrying_get is None:
+        raise RuntimeError("配置尚未加载，请先调用 init_config()")
+    # 本次运行已因致命错误取消时不再发出请求
+    cancel_token.check()
+    response = _retrying_get(url)
+    _archive_response(url, response)
+    return response
+
+
+def _archive_response(url: str, response: requests.Response) -> None:
+    """按配置将抓取到的原始页面存入归档，归档失败不影响爬取"""
+    archive_config = CONFIG.get('archive') or {}
+    if not archive_config.get('enabled'):
+        return
+    try:
+        from archive import open_archive
+        open_archive(archive_config.get('dir', 'archive')).put(url, response.content, response.encoding)
+    except Exception as e:
+        logging.error(f"归档页面 {url} 失败: {e}")
+
+
+def get_session() -> requests.Session:
+    """返回共享的请求会话，连接池大小按线程池配置，避免并发请求时反复建立连接"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            spider_config = CONFIG.get('spider') or {}
+            # 每个板块的列表页与文章线程池各自并发请求
+            pool_size = spider_config.get('thread_pool_size', 1) * max(spider_config.get('page_thread_pool_size', 10), 10)
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def _get(url: str) -> requests.Response:
+    # 每次请求重新读取请求头，长时间运行时更新 cookie 无需重启
     headers = FileHandler().load_json('headers.json')
     timeout = CONFIG['request']['timeout']
-    response = requests.get(url, headers=headers, timeout=timeout)
+    cancel_token.check()
+    # 预算按每次实际发出的请求计算，重试同样计入次数、流量与时间
+    budget = _request_budget
+    if budget is not None:
+        budget.check()
+    response = get_session().get(url, headers=headers, timeout=timeout)
+    if budget is not None:
+        budget.charge(len(response.content))
+    # 登录失效、被禁止与维护页在重试之前识别，取消整个运行
+    error = classify_response(response.status_code, response.content, response.encoding, CONFIG.get('fatal'))
+    if error is not None:
+        cancel_token.cancel(error)
+        raise error
     response.raise_for_status()
     return response
 
@@ -115,6 +201,8 @@ def make_request(url: str) -> requests.Response:
 # 定义一个互斥锁
 map_lock = threading.Lock()
 csv_lock = threading.Lock()
+# matplotlib 的 pyplot 状态不是线程安全的，并发分析时绘图需串行
+plot_lock = threading.Lock()
 
 
 def extract_tid_from_url(url: str) -> str:
@@ -129,28 +217,56 @@ def extract_tid_from_url(url: str) -> str:
     return None
 
 
-def write_to_csv(titleList, authorList, commentList, viewList, block_name, update_timeList, urlList, filename,
-                 recommend_list, favorite_list, create_timeList, word_counts):
-    logging.info(f'开始写入 {block_name} 数据到 CSV 文件')
+# data.csv 的表头
+CSV_HEADER = ['标题', '作者', '评论数', '浏览数', '点赞数', '收藏数', '字数',
+              '板块', '发表时间', '更新时间', '链接']
+# 论坛使用的时间格式
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+# 解析失败时使用的默认时间
+DEFAULT_TIME = '1990-1-1 00:00'
+
+
+def parse_time(text: str) -> int:
+    """将论坛时间文本解析为时间戳（秒），时间按 UTC 处理以避免夏令时影响"""
+    for time_format in (TIME_FORMAT, '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(text.strip(), time_format))
+        except (ValueError, AttributeError):
+            continue
+    return calendar.timegm(time.strptime(DEFAULT_TIME, TIME_FORMAT))
+
+
+def format_time(timestamp: int) -> str:
+    """将时间戳格式化为论坛时间文本"""
+    return time.strftime(TIME_FORMAT, time.gmtime(timestamp))
+
+
+def parse_count(text) -> int:
+    """将页面上的计数文本解析为整数，支持"1.2万"这样的写法"""
+    if isinstance(text, int):
+        return text
+    text = str(text).strip().replace(',', '')
+    try:
+        if text.endswith('万'):
+            return int(float(text[:-1]) * 10000)
+        return int(float(text))
+    except ValueError:
+        return 0
+
+
+def write_to_csv(records, block_name, filename):
+    """将主题记录写入 CSV 文件，记录需提供 tid 属性和 to_row 方法"""
+    logging.info(f'开始写入 {block_name} 数据到 CSV 文件', extra=log_fields(block=block_name, stage='write_csv'))
 
     # 准备新数据
-    new_data = {}
-    for i in range(len(titleList)):
-        tid = extract_tid_from_url(urlList[i])
-        if tid:
-            new_data[tid] = [
-                titleList[i], authorList[i], commentList[i], viewList[i],
-                recommend_list[i], favorite_list[i], word_counts[i], block_name,
-                create_timeList[i], update_timeList[i], urlList[i]
-            ]
-
-    with csv_lock:
+    new_data = {str(record.tid): record.to_row(block_name) for record in records}
+
+    with csv_lock, profile_stage('write_csv'):
         # 如果文件不存在,创建新文件
         if not Path(filename).exists():
             with open(filename, 'w', newline='', encoding='utf-8-sig') as csvfile:
                 writer = csv.writer(csvfile)
-                writer.writerow(['标题', '作者', '评论数', '浏览数', '点赞数', '收藏数', '字数',
-                                 '板块', '发表时间', '更新时间', '链接'])
+                writer.writerow(CSV_HEADER)
 
         # 更新CSV文件
         update_csv(new_data, filename)
@@ -158,17 +274,20 @@ def write_to_csv(titleList, authorList, commentList, viewList, block_name, updat
 
 def download_image(img_url):
     """
-    下载图片并返回图片流
+    下载图片并返回图片流，本次运行已取消时返回 None
     """
+    if cancel_token.cancelled():
+        return None
     try:
         start_time = time.time()
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36 Edg/112.0.1722.34',
             'Referer': 'https://www.jingjiniao.info/'
         }
-        img_data = requests.get(img_url, headers=headers, timeout=20).content
+        img_data = get_session().get(img_url, headers=headers, timeout=20).content
         end_time = time.time()
-        logging.info(f'下载图片 {img_url} 耗时: {end_time - start_time:.2f}秒')
+        logging.info(f'下载图片 {img_url} 耗时: {end_time - start_time:.2f}秒',
+                     extra=log_fields(stage='image', duration=end_time - start_time))
         return BytesIO(img_data)  # 返回图片流
     except:
         logging.error(f'图片 {img_url} 下载失败')
@@ -0,0 +1,281 @@
+import calendar
+import concurrent.futures
+import json
+import logging
+import signal
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fatal import FatalError, cancel_token, preflight
+from forum import (ForumData, ThreadRecord, _attach_failed_rows, _process_thread_results, _record_history,
+                   _relocate_saved, threadWrapper)
+from listing import get_listing
+from logsetup import log_fields
+from recrawl import load_stored_rows
+from registry import TidRegistry
+from util import *
+
+
+@dataclass
+class BlockState:
+    """单个板块的轮询状态，时间均为本机时间戳"""
+    name: str
+    url: str
+    interval: float
+    next_poll: float = 0.0
+    last_poll: float = 0.0
+    # 估计的每秒更新主题数
+    rate: float = 0.0
+    polls: int = 0
+    changed: int = 0
+
+
+class Watcher:
+    """
+    常驻的板块监视器
+
+    每个板块按各自的间隔只拉取第一页，与内存中已知的更新时间比较，只爬取有变化的主题；
+    间隔根据第一页上主题的更新频率自动调整，活跃板块轮询更频繁，长期不更新的板块接近停止轮询。
+    请求会话、已知更新时间与线程池在整个运行期间保持；
+    同时出现在多个板块的主题与完整爬取一样，由登记表按配置顺序确定归属板块，行与正文都写在归属板块下
+    """
+
+    def __init__(self, blocks: Dict[str, str], download_images: bool = False, watch_config: Optional[dict] = None,
+                 filename: str = 'data.csv'):
+        watch_config = watch_config or {}
+        self.download_images = download_images
+        self.filename = filename
+        self.min_interval = watch_config.get('min_interval', 300)
+        self.max_interval = watch_config.get('max_interval', 86400)
+        self.target_changes = watch_config.get('target_changes', 1)
+        self.max_pages = watch_config.get('max_pages', 5)
+        self.recent_window = watch_config.get('recent_window_days', 7) * 86400
+        self.state_file = Path(watch_config.get('state_file', 'watch/state.json'))
+        self.stop_event = threading.Event()
+
+        initial = watch_config.get('initial_interval', 1800)
+        self.states = {name: BlockState(name, url, initial) for name, url in blocks.items()}
+        self._load_state()
+
+        # tid -> 已爬取的更新时间戳，开始爬取时即更新，失败后恢复，避免其他板块重复爬取
+        self._seen_lock = threading.Lock()
+        self.last_seen: Dict[int, int] = {
+            int(tid): parse_time(row['更新时间']) for tid, row in load_stored_rows(filename).items()
+        }
+        # 登记表在整个运行期间保留各板块列出过的主题，主题爬取完成后丢弃结果，下次更新时重新爬取
+        self.registry = TidRegistry(list(blocks))
+        self._thread_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=CONFIG['spider']['page_thread_pool_size'], thread_name_prefix='watch-thread')
+
+    def _load_state(self) -> None:
+        """恢复上次运行的轮询间隔，配置中已删除的板块忽略"""
+        if not self.state_file.exists():
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"读取监视状态 {self.state_file} 失败: {e}")
+            return
+        for name, state in self.states.items():
+            if name in saved:
+                for key in ('interval', 'next_poll', 'last_poll', 'rate', 'polls', 'changed'):
+                    setattr(state, key, saved[name].get(key, getattr(state, key)))
+                state.interval = min(max(state.interval, self.min_interval), self.max_interval)
+
+    def _save_state(self) -> None:
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_file.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({name: asdict(state) for name, state in self.states.items()}, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.state_file)
+
+    def poll(self, state: BlockState) -> int:
+        """
+        轮询一个板块，返回有变化的主题数
+
+        列表页按最后回复时间排序，第一页全部有变化时才继续拉取下一页
+        """
+        listed: List[ThreadRecord] = []
+        changed: List[ThreadRecord] = []
+        previous: Dict[int, int] = {}
+        listing = get_listing()
+        last_page_num = self.max_pages
+        for page_num in range(1, self.max_pages + 1):
+            if page_num > last_page_num:
+                break
+            if page_num == 1:
+                try:
+                    page_data, last_page_num = listing.first_page(state.url)
+                except FatalError:
+                    raise
+                except Exception as e:
+                    logging.error(f'获取 {state.name} 列表失败: {e}')
+                    break
+            else:
+                page_data = listing.fetch_page(state.url, page_num)
+            if not page_data:
+                break
+            page_changed = 0
+            with self._seen_lock:
+                for record in page_data:
+                    listed.append(record)
+                    self.registry.claim(record.tid, state.name)
+                    seen = self.last_seen.get(record.tid)
+                    if seen is not None and record.update_time <= seen:
+                        continue
+                    previous[record.tid] = seen
+                    self.last_seen[record.tid] = record.update_time
+                    changed.append(record)
+                    page_changed += 1
+            if page_changed < len(page_data):
+                break
+
+        if listed:
+            self._update_interval(state, listed)
+        crawled = ForumData()
+        if changed:
+            logging.info(f"{state.name} 有 {len(changed)} 个主题更新", extra=log_fields(block=state.name, stage='watch'))
+            self._crawl(state.name, changed, previous, crawled)
+        _record_history(state.name, listed, crawled)
+        cancel_token.check()
+        return len(changed)
+
+    def _crawl(self, block_name: str, changed: List[ThreadRecord], previous: Dict[int, Optional[int]],
+               crawled: ForumData) -> None:
+        future_to_record = {
+            self._thread_executor.submit(self.registry.fetch, record.tid, block_name, threadWrapper, record.link,
+                                         name=record.title, download_images=self.download_images,
+                                         author=record.author): record
+            for record in changed
+        }
+        completed = _process_thread_results(future_to_record)
+        for record in changed:
+            self.registry.release(record.tid)
+
+        succeeded = []
+        with self._seen_lock:
+            for record in changed:
+                # 失败的主题恢复已知的更新时间以便下次轮询重试，也不覆盖原有数据
+                if record.tid in completed:
+                    succeeded.append(record)
+                    crawled.add_thread(record)
+                elif previous[record.tid] is None:
+                    del self.last_seen[record.tid]
+                else:
+                    self.last_seen[record.tid] = previous[record.tid]
+        if len(succeeded) < len(changed):
+            _attach_failed_rows(block_name, [record for record in changed if record.tid not in completed])
+        # 归属其他板块的主题写在归属板块下
+        by_owner: Dict[str, List[ThreadRecord]] = {}
+        for record in succeeded:
+            by_owner.setdefault(self.registry.owner(record.tid) or block_name, []).append(record)
+        for owner, records in by_owner.items():
+            _relocate_saved(self.registry, owner, records)
+            write_to_csv(records, owner, self.filename)
+        if len(succeeded) < len(changed):
+            logging.warning(f"{block_name} 有 {len(changed) - len(succeeded)} 个主题爬取失败，下次轮询重试")
+
+    def _update_interval(self, state: BlockState, listed: List[ThreadRecord]) -> None:
+        """
+        用列表页上最近更新的主题估计板块的更新频率，使每次轮询平均发现 target_changes 个更新
+
+        论坛时间按 UTC 解析，因此用本机当地时间的 timegm 作为当前时间
+        """
+        now = calendar.timegm(time.localtime())
+        recent = [record.update_time for record in listed if now - record.update_time <= self.recent_window]
+        if recent:
+            span = max(now - min(recent), self.min_interval)
+            state.rate = len(recent) / span
+            interval = self.target_changes / state.rate
+        else:
+            state.rate = 0.0
+            interval = self.max_interval
+        state.interval = min(max(interval, self.min_interval), self.max_interval)
+
+    def run(self, once: bool = False) -> None:
+        """按各板块的间隔循环轮询，直到收到停止信号；once 时每个板块只轮询一次"""
+        running: Dict[concurrent.futures.Future, BlockState] = {}
+        pending = set(self.states) if once else None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=CONFIG['spider']['thread_pool_size'],
+                                                   thread_name_prefix='watch-block') as executor:
+            while not self.stop_event.is_set():
+                now = time.time()
+                busy = {state.name for state in running.values()}
+                for state in self.states.values():
+                    due = state.next_poll <= now if pending is None else state.name in pending
+                    if state.name not in busy and due:
+                        running[executor.submit(self.poll, state)] = state
+                        if pending is not None:
+                            pending.discard(state.name)
+                if once and not running and not pending:
+                    break
+
+                busy = {state.name for state in running.values()}
+                idle = [state.next_poll for state in self.states.values() if state.name not in busy]
+                timeout = max(0.0, min(idle) - time.time()) if idle and not once else 1.0
+                if running:
+                    # 等待期间也定期检查停止信号
+                    done, _ = concurrent.futures.wait(running, timeout=min(timeout, 1.0),
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(running.pop(future), future)
+                else:
+                    self.stop_event.wait(min(timeout, 60.0))
+
+            for future in concurrent.futures.as_completed(running):
+                self._finish(running[future], future)
+        self._thread_executor.shutdown(wait=True)
+        self._save_state()
+        logging.info("监视已停止")
+        cancel_token.check()
+
+    def _finish(self, state: BlockState, future: concurrent.futures.Future) -> None:
+        state.last_poll = time.time()
+        state.polls += 1
+        try:
+            changed = future.result()
+            state.changed += changed
+        except FatalError:
+            # 致命错误时停止整个监视，已爬取的主题已经写入
+            changed = 0
+            self.stop_event.set()
+        except Exception as e:
+            logging.error(f"轮询 {state.name} 失败: {e}", exc_info=True)
+            changed = 0
+        state.next_poll = state.last_poll + state.interval
+        logging.info(f"{state.name} 下次轮询在 {state.interval / 60:.0f} 分钟后，估计每天更新 "
+                     f"{state.rate * 86400:.1f} 个主题", extra=log_fields(block=state.name, stage='watch'))
+        try:
+            self._save_state()
+        except OSError as e:
+            logging.error(f"保存监视状态失败: {e}")
+
+    def stop(self, *args) -> None:
+        logging.info("收到停止信号，等待正在进行的轮询完成")
+        self.stop_event.set()
+
+
+def watch(blocks: Dict[str, str], download_images: bool = False, once: bool = False,
+          filename: str = 'data.csv') -> Watcher:
+    """
+    启动监视，收到 SIGINT 或 SIGTERM 后完成正在进行的轮询再退出；
+    遇到登录失效等致命错误时同样停止，保存状态后抛出 FatalError
+    """
+    if blocks:
+        preflight(next(iter(blocks.values())))
+    watcher = Watcher(blocks, download_images, CONFIG.get('watch'), filename)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, watcher.stop)
+        signal.signal(signal.SIGTERM, watcher.stop)
+    watcher.run(once)
+    return watcher
+
+
+if __name__ == '__main__':
+    from logsetup import setup_logging
+    setup_logging(init_config())
+    watch(CONFIG['blocks'], once=True)